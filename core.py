@@ -0,0 +1,1333 @@
+# core.py - Núcleo del bot: configuración, registro, trazas, MongoDB, el bot y sus servicios.
+# Este módulo no se recarga: lo que vive aquí (conexiones, cachés, tareas) sobrevive a /recargar.
+# Las consultas están en datos.py y los comandos y el asistente en extensions/ (recargables).
+import os
+import re
+import importlib.util
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+import threading
+import contextvars
+import urllib.request
+import socket
+import asyncio
+import discord
+from discord.ext import commands
+from dotenv import load_dotenv
+import aiohttp
+from pymongo import MongoClient, monitoring, CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+from bson.objectid import ObjectId
+from discord import app_commands
+from functools import partial
+from datetime import datetime, timezone
+
+# --- 1. CARGAR CREDENCIALES ---
+load_dotenv()
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+MONGO_URI = os.getenv("MONGO_URI")
+# Pool, tiempos de espera y compresión del cliente de Mongo (valores por defecto = los de pymongo)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0")) # 0 = sin límite
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "") # Ej: "zstd,snappy,zlib"
+# Rutas de lectura: los listados y autocompletados leen de secundarios (con staleness máximo);
+# las transiciones de estado y las escrituras van al primario con write concern "majority"
+MONGO_SECONDARY_READS = os.getenv("MONGO_SECONDARY_READS", "1") == "1"
+MONGO_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", "90")) # Mínimo admitido por Mongo: 90
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "majority")
+# Cortocircuito: errores de red seguidos que lo abren y espera máxima entre reintentos de conexión
+MONGO_BREAKER_THRESHOLD = int(os.getenv("MONGO_BREAKER_THRESHOLD", "3"))
+MONGO_RETRY_MAX_SECONDS = float(os.getenv("MONGO_RETRY_MAX_SECONDS", "30"))
+# Ventana (en milisegundos) en la que se agrupan los cambios de inventario antes de escribirlos
+INVENTORY_COALESCE_MS = int(os.getenv("INVENTORY_COALESCE_MS", "50"))
+# Días que se conservan los movimientos del inventario antes de compactarlos en checkpoints
+LEDGER_RETENTION_DAYS = int(os.getenv("LEDGER_RETENTION_DAYS", "30"))
+LEDGER_COMPACTION_HOURS = float(os.getenv("LEDGER_COMPACTION_HOURS", "24"))
+# Espera (en segundos) antes de reintentar los movimientos del historial si Mongo no los aceptó
+INVENTORY_LEDGER_RETRY_SECONDS = float(os.getenv("INVENTORY_LEDGER_RETRY_SECONDS", "5"))
+# Segundos que se conservan en caché las listas del catálogo (categorías, tipos, recetas)
+CATALOG_CACHE_SECONDS = float(os.getenv("CATALOG_CACHE_SECONDS", "300"))
+# Archivado de pedidos entregados: antigüedad mínima, tamaño de lote y frecuencia del proceso
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "7"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL_MINUTES = float(os.getenv("ARCHIVE_INTERVAL_MINUTES", "60"))
+# Diario local de pedidos nuevos (SQLite). Vacío = los pedidos se insertan directamente en Mongo.
+# Ventana de agrupación, tamaño de lote y espera antes de reintentar si Mongo no responde
+ORDER_JOURNAL_PATH = os.getenv("ORDER_JOURNAL_PATH", "")
+ORDER_JOURNAL_FLUSH_MS = int(os.getenv("ORDER_JOURNAL_FLUSH_MS", "200"))
+ORDER_JOURNAL_BATCH_SIZE = int(os.getenv("ORDER_JOURNAL_BATCH_SIZE", "500"))
+ORDER_JOURNAL_RETRY_SECONDS = float(os.getenv("ORDER_JOURNAL_RETRY_SECONDS", "5"))
+
+# Registro: nivel general, niveles por módulo ("craftingbot.mongo=DEBUG,discord=WARNING"),
+# fracción de eventos DEBUG que se conservan y archivo de salida (vacío = stderr)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_FILE = os.getenv("LOG_FILE", "")
+# Trazas por interacción: archivo JSONL y/o colector compatible con OTLP/HTTP (vacíos = desactivado).
+# Las interacciones más lentas que TRACE_SLOW_MS se exportan siempre; el resto según TRACE_SAMPLE_RATE.
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+# Diferido automático: si un comando o componente no ha respondido cuando han pasado estos
+# milisegundos desde que Discord creó la interacción, se difiere (Discord exige respuesta en 3 s)
+INTERACTION_DEFER_BUDGET_MS = int(os.getenv("INTERACTION_DEFER_BUDGET_MS", "2000"))
+
+# Perfilado en producción (/perfil): intervalo del muestreo de CPU, duración máxima y
+# profundidad de las pilas que guarda tracemalloc
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+
+# Control de admisión (token bucket) para comandos costosos: "capacidad/fichas_por_segundo"
+# por usuario, por oficio (rol) y global, por comando. Cada comando consume su costo en fichas.
+ADMISSION_USER_BUDGET = os.getenv("ADMISSION_USER_BUDGET", "6/0.2")
+ADMISSION_ROLE_BUDGET = os.getenv("ADMISSION_ROLE_BUDGET", "20/1")
+ADMISSION_GLOBAL_BUDGET = os.getenv("ADMISSION_GLOBAL_BUDGET", "60/5")
+
+# Varios procesos: cada uno atiende un rango de shards del gateway. SHARD_COUNT es el total y
+# SHARD_IDS los de este proceso ("0-3" o "0,2"). Vacíos = un solo proceso y un único shard.
+SHARD_COUNT = os.getenv("SHARD_COUNT", "")
+SHARD_IDS = os.getenv("SHARD_IDS", "")
+# Invalidación de cachés entre procesos: "capped" (colección limitada; sirve sin réplica),
+# "changestream" (además detecta cambios externos en el catálogo; requiere réplica) o vacío = desactivada
+CACHE_INVALIDATION = os.getenv("CACHE_INVALIDATION", "")
+CACHE_INVALIDATION_SIZE_MB = int(os.getenv("CACHE_INVALIDATION_SIZE_MB", "8"))
+
+# Recordatorios de pedidos estancados: horas máximas en PENDIENTE/ASIGNADA ("24/72"; vacío = desactivados),
+# plazos propios por oficio ("Cocina=12/24,Alquimia=48/96"), horas entre recordatorios de un mismo
+# pedido, frecuencia del barrido y pedidos leídos por lote
+REMINDER_SLA_HOURS = os.getenv("REMINDER_SLA_HOURS", "")
+REMINDER_SLA_BY_PROFESSION = os.getenv("REMINDER_SLA_BY_PROFESSION", "")
+REMINDER_REPEAT_HOURS = float(os.getenv("REMINDER_REPEAT_HOURS", "24"))
+REMINDER_INTERVAL_MINUTES = float(os.getenv("REMINDER_INTERVAL_MINUTES", "15"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "200"))
+
+# Asignación automática de pedidos nuevos al artesano del oficio con menos pedidos ASIGNADA ("1" = activa).
+# Límite de pedidos abiertos por artesano (0 = sin límite; si todos lo alcanzan el pedido queda PENDIENTE)
+# y si los Maestros también reciben pedidos
+AUTO_ASSIGN = os.getenv("AUTO_ASSIGN", "") == "1"
+AUTO_ASSIGN_MAX_OPEN = int(os.getenv("AUTO_ASSIGN_MAX_OPEN", "5"))
+AUTO_ASSIGN_MASTERS = os.getenv("AUTO_ASSIGN_MASTERS", "1") == "1"
+
+# Exportación del historial de pedidos (/exportarpedidos): pedidos leídos por lote del cursor y
+# tamaño máximo (comprimido) de cada parte adjunta; al superarlo se empieza una parte nueva
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_PART_MB = float(os.getenv("EXPORT_PART_MB", "8"))
+
+# Migraciones de esquema de los pedidos (ids Int64, estados abreviados): documentos por lote y pausa
+# entre lotes. SCHEMA_COMPAT_READS="auto" deja de buscar el formato anterior cuando terminan las
+# migraciones; "1" lo busca siempre (p. ej. mientras queden procesos con la versión anterior)
+SCHEMA_MIGRATION_BATCH_SIZE = int(os.getenv("SCHEMA_MIGRATION_BATCH_SIZE", "500"))
+SCHEMA_MIGRATION_PAUSE_MS = int(os.getenv("SCHEMA_MIGRATION_PAUSE_MS", "200"))
+SCHEMA_COMPAT_READS = os.getenv("SCHEMA_COMPAT_READS", "auto")
+
+# Multi-servidor: pedidos, inventario e historial llevan guild_id. Los documentos anteriores se
+# asignan por lotes a LEGACY_GUILD_ID al arrancar (vacío = no migrar)
+LEGACY_GUILD_ID = os.getenv("LEGACY_GUILD_ID", "")
+GUILD_MIGRATION_BATCH_SIZE = int(os.getenv("GUILD_MIGRATION_BATCH_SIZE", "1000"))
+
+# Estados de un pedido que aún no ha sido entregado (se consultan con $in, que sí aprovecha los índices)
+ESTADOS_ABIERTOS = ["PENDIENTE", "ASIGNADA", "LISTO PARA RECOGER"]
+
+# --- 1b. REGISTRO ESTRUCTURADO (LOGGING) ---
+# Los registros se encolan en memoria (QueueHandler) y un hilo aparte (QueueListener) los
+# escribe como JSON, así el event loop nunca espera a stdout o al disco.
+_STANDARD_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """Formatea cada registro como una línea JSON, incluyendo los campos pasados en 'extra'."""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # Campos estructurados (command, user, guild, latency_ms, outcome, operation, error...)
+        for field, value in record.__dict__.items():
+            if field not in _STANDARD_RECORD_FIELDS and not field.startswith("_"):
+                payload[field] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class DebugSamplingFilter(logging.Filter):
+    """Conserva solo una fracción de los eventos DEBUG (los de alto volumen); el resto pasa siempre."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+def setup_logging():
+    """Configura el registro raíz con una cola y un hilo escritor. Devuelve el QueueListener."""
+    if LOG_FILE:
+        output_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    else:
+        output_handler = logging.StreamHandler()
+    output_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL.upper())
+
+    for entry in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+        name, _, level = entry.partition("=")
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=True)
+    listener.start()
+    # Vacía la cola al salir (incluye el exit() por fallo de conexión)
+    atexit.register(listener.stop)
+    return listener
+
+log_listener = setup_logging()
+log = logging.getLogger("craftingbot")
+mongo_log = logging.getLogger("craftingbot.mongo")
+command_log = logging.getLogger("craftingbot.commands")
+task_log = logging.getLogger("craftingbot.tasks")
+
+# --- 1c. TRAZAS DE INTERACCIONES ---
+# Cada interacción abre una traza guardada en un contextvar. run_blocking copia el contexto al
+# hilo del executor, así que el listener de comandos de pymongo y el TraceConfig de aiohttp
+# (peticiones a Discord) saben a qué interacción pertenece cada span.
+TRACING_ENABLED = bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    """Spans de una interacción, en formato compatible con OTLP (tiempos en ns desde epoch)."""
+
+    def __init__(self, name, start_ns, attributes):
+        self.trace_id = os.urandom(16).hex()
+        self.root_id = os.urandom(8).hex()
+        self.name = name
+        self.start_ns = start_ns
+        self.attributes = attributes
+        self.spans = []  # list.append es atómico: los hilos del executor pueden agregar spans
+
+    def add_span(self, name, start_ns, end_ns, **attributes):
+        self.spans.append({
+            "traceId": self.trace_id,
+            "spanId": os.urandom(8).hex(),
+            "parentSpanId": self.root_id,
+            "name": name,
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": otlp_attributes(attributes),
+        })
+
+    def to_otlp(self, end_ns):
+        root = {
+            "traceId": self.trace_id,
+            "spanId": self.root_id,
+            "name": self.name,
+            "kind": 2,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": otlp_attributes(self.attributes),
+        }
+        return {"resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": "craftingbot"})},
+            "scopeSpans": [{"scope": {"name": "craftingbot"}, "spans": [root] + self.spans}],
+        }]}
+
+def otlp_attributes(attributes):
+    return [
+        {"key": key, "value": {"intValue": str(value)} if isinstance(value, int) else {"stringValue": str(value)}}
+        for key, value in attributes.items() if value is not None
+    ]
+
+class TraceExporter:
+    """Escribe las trazas terminadas desde un hilo propio, sin bloquear el event loop."""
+
+    def __init__(self, file_path, endpoint):
+        self.file_path = file_path
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces" if endpoint else ""
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, payload):
+        self._queue.put(payload)
+
+    def _run(self):
+        while True:
+            payload = self._queue.get()
+            body = json.dumps(payload, ensure_ascii=False)
+            try:
+                if self.file_path:
+                    with open(self.file_path, "a", encoding="utf-8") as trace_file:
+                        trace_file.write(body + "\n")
+                if self.endpoint:
+                    request = urllib.request.Request(
+                        self.endpoint, data=body.encode("utf-8"), headers={"Content-Type": "application/json"}
+                    )
+                    urllib.request.urlopen(request, timeout=2).close()
+            except Exception as e:
+                logging.getLogger("craftingbot.trace").warning("No se pudo exportar la traza", extra={"error": str(e)})
+
+trace_exporter = TraceExporter(TRACE_FILE, TRACE_OTLP_ENDPOINT) if TRACING_ENABLED else None
+
+def start_trace(interaction: discord.Interaction):
+    """Abre la traza de una interacción; se exporta cuando termina la tarea que la atiende."""
+    if not TRACING_ENABLED or current_trace.get() is not None:
+        return
+    started_ns = time.time_ns()
+    created_ns = int(interaction.created_at.timestamp() * 1_000_000_000)
+    command = interaction.command
+    trace = Trace(
+        f"interaction {command.qualified_name}" if command else f"interaction {interaction.data.get('custom_id', interaction.type.name)}",
+        created_ns,
+        {"interaction.type": interaction.type.name, "user": interaction.user.id, "guild": interaction.guild_id},
+    )
+    # Desde que Discord creó la interacción hasta que el handler empieza a ejecutarse
+    trace.add_span("gateway.dispatch", created_ns, started_ns)
+    current_trace.set(trace)
+
+    task = asyncio.current_task()
+    if task is not None:
+        task.add_done_callback(lambda _: finish_trace(trace))
+
+def finish_trace(trace):
+    end_ns = time.time_ns()
+    duration_ms = (end_ns - trace.start_ns) / 1_000_000
+    if duration_ms >= TRACE_SLOW_MS or random.random() < TRACE_SAMPLE_RATE:
+        trace_exporter.export(trace.to_otlp(end_ns))
+
+def run_blocking(func):
+    """
+    Ejecuta una función síncrona (Mongo) en el pool de hilos, como bot.loop.run_in_executor,
+    pero propagando el contexto de la traza y registrando la espera en cola y la ejecución.
+    Si Mongo no está disponible (circuito abierto) devuelve al instante un futuro fallido con MongoUnavailable.
+    """
+    if not mongo_manager.available:
+        future = bot.loop.create_future()
+        future.set_exception(MongoUnavailable())
+        return future
+    trace = current_trace.get()
+    if trace is None:
+        return bot.loop.run_in_executor(None, func)
+    context = contextvars.copy_context()
+
+    name = getattr(func, "func", func).__name__
+    submitted_ns = time.time_ns()
+
+    def traced():
+        started_ns = time.time_ns()
+        trace.add_span("executor.queue", submitted_ns, started_ns, function=name)
+        try:
+            return context.run(func)
+        finally:
+            trace.add_span(f"executor {name}", started_ns, time.time_ns())
+
+    return bot.loop.run_in_executor(None, traced)
+
+class MongoTraceListener(monitoring.CommandListener):
+    """Registra un span por cada comando enviado a Mongo dentro de una interacción trazada."""
+
+    def __init__(self):
+        self._started = {}  # (request_id, connection_id) -> (traza, inicio_ns, comando, colección)
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is None:
+            return
+        collection = event.command.get(event.command_name)
+        self._started[(event.request_id, event.connection_id)] = (
+            trace, time.time_ns(), event.command_name, collection if isinstance(collection, str) else None
+        )
+
+    def _finish(self, event, outcome):
+        entry = self._started.pop((event.request_id, event.connection_id), None)
+        if entry is None:
+            return
+        trace, start_ns, command_name, collection = entry
+        trace.add_span(
+            f"mongo {command_name}", start_ns, start_ns + event.duration_micros * 1000,
+            collection=collection, outcome=outcome
+        )
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+def discord_route(path):
+    """Normaliza la ruta de una petición a Discord (sin IDs ni tokens de interacción)."""
+    path = re.sub(r"/\d{15,}", "/:id", path)
+    return re.sub(r"/(interactions|webhooks)/:id/[^/]+", r"/\1/:id/:token", path)
+
+async def on_discord_request_start(session, context, params):
+    context.trace = current_trace.get()
+    context.start_ns = time.time_ns()
+
+async def on_discord_request_end(session, context, params):
+    if context.trace is not None:
+        context.trace.add_span(
+            f"discord {params.method} {discord_route(params.url.path)}",
+            context.start_ns, time.time_ns(),
+            status=params.response.status
+        )
+
+async def on_discord_request_exception(session, context, params):
+    if context.trace is not None:
+        context.trace.add_span(
+            f"discord {params.method} {discord_route(params.url.path)}",
+            context.start_ns, time.time_ns(),
+            outcome="error"
+        )
+
+discord_http_trace = aiohttp.TraceConfig()
+discord_http_trace.on_request_start.append(on_discord_request_start)
+discord_http_trace.on_request_end.append(on_discord_request_end)
+discord_http_trace.on_request_exception.append(on_discord_request_exception)
+
+class TracedComponent:
+    """
+    Mixin para componentes y formularios: abre la traza y vigila el plazo de respuesta antes de
+    ejecutar su callback. auto_defer_kwargs son los argumentos de defer() si el plazo se agota
+    (por defecto, diferir actualizando el mensaje del componente); None desactiva el diferido.
+    Con available_offline el componente se ejecuta aunque el circuito de Mongo esté abierto.
+    """
+    auto_defer_kwargs = {}
+    available_offline = False
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        start_trace(interaction)
+        if self.auto_defer_kwargs is not None:
+            watch_response_deadline(interaction, self.auto_defer_kwargs)
+        if not mongo_manager.available and not self.available_offline:
+            # Los pasos del asistente consultan o escriben en Mongo: mejor avisar que esperar
+            await send_mongo_unavailable(interaction)
+            return False
+        return True
+
+# --- 1d. DIFERIDO AUTOMÁTICO DE RESPUESTAS ---
+# Los comandos y componentes consultan Mongo antes de responder, así que responden con
+# respond(interaction) en lugar de interaction.response. watch_response_deadline le pone un plazo:
+# si al agotarse el handler aún no ha respondido, difiere la interacción, y las respuestas que
+# lleguen después se convierten en followup.send / edit_original_response.
+def interaction_metric_name(interaction: discord.Interaction):
+    command = interaction.command
+    if command is not None:
+        return command.qualified_name
+    # Componentes: solo el prefijo del custom_id (el resto es estado del asistente)
+    return ":".join(interaction.data.get("custom_id", interaction.type.name).split(":")[:2])
+
+class DeferralMetrics:
+    """Interacciones vigiladas y diferidas automáticamente, por comando o componente."""
+
+    def __init__(self):
+        self.watched = {}
+        self.deferred = {}
+
+    def record_watched(self, name):
+        self.watched[name] = self.watched.get(name, 0) + 1
+
+    def record_deferred(self, name):
+        self.deferred[name] = self.deferred.get(name, 0) + 1
+        return self.deferred[name], self.watched.get(name, 0)
+
+deferral_metrics = DeferralMetrics()
+
+class InteractionResponder:
+    """
+    Respuesta inicial de una interacción, con el mismo API que interaction.response. Si el plazo la
+    difiere, send_message y edit_message pasan a followup.send / edit_original_response.
+
+    Tras diferir "pensando" en público, el primer followup reemplaza ese mensaje y hereda su
+    visibilidad: un mensaje efímero (un error, un aviso) se publicaría en el canal. En ese caso se
+    borra primero el mensaje "pensando" y el efímero se envía como un followup aparte.
+    """
+
+    def __init__(self, interaction, defer_kwargs=None):
+        self._interaction = interaction
+        self._defer_kwargs = defer_kwargs or {}
+        self.auto_deferred = False
+        self._public_placeholder = False # Mensaje "pensando" público que aún no reemplazó ningún followup
+        self._initial_lock = asyncio.Lock() # Evita que el diferido y la respuesta del handler se crucen
+        self._timer = None
+
+    def is_done(self):
+        return self._interaction.response.is_done()
+
+    def schedule(self, budget_seconds):
+        elapsed = (discord.utils.utcnow() - self._interaction.created_at).total_seconds()
+        delay = min(max(budget_seconds - elapsed, 0), budget_seconds)
+        self._timer = asyncio.get_running_loop().call_later(
+            delay, lambda: asyncio.ensure_future(self._auto_defer())
+        )
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+    async def _auto_defer(self):
+        async with self._initial_lock:
+            if self.is_done():
+                return
+            started_ns = time.time_ns()
+            try:
+                await self._interaction.response.defer(**self._defer_kwargs)
+            except discord.HTTPException as e:
+                command_log.warning("No se pudo diferir la interacción", extra={"error": str(e)})
+                return
+            self.auto_deferred = True
+            self._public_placeholder = self._defer_kwargs.get("thinking", False) and not self._defer_kwargs.get("ephemeral", False)
+
+        name = interaction_metric_name(self._interaction)
+        deferred, watched = deferral_metrics.record_deferred(name)
+        elapsed_ms = round((discord.utils.utcnow() - self._interaction.created_at).total_seconds() * 1000)
+        command_log.info("Respuesta diferida automáticamente", extra={
+            "command": name, "elapsed_ms": elapsed_ms, "deferred": deferred, "watched": watched
+        })
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span("discord.auto_defer", started_ns, time.time_ns(), elapsed_ms=elapsed_ms)
+
+    async def defer(self, **kwargs):
+        async with self._initial_lock:
+            if self.auto_deferred:
+                return None # El plazo ya la difirió
+            return await self._interaction.response.defer(**kwargs)
+
+    async def send_message(self, content=None, **kwargs):
+        async with self._initial_lock:
+            if not self.auto_deferred:
+                return await self._interaction.response.send_message(content, **kwargs)
+        delete_after = kwargs.pop("delete_after", None)
+        if kwargs.get("view") is None:
+            kwargs.pop("view", None)
+        if self._public_placeholder and kwargs.get("ephemeral", False):
+            # Sin el mensaje "pensando", el followup es un mensaje nuevo y respeta ephemeral=True
+            try:
+                await self._interaction.delete_original_response()
+            except discord.HTTPException as e:
+                command_log.warning("No se pudo borrar el mensaje diferido", extra={"error": str(e)})
+        self._public_placeholder = False
+        message = await self._interaction.followup.send(content, wait=True, **kwargs)
+        if delete_after is not None:
+            await message.delete(delay=delete_after)
+        return message
+
+    async def edit_message(self, **kwargs):
+        async with self._initial_lock:
+            if not self.auto_deferred:
+                return await self._interaction.response.edit_message(**kwargs)
+        delete_after = kwargs.pop("delete_after", None)
+        kwargs.pop("suppress_embeds", None)
+        self._public_placeholder = False
+        message = await self._interaction.edit_original_response(**kwargs)
+        if delete_after is not None:
+            await message.delete(delay=delete_after)
+        return message
+
+    async def send_modal(self, modal):
+        async with self._initial_lock:
+            return await self._interaction.response.send_modal(modal)
+
+def respond(interaction: discord.Interaction):
+    """InteractionResponder de la interacción; los handlers responden siempre a través de él."""
+    responder = interaction.extras.get("responder")
+    if responder is None:
+        responder = interaction.extras["responder"] = InteractionResponder(interaction)
+    return responder
+
+def watch_response_deadline(interaction: discord.Interaction, defer_kwargs):
+    """Pone plazo a la respuesta de la interacción: al agotarse, respond(interaction) la difiere."""
+    responder = interaction.extras.get("responder")
+    if responder is not None and responder._timer is not None:
+        return
+    responder = interaction.extras["responder"] = InteractionResponder(interaction, defer_kwargs)
+    deferral_metrics.record_watched(interaction_metric_name(interaction))
+    responder.schedule(INTERACTION_DEFER_BUDGET_MS / 1000)
+
+def stop_response_deadline(interaction: discord.Interaction):
+    responder = interaction.extras.get("responder")
+    if responder is not None:
+        responder.cancel()
+
+# --- 2. CONEXIÓN A MONGODB ---
+# Nombres de error (CommandFailedEvent.failure["errtype"]) que indican que no hay comunicación con el servidor
+MONGO_NETWORK_ERRORS = {"AutoReconnect", "NetworkTimeout", "ConnectionFailure"}
+
+class MongoUnavailable(Exception):
+    """Mongo no está disponible: la operación se rechaza sin esperar al timeout de selección de servidor."""
+
+class MongoConnectionManager(monitoring.CommandListener, monitoring.TopologyListener):
+    """
+    Conexión perezosa a MongoDB con cortocircuito.
+
+    El cliente se crea sin conectar; start() lanza en segundo plano (en paralelo al login del gateway)
+    un ping que se reintenta con espera exponencial hasta que responde. Mientras el circuito está
+    abierto, run_blocking falla al instante con MongoUnavailable. El circuito se abre cuando la
+    topología se queda sin primario o tras MONGO_BREAKER_THRESHOLD errores de red seguidos, y se
+    vuelve a sondear igual que al arrancar.
+    """
+
+    def __init__(self, threshold, retry_max_seconds):
+        self.threshold = threshold
+        self.retry_max_seconds = retry_max_seconds
+        self.available = False # Abierto hasta el primer ping correcto
+        self.connected_once = False # Ya se ejecutó on_connect (las extensiones recargadas no lo repiten)
+        self._failures = 0
+        self._loop = None
+        self._probe_task = None
+        self._wake = None
+        self._on_connect = None
+
+    def start(self, loop, on_connect=None):
+        """Empieza a conectar; on_connect (corrutina) se ejecuta una vez, tras la primera conexión."""
+        self._loop = loop
+        self._wake = asyncio.Event()
+        self._on_connect = on_connect
+        self._probe_task = loop.create_task(self._probe())
+
+    async def _probe(self):
+        delay = 1.0
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                # Directo al pool de hilos: el sondeo no pasa por el cortocircuito
+                await self._loop.run_in_executor(None, partial(client.admin.command, "ping"))
+                break
+            except Exception as e:
+                mongo_log.warning("MongoDB no disponible, reintentando", extra={
+                    "attempt": attempt, "retry_in": round(delay, 1), "error": str(e)
+                })
+            # Espera con jitter; si el driver detecta antes un primario, se reintenta en ese momento
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay * random.uniform(0.5, 1.0))
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, self.retry_max_seconds)
+
+        self._failures = 0
+        self.available = True
+        mongo_log.info("Conexión a MongoDB disponible", extra={"attempt": attempt})
+        self.connected_once = True
+        on_connect, self._on_connect = self._on_connect, None
+        if on_connect is not None:
+            await on_connect()
+
+    def _trip(self, reason):
+        if not self.available:
+            return
+        self.available = False
+        mongo_log.warning("Cortocircuito de MongoDB abierto", extra={"reason": reason})
+        self._probe_task = self._loop.create_task(self._probe())
+
+    def _record_failure(self, error):
+        self._failures += 1
+        if self._failures >= self.threshold:
+            self._trip(error)
+
+    def _wake_probe(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def _from_driver(self, callback, *args):
+        # Los eventos llegan en hilos de pymongo: el estado solo se modifica desde el loop
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    # --- Eventos de comandos ---
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._failures = 0
+
+    def failed(self, event):
+        failure = event.failure if isinstance(event.failure, dict) else {}
+        if failure.get("errtype") in MONGO_NETWORK_ERRORS:
+            self._from_driver(self._record_failure, failure.get("errmsg"))
+
+    # --- Eventos de topología ---
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        had_primary = event.previous_description.has_writable_server()
+        has_primary = event.new_description.has_writable_server()
+        if had_primary and not has_primary:
+            self._from_driver(self._trip, "sin servidor primario")
+        elif has_primary and not had_primary:
+            self._from_driver(self._wake_probe)
+
+    def closed(self, event):
+        pass
+
+mongo_manager = MongoConnectionManager(MONGO_BREAKER_THRESHOLD, MONGO_RETRY_MAX_SECONDS)
+
+def mongo_client_options():
+    """Opciones del MongoClient a partir de la configuración (pool, tiempos, compresión)."""
+    tuning = {
+        "MONGO_MAX_POOL_SIZE": ("maxPoolSize", MONGO_MAX_POOL_SIZE),
+        "MONGO_MIN_POOL_SIZE": ("minPoolSize", MONGO_MIN_POOL_SIZE),
+        "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", MONGO_SERVER_SELECTION_TIMEOUT_MS),
+        "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", MONGO_CONNECT_TIMEOUT_MS),
+        "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", MONGO_SOCKET_TIMEOUT_MS or None),
+        "MONGO_COMPRESSORS": ("compressors", MONGO_COMPRESSORS),
+    }
+    # Los argumentos de MongoClient pisan los de la URI: solo se pasan las variables definidas
+    options = {option: value for env_name, (option, value) in tuning.items() if os.getenv(env_name)}
+    options["event_listeners"] = [mongo_manager] + ([MongoTraceListener()] if TRACING_ENABLED else [])
+    options["connect"] = False # La conexión se abre en segundo plano al arrancar el bot (mongo_manager)
+    return options
+
+# Escrituras y transiciones: primario + write concern configurado ("majority" por defecto)
+WRITE_CONCERN = WriteConcern(int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN)
+# Listados y autocompletados: secundarios si están disponibles, con un retraso máximo acotado
+LISTING_READ_PREFERENCE = (
+    SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_SECONDS) if MONGO_SECONDARY_READS else Primary()
+)
+
+# Colección limitada del canal de invalidaciones de caché (ver CacheInvalidationBus)
+INVALIDATION_COLLECTION = "cache_invalidaciones"
+
+try:
+    client = MongoClient(MONGO_URI, **mongo_client_options())
+    db = client.get_database("CraftingBotDB", read_preference=Primary(), write_concern=WRITE_CONCERN)
+    
+    # Referencias globales de colecciones
+    usuarios_col = db["Usuario"]
+    # El catálogo de recetas solo se lee: todas sus consultas pueden ir a secundarios
+    items_col = db.get_collection("Item", read_preference=LISTING_READ_PREFERENCE)
+    pedidos_col = db["Pedido"]
+    pedidos_archivo_col = db["PedidoArchivo"] # Pedidos ENTREGADOS antiguos (fuera del conjunto de trabajo)
+    inventario_col = db["inventario"] # <-- ¡ASEGÚRATE DE QUE EXISTA ESTA LÍNEA!
+    # Historial de movimientos del inventario (solo se agregan documentos) y sus compactaciones
+    inventario_movimientos_col = db["inventario_movimientos"]
+    inventario_checkpoints_col = db["inventario_checkpoints"]
+    # Artesanos que pausaron la asignación automática
+    preferencias_asignacion_col = db["PreferenciaAsignacion"]
+    # Progreso de las migraciones de esquema (una entrada por migración y colección)
+    migraciones_col = db["migraciones"]
+    # Avisos de invalidación de cachés entre procesos
+    invalidaciones_col = db[INVALIDATION_COLLECTION]
+
+    # Vistas de solo lectura para los listados (/verpedidos, /mispedidos, /verinventario, autocompletado)
+    pedidos_lectura_col = pedidos_col.with_options(read_preference=LISTING_READ_PREFERENCE)
+    pedidos_archivo_lectura_col = pedidos_archivo_col.with_options(read_preference=LISTING_READ_PREFERENCE)
+    inventario_lectura_col = inventario_col.with_options(read_preference=LISTING_READ_PREFERENCE)
+    inventario_movimientos_lectura_col = inventario_movimientos_col.with_options(read_preference=LISTING_READ_PREFERENCE)
+    
+    log.info("Cliente de MongoDB configurado. La conexión se establece al arrancar el bot.")
+    
+except Exception as e:
+    # Solo falla aquí una configuración inválida (URI u opciones): el servidor aún no se ha contactado
+    log.critical("Configuración de MongoDB inválida. Revisa tu MONGO_URI.", extra={"error": str(e)})
+    exit()
+
+# --- 2b. INVALIDACIÓN DE CACHÉS ENTRE PROCESOS ---
+class CacheInvalidationBus:
+    """
+    Canal de invalidaciones entre procesos del bot. publish() inserta un aviso {cache, key, origin}
+    en una colección limitada; cada proceso la sigue desde un hilo propio (cursor tailable o change
+    stream) y ejecuta en el loop el manejador suscrito a esa caché. Los avisos propios se ignoran:
+    quien publica ya invalidó su copia local.
+
+    Desde fuera del bot (por ejemplo, un script que importa recetas) basta con insertar
+    {"cache": "catalog"} en la colección para que todos los procesos recarguen el catálogo.
+    """
+
+    def __init__(self, mode, size_mb):
+        self.mode = mode
+        self.size_mb = size_mb
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = {}  # nombre de caché -> función(key)
+        self._loop = None
+        self._stop = threading.Event()
+        self._last_id = None       # Último aviso leído (cursor tailable)
+        self._resume_token = None  # Posición del change stream
+
+    @property
+    def enabled(self):
+        return self.mode in ("capped", "changestream")
+
+    def subscribe(self, cache, handler):
+        self._handlers[cache] = handler
+
+    def start(self, loop):
+        if not self.enabled:
+            return
+        self._loop = loop
+        threading.Thread(target=self._run, name="cache-invalidation", daemon=True).start()
+
+    async def publish(self, cache, key=None):
+        """Avisa al resto de procesos. Si Mongo no está disponible el aviso se pierde (se registra)."""
+        if not self.enabled:
+            return
+        doc = {"cache": cache, "key": key, "origin": self.origin, "timestamp": datetime.now(timezone.utc)}
+        try:
+            result = await run_blocking(partial(publish_cache_invalidation, doc))
+        except MongoUnavailable:
+            result = "ERROR"
+        if result != "SUCCESS":
+            mongo_log.warning("Aviso de invalidación no publicado", extra={"cache": cache, "key": key})
+
+    def _deliver(self, doc):
+        if doc.get("origin") == self.origin:
+            return
+        handler = self._handlers.get(doc.get("cache"))
+        if handler is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(handler, doc.get("key"))
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                ensure_invalidation_channel(self.size_mb)
+                if self.mode == "changestream":
+                    self._follow_change_stream()
+                else:
+                    self._tail_capped()
+                delay = 1.0
+            except PyMongoError as e:
+                mongo_log.warning("Canal de invalidaciones interrumpido, reintentando", extra={
+                    "mode": self.mode, "retry_in": delay, "error": str(e)
+                })
+                self._stop.wait(delay)
+                delay = min(delay * 2, MONGO_RETRY_MAX_SECONDS)
+
+    def _tail_capped(self):
+        if self._last_id is None:
+            # Al arrancar no se reprocesa el historial: se empieza por el aviso más reciente
+            last = invalidaciones_col.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+            self._last_id = last["_id"] if last else ObjectId.from_datetime(datetime.now(timezone.utc))
+        cursor = invalidaciones_col.find(
+            {"_id": {"$gt": self._last_id}}, cursor_type=CursorType.TAILABLE_AWAIT
+        ).max_await_time_ms(1000)
+        while cursor.alive and not self._stop.is_set():
+            for doc in cursor:
+                self._last_id = doc["_id"]
+                self._deliver(doc)
+        if not self._stop.is_set():
+            self._stop.wait(1) # El cursor muere si la colección está vacía: se vuelve a abrir
+
+    def _follow_change_stream(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": [INVALIDATION_COLLECTION, items_col.name]},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        with db.watch(pipeline, resume_after=self._resume_token, max_await_time_ms=1000) as stream:
+            while stream.alive and not self._stop.is_set():
+                change = stream.try_next()
+                self._resume_token = stream.resume_token
+                if change is None:
+                    continue
+                if change["ns"]["coll"] == INVALIDATION_COLLECTION:
+                    self._deliver(change.get("fullDocument") or {})
+                else:
+                    # Cambio en el catálogo hecho por cualquiera (bot o script): todos recargan
+                    self._deliver({"cache": "catalog"})
+
+def ensure_invalidation_channel(size_mb):
+    """Crea la colección limitada del canal de invalidaciones si aún no existe."""
+    try:
+        db.create_collection(INVALIDATION_COLLECTION, capped=True, size=size_mb * 1024 * 1024)
+    except CollectionInvalid:
+        pass # Ya existe
+
+def publish_cache_invalidation(doc):
+    try:
+        invalidaciones_col.insert_one(doc)
+        return "SUCCESS"
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "publish_cache_invalidation", "error": str(e)})
+        return "ERROR"
+
+cache_bus = CacheInvalidationBus(CACHE_INVALIDATION, CACHE_INVALIDATION_SIZE_MB)
+
+# --- 3. CONFIGURACIÓN INICIAL DEL BOT ---
+intents = discord.Intents.default()
+intents.members = True
+intents.message_content = True 
+
+def parse_shard_ids(value):
+    """Convierte "0-3" o "0,2,5" en una lista de IDs de shard (vacío = None)."""
+    shard_ids = []
+    for part in filter(None, (part.strip() for part in value.split(","))):
+        if "-" in part:
+            start, end = part.split("-", 1)
+            shard_ids.extend(range(int(start), int(end) + 1))
+        else:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids)) or None
+
+try:
+    shard_ids = parse_shard_ids(SHARD_IDS)
+    shard_count = int(SHARD_COUNT) if SHARD_COUNT else None
+except ValueError as e:
+    log.critical("SHARD_IDS/SHARD_COUNT inválidos.", extra={"error": str(e)})
+    exit()
+if shard_ids and shard_count is None:
+    log.critical("SHARD_IDS requiere SHARD_COUNT (el total de shards de todos los procesos).")
+    exit()
+
+bot_options = {
+    "command_prefix": '!',
+    "intents": intents,
+    "http_trace": discord_http_trace if TRACING_ENABLED else None,
+}
+if shard_count is not None:
+    # Un proceso por rango de shards; sin SHARD_IDS este proceso abre todos los shards
+    bot = commands.AutoShardedBot(shard_count=shard_count, shard_ids=shard_ids, **bot_options)
+else:
+    bot = commands.Bot(**bot_options)
+
+# Las tareas globales (sincronizar comandos, archivar, compactar, migrar) solo las hace el proceso
+# que atiende el shard 0, para no repetirlas en cada proceso
+IS_PRIMARY_PROCESS = shard_ids is None or 0 in shard_ids
+
+async def trace_interaction_check(interaction: discord.Interaction):
+    # Se ejecuta en la tarea de cada comando/autocompletado: ahí nace su traza
+    start_trace(interaction)
+    if interaction.type == discord.InteractionType.application_command:
+        # Si el comando tarda, se difiere "pensando"; extras["ephemeral_response"] indica si su respuesta
+        # normal es pública, para que el mensaje diferido tenga la misma visibilidad
+        watch_response_deadline(interaction, {
+            "thinking": True, "ephemeral": interaction.command.extras.get("ephemeral_response", True)
+        })
+    return True
+
+bot.tree.interaction_check = trace_interaction_check
+
+# --- 3b. SERVICIOS COMPARTIDOS Y EXTENSIONES ---
+class ServiceContainer:
+    """
+    Objetos de larga vida que crean los módulos recargables (cachés, colas de escritura, el diario
+    de pedidos, el perfilador). get() solo llama a la fábrica la primera vez: al recargar un módulo,
+    recibe la instancia existente con su estado en lugar de construir otra.
+    """
+
+    def __init__(self):
+        self._services = {}
+
+    def get(self, name, factory):
+        if name not in self._services:
+            self._services[name] = factory()
+        return self._services[name]
+
+    def names(self):
+        return sorted(self._services)
+
+services = ServiceContainer()
+
+# Extensiones de discord.py, en orden de carga. datos.py no es una extensión (no registra nada
+# en el bot): /recargar lo recarga primero para que las extensiones importen su versión nueva.
+DATA_MODULES = ["datos"]
+EXTENSIONS = ["extensions.asistente", "extensions.pedidos", "extensions.inventario", "extensions.exportar", "extensions.admin"]
+
+# Duraciones del arranque en frío (ms), para compararlas con las de /recargar
+startup_times = {}
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+async def reload_code():
+    """
+    Recarga datos.py y todas las extensiones sin tocar el gateway ni Mongo. Retorna {módulo: ms}.
+    Si una extensión falla, discord.py deja cargada su versión anterior y la excepción se propaga.
+    """
+    timings = {}
+    for name in DATA_MODULES:
+        started = time.perf_counter()
+        # Se compila antes: un error de sintaxis no deja el módulo recargado a medias
+        spec = importlib.util.find_spec(name)
+        compile(spec.loader.get_source(name), spec.origin, "exec")
+        importlib.reload(sys.modules[name])
+        timings[name] = elapsed_ms(started)
+    for extension in EXTENSIONS:
+        started = time.perf_counter()
+        await bot.reload_extension(extension)
+        timings[extension] = elapsed_ms(started)
+    return timings
+
+# ==============================================================================
+# SECCIÓN 5: EVENTOS DE DISCORD
+# ==============================================================================
+
+@bot.event
+async def setup_hook():
+    # Se ejecuta una sola vez al iniciar (a diferencia de on_ready, que se repite al reconectar).
+    started = time.perf_counter()
+    for extension in EXTENSIONS:
+        await bot.load_extension(extension)
+    startup_times["extensions_ms"] = elapsed_ms(started)
+    # Mongo conecta en segundo plano: el login del gateway no espera a la base de datos
+    mongo_manager.start(bot.loop, on_connect=on_mongo_connected)
+    cache_bus.start(bot.loop)
+
+async def on_mongo_connected():
+    # Primera conexión a Mongo: cada extensión prepara lo suyo (índices, migraciones, tareas periódicas)
+    bot.dispatch("mongo_connected")
+
+
+def interaction_log_fields(interaction: discord.Interaction, outcome):
+    """Campos estructurados de un comando: nombre, usuario, servidor, latencia y resultado."""
+    command = interaction.command
+    responder = interaction.extras.get("responder")
+    return {
+        "command": command.qualified_name if command else None,
+        "user": interaction.user.id,
+        "guild": interaction.guild_id,
+        "latency_ms": round((discord.utils.utcnow() - interaction.created_at).total_seconds() * 1000),
+        "outcome": outcome,
+        "auto_deferred": responder is not None and responder.auto_deferred,
+    }
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    stop_response_deadline(interaction)
+    command_log.info("Comando completado", extra=interaction_log_fields(interaction, "ok"))
+
+async def send_mongo_unavailable(interaction: discord.Interaction):
+    if interaction.type == discord.InteractionType.autocomplete:
+        await interaction.response.autocomplete([])
+        return
+    message = "🔌 La base de datos no está disponible en este momento. Inténtalo de nuevo en unos minutos."
+    responder = respond(interaction)
+    if responder.is_done() and not responder.auto_deferred:
+        await interaction.followup.send(message, ephemeral=True)
+    else:
+        await responder.send_message(message, ephemeral=True)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    # discord.py lo llama siempre, después del @comando.error de cada comando (que solo responde a la falta de rol)
+    stop_response_deadline(interaction)
+    if isinstance(getattr(error, "original", error), MongoUnavailable):
+        command_log.warning("Comando rechazado: MongoDB no disponible", extra=interaction_log_fields(interaction, "unavailable"))
+        await send_mongo_unavailable(interaction)
+        return
+    if isinstance(error, AdmissionDenied):
+        command_log.info("Comando rechazado por presupuesto", extra={
+            **interaction_log_fields(interaction, "throttled"), "scope": error.scope, "retry_after": round(error.retry_after, 1)
+        })
+        await send_admission_denied(interaction, error)
+        return
+    fields = interaction_log_fields(interaction, "denied" if isinstance(error, app_commands.CheckFailure) else "error")
+    command_log.error("Error en comando", extra=fields, exc_info=error if fields["outcome"] == "error" else None)
+
+@bot.event
+async def on_ready():
+    log.info("Bot conectado a Discord", extra={
+        "bot_user": str(bot.user), "shard_ids": bot.shard_ids if shard_count is not None else None,
+        "shard_count": bot.shard_count, "guilds": len(bot.guilds),
+    })
+    if "started" in startup_times and "ready_ms" not in startup_times:
+        startup_times["ready_ms"] = elapsed_ms(startup_times["started"])
+        log.info("Arranque en frío completado", extra={
+            key: startup_times.get(key) for key in ("import_ms", "extensions_ms", "ready_ms")
+        })
+    if not IS_PRIMARY_PROCESS:
+        return # Los comandos son globales: basta con que los sincronice un proceso
+    try:
+        synced = await bot.tree.sync()
+        log.info("Comandos sincronizados", extra={"count": len(synced)})
+    except Exception as e:
+        log.error("Error al sincronizar comandos", extra={"error": str(e)})
+
+
+# ==============================================================================
+# SECCIÓN 7: PERMISOS Y CONTROL DE ADMISIÓN (COMPARTIDOS POR LOS COMANDOS)
+# ==============================================================================
+
+# --- CONFIGURACIÓN DE ROLES DE GESTIÓN ---
+MANAGEMENT_ROLES = [
+    "Sastre Maestro", "Peletero Maestro", "Herrero Maestro", "Armero Maestro", "Alquimista Maestro", "Cocinero Maestro", "Joyero Maestro",
+    "Sastre", "Peletero", "Herrero", "Armero", "Alquimista", "Cocinero", "Joyero"
+]
+
+# --- OFICIOS POR ROL ---
+# Rol base (Subdito) -> oficio(s) en BD. El rol de Maestro es el mismo nombre + " Maestro".
+# 🛠️ HERRERO: Múltiples Oficios (Valor = list)
+PROFESSION_ROLES = {
+    "Peletero": "Peletería",
+    "Sastre": "Sastrería",
+    "Alquimista": "Alquimia",
+    "Cocinero": "Cocina",
+    "Joyero": "Joyería",
+    "Herrero": ["Forja de armas", "Forja de armaduras"],
+}
+
+MAESTRO_SUFFIX = " Maestro"
+
+def get_profession_from_role(role_name):
+    """
+    Traduce el Rol de Discord al nombre del oficio en BD.
+    Si el rol es Herrero, devuelve una LISTA de oficios (Armas y Armaduras).
+    """
+    base_role = role_name[:-len(MAESTRO_SUFFIX)] if role_name.endswith(MAESTRO_SUFFIX) else role_name
+    return PROFESSION_ROLES.get(base_role)
+
+def get_role_from_profession(oficio):
+    """Rol base (Subdito) que trabaja un oficio de la BD (ej. "Forja de armas" -> "Herrero")."""
+    for base_role, profession in PROFESSION_ROLES.items():
+        if oficio == profession or (isinstance(profession, list) and oficio in profession):
+            return base_role
+    return None
+
+class MemberContext:
+    """Permisos resueltos de un miembro: su oficio, su rol base y si es Maestro."""
+    __slots__ = ("profession", "base_role", "is_maestro", "is_manager")
+
+    def __init__(self, profession=None, base_role=None, is_maestro=False, is_manager=False):
+        self.profession = profession   # str o list (Herrero), igual que get_profession_from_role
+        self.base_role = base_role     # Rol de Subdito del oficio (ej. "Sastre")
+        self.is_maestro = is_maestro
+        self.is_manager = is_manager   # Tiene algún rol de MANAGEMENT_ROLES
+
+class PermissionResolver:
+    """
+    Resuelve oficio y permisos de los miembros a partir de sus roles.
+    Por servidor precompila la tabla role_id -> (rol_base, oficio, es_maestro) y
+    guarda el contexto de cada miembro junto con su conjunto de roles, de modo que
+    cada comando resuelve permisos con una búsqueda en diccionario. Los eventos de
+    roles y miembros invalidan las entradas afectadas.
+    """
+
+    def __init__(self):
+        self._role_tables = {}   # guild_id -> {role_id: (rol_base, oficio, es_maestro)}
+        self._members = {}       # (guild_id, member_id) -> (frozenset(role_ids), MemberContext)
+
+    def _role_table(self, guild):
+        table = self._role_tables.get(guild.id)
+        if table is None:
+            table = {}
+            for role in guild.roles:
+                if role.name not in MANAGEMENT_ROLES:
+                    continue
+                is_maestro = role.name.endswith(MAESTRO_SUFFIX)
+                base_role = role.name[:-len(MAESTRO_SUFFIX)] if is_maestro else role.name
+                table[role.id] = (base_role, get_profession_from_role(role.name), is_maestro)
+            self._role_tables[guild.id] = table
+        return table
+
+    def resolve(self, member):
+        """Devuelve el MemberContext del miembro (desde la caché si sus roles no cambiaron)."""
+        guild = getattr(member, "guild", None)
+        if guild is None:
+            return MemberContext() # Interacción fuera de un servidor: sin permisos de oficio
+
+        role_ids = frozenset(role.id for role in member.roles)
+        key = (guild.id, member.id)
+        cached = self._members.get(key)
+        if cached and cached[0] == role_ids:
+            return cached[1]
+
+        table = self._role_table(guild)
+        context = MemberContext()
+        for role in member.roles:
+            entry = table.get(role.id)
+            if not entry:
+                continue
+            base_role, profession, is_maestro = entry
+            context.is_manager = True
+            context.is_maestro = context.is_maestro or is_maestro
+            # El primer rol con oficio mapeado define el oficio del miembro
+            if context.profession is None and profession:
+                context.profession = profession
+                context.base_role = base_role
+
+        self._members[key] = (role_ids, context)
+        return context
+
+    def profession_role_ids(self, guild, base_role, include_masters=True):
+        """IDs de los roles Subdito y Maestro de un oficio (ej. "Herrero" y "Herrero Maestro")."""
+        return [
+            role_id for role_id, (role_base, _, is_maestro) in self._role_table(guild).items()
+            if role_base == base_role and (include_masters or not is_maestro)
+        ]
+
+    def master_role_ids(self, guild, oficio):
+        """IDs de los roles Maestro que gestionan un oficio de la BD (ej. "Forja de armas" -> "Herrero Maestro")."""
+        return [
+            role_id for role_id, (_, profession, is_maestro) in self._role_table(guild).items()
+            if is_maestro and profession is not None
+            and (oficio in profession if isinstance(profession, list) else oficio == profession)
+        ]
+
+    def invalidate_member(self, guild_id, member_id):
+        self._members.pop((guild_id, member_id), None)
+
+    def invalidate_guild(self, guild_id):
+        self._role_tables.pop(guild_id, None)
+        for key in [key for key in self._members if key[0] == guild_id]:
+            del self._members[key]
+
+permission_resolver = PermissionResolver()
+# Cada servidor lo atiende un solo shard, pero tras repartir los shards de otra forma un proceso
+# puede conservar la tabla de roles de un servidor que ya no recibe eventos: los cambios de roles
+# se avisan a todos. Las entradas por miembro no hace falta avisarlas: se validan con sus roles.
+cache_bus.subscribe("guild_roles", permission_resolver.invalidate_guild)
+
+async def invalidate_guild_roles(guild_id):
+    permission_resolver.invalidate_guild(guild_id)
+    await cache_bus.publish("guild_roles", guild_id)
+
+@bot.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        permission_resolver.invalidate_member(after.guild.id, after.id)
+
+@bot.event
+async def on_member_remove(member):
+    permission_resolver.invalidate_member(member.guild.id, member.id)
+
+@bot.event
+async def on_guild_role_create(role):
+    await invalidate_guild_roles(role.guild.id)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    await invalidate_guild_roles(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    await invalidate_guild_roles(role.guild.id)
+
+# --- CONTROL DE ADMISIÓN ---
+def parse_budget(value):
+    """Convierte "capacidad/fichas_por_segundo" en (capacidad, ritmo)."""
+    capacity, _, rate = value.partition("/")
+    return float(capacity), float(rate)
+
+class TokenBucket:
+    """Cubeta de fichas: se rellena a 'rate' fichas por segundo hasta 'capacity'."""
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost):
+        """Segundos hasta tener 'cost' fichas (0 si ya las tiene)."""
+        if self.tokens >= cost:
+            return 0.0
+        if self.rate <= 0 or cost > self.capacity:
+            return float("inf")
+        return (cost - self.tokens) / self.rate
+
+class AdmissionDenied(app_commands.CheckFailure):
+    """El comando superó su presupuesto; retry_after indica cuántos segundos esperar."""
+
+    def __init__(self, retry_after, scope):
+        super().__init__(f"Presupuesto agotado ({scope}), reintenta en {retry_after:.0f}s")
+        self.retry_after = retry_after
+        self.scope = scope
+
+class AdmissionController:
+    """
+    Presupuestos por usuario, por oficio y global para cada comando. Un comando solo se
+    admite si las tres cubetas tienen fichas suficientes; si alguna no, no se consume nada.
+    """
+
+    MAX_BUCKETS = 10000
+
+    def __init__(self, user_budget, role_budget, global_budget):
+        self.budgets = {"user": user_budget, "role": role_budget, "global": global_budget}
+        self._buckets = {}  # (ámbito, clave, comando) -> TokenBucket
+
+    def _bucket(self, scope, key, command_name):
+        bucket = self._buckets.get((scope, key, command_name))
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_BUCKETS:
+                self._prune()
+            bucket = self._buckets[(scope, key, command_name)] = TokenBucket(*self.budgets[scope])
+        return bucket
+
+    def _prune(self):
+        # Una cubeta llena equivale a una nueva: se puede descartar sin perder estado
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
+
+    def acquire(self, command_name, user_id, role_key, cost):
+        """Consume 'cost' fichas o lanza AdmissionDenied con el tiempo de espera."""
+        now = time.monotonic()
+        buckets = {
+            "user": self._bucket("user", user_id, command_name),
+            "role": self._bucket("role", role_key, command_name),
+            "global": self._bucket("global", None, command_name),
+        }
+        waits = {}
+        for scope, bucket in buckets.items():
+            bucket.refill(now)
+            waits[scope] = bucket.wait_time(cost)
+
+        scope = max(waits, key=waits.get)
+        if waits[scope] > 0:
+            raise AdmissionDenied(waits[scope], scope)
+
+        for bucket in buckets.values():
+            bucket.tokens -= cost
+
+admission_controller = AdmissionController(
+    parse_budget(ADMISSION_USER_BUDGET),
+    parse_budget(ADMISSION_ROLE_BUDGET),
+    parse_budget(ADMISSION_GLOBAL_BUDGET),
+)
+
+def admission_control(cost=1):
+    """Check de app_commands: aplica los presupuestos del comando con el costo indicado."""
+    def predicate(interaction: discord.Interaction):
+        # El presupuesto de oficio es por servidor: un oficio con mucha actividad en un servidor no frena a los demás
+        role_key = (interaction.guild_id, permission_resolver.resolve(interaction.user).base_role or "sin_oficio")
+        admission_controller.acquire(interaction.command.qualified_name, interaction.user.id, role_key, cost)
+        return True
+    return app_commands.check(predicate)
+
+async def send_admission_denied(interaction: discord.Interaction, error: AdmissionDenied):
+    retry_after = error.retry_after
+    if retry_after == float("inf"):
+        message = "⏳ Este comando no está disponible en este momento. Inténtalo más tarde."
+    else:
+        message = f"⏳ Demasiadas solicitudes. Inténtalo de nuevo en **{max(1, round(retry_after))}** segundos."
+    await respond(interaction).send_message(message, ephemeral=True)
+
+# --- 8. INICIAR EL BOT ---
+def run(started):
+    """Arranca el bot y bloquea hasta que se detiene. 'started' es el perf_counter del inicio del proceso."""
+    startup_times["started"] = started
+    startup_times["import_ms"] = elapsed_ms(started)
+    if DISCORD_TOKEN:
+        # log_handler=None: los registros de discord.py también pasan por nuestra cola JSON
+        bot.run(DISCORD_TOKEN, log_handler=None)
+    else:
+        log.critical("El token de Discord no fue encontrado. Revisa el archivo .env.")
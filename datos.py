@@ -0,0 +1,1749 @@
+# datos.py - Consultas a MongoDB (síncronas, se ejecutan en hilos con run_blocking) y los
+# objetos con estado que las usan (caché del catálogo, agrupador del inventario, diario de pedidos).
+# /recargar vuelve a ejecutar este módulo: las instancias con estado se piden a services para
+# conservar las existentes.
+import io
+import os
+import re
+import csv
+import gzip
+import json
+import time
+import heapq
+import itertools
+import random
+import hashlib
+import sqlite3
+import asyncio
+import threading
+import discord
+from discord import SelectOption
+from pymongo import UpdateOne, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, PyMongoError, WriteConcernError
+from bson import json_util
+from bson.int64 import Int64
+from bson.objectid import ObjectId
+from functools import partial
+from datetime import datetime, timedelta, timezone
+
+from core import (
+    CATALOG_CACHE_SECONDS, ESTADOS_ABIERTOS, INVENTORY_COALESCE_MS, INVENTORY_LEDGER_RETRY_SECONDS,
+    ORDER_JOURNAL_BATCH_SIZE, ORDER_JOURNAL_FLUSH_MS, ORDER_JOURNAL_PATH, ORDER_JOURNAL_RETRY_SECONDS,
+    REMINDER_REPEAT_HOURS, REMINDER_SLA_BY_PROFESSION, REMINDER_SLA_HOURS, AUTO_ASSIGN_MASTERS, AUTO_ASSIGN_MAX_OPEN,
+    SCHEMA_COMPAT_READS,
+    MongoUnavailable, bot, cache_bus, command_log, get_role_from_profession, mongo_log, permission_resolver, run_blocking, services,
+    items_col, pedidos_col, pedidos_archivo_col, inventario_col, inventario_movimientos_col, inventario_checkpoints_col,
+    preferencias_asignacion_col, migraciones_col,
+    pedidos_lectura_col, pedidos_archivo_lectura_col, inventario_lectura_col, inventario_movimientos_lectura_col,
+)
+
+# ==============================================================================
+# SECCIÓN 4: FUNCIONES SÍNCRONAS PARA MONGO (EJECUTADAS EN HILOS)
+# ==============================================================================
+# Índices anteriores a guild_id (colección, nombres) que se eliminan al crear los nuevos
+LEGACY_INDEXES = [
+    (inventario_movimientos_col, ["name_1_timestamp_1"]),
+    (inventario_checkpoints_col, ["name_1_timestamp_1"]),
+    (pedidos_col, [
+        "solicitante_id_1_fecha_solicitud_-1",
+        "oficio_requerido_1_estatus_1_fecha_solicitud_-1",
+        "asignado_a_id_1_estatus_1_fecha_solicitud_-1",
+    ]),
+    (pedidos_archivo_col, ["solicitante_id_1_fecha_solicitud_-1"]),
+]
+
+def ensure_indexes():
+    """Crea los índices que usan las consultas del bot (idempotente, se ejecuta al arrancar)."""
+    try:
+        # Todas las consultas van acotadas a un servidor: los índices empiezan por guild_id
+        inventario_col.create_index([("guild_id", ASCENDING), ("name", ASCENDING)], unique=True)
+        inventario_movimientos_col.create_index([("guild_id", ASCENDING), ("name", ASCENDING), ("timestamp", ASCENDING)])
+        inventario_checkpoints_col.create_index([("guild_id", ASCENDING), ("name", ASCENDING), ("timestamp", ASCENDING)])
+
+        # Pedidos: listados por solicitante, por oficio y por artesano, y el barrido del archivado
+        pedidos_col.create_index([("guild_id", ASCENDING), ("solicitante_id", ASCENDING), ("fecha_solicitud", DESCENDING)])
+        pedidos_col.create_index([("guild_id", ASCENDING), ("oficio_requerido", ASCENDING), ("estatus", ASCENDING), ("fecha_solicitud", DESCENDING)])
+        pedidos_col.create_index([("guild_id", ASCENDING), ("asignado_a_id", ASCENDING), ("estatus", ASCENDING), ("fecha_solicitud", DESCENDING)])
+        # El archivado recorre todos los servidores a la vez
+        pedidos_col.create_index([("estatus", ASCENDING), ("fecha_entrega", ASCENDING)])
+        pedidos_archivo_col.create_index([("guild_id", ASCENDING), ("solicitante_id", ASCENDING), ("fecha_solicitud", DESCENDING)])
+        # Barrido de recordatorios: solo los pedidos con un recordatorio programado entran en el índice
+        pedidos_col.create_index(
+            [("guild_id", ASCENDING), ("recordar_en", ASCENDING)],
+            partialFilterExpression={"recordar_en": {"$exists": True}}
+        )
+        preferencias_asignacion_col.create_index([("guild_id", ASCENDING), ("user_id", ASCENDING)], unique=True)
+        # Código corto único (los pedidos anteriores a los códigos no lo tienen: índice parcial)
+        pedidos_col.create_index(
+            "codigo", unique=True, partialFilterExpression={"codigo": {"$type": "string"}}
+        )
+
+        # Los índices de antes de guild_id quedan cubiertos por los nuevos
+        for collection, index_names in LEGACY_INDEXES:
+            existing = collection.index_information()
+            for index_name in index_names:
+                if index_name in existing:
+                    collection.drop_index(index_name)
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "ensure_indexes", "error": str(e)})
+
+def migrate_guild_ids(guild_id, batch_size):
+    """
+    Asigna guild_id a los documentos creados antes del soporte multi-servidor, por lotes
+    (cada lote es una lectura de _id y un update_many). Idempotente: solo toca los que no lo tienen.
+    Retorna {colección: documentos migrados}.
+    """
+    migrated = {}
+    try:
+        for collection in (pedidos_col, pedidos_archivo_col, inventario_col, inventario_movimientos_col, inventario_checkpoints_col):
+            total = 0
+            while True:
+                ids = [doc["_id"] for doc in collection.find({"guild_id": {"$exists": False}}, {"_id": 1}).limit(batch_size)]
+                if not ids:
+                    break
+                total += collection.update_many(
+                    {"_id": {"$in": ids}, "guild_id": {"$exists": False}}, {"$set": {"guild_id": guild_id}}
+                ).modified_count
+            if total:
+                migrated[collection.name] = total
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "migrate_guild_ids", "error": str(e)})
+    return migrated
+
+# --- ESQUEMA DE LOS PEDIDOS Y MIGRACIONES ---
+# Esquema 2: solicitante_id y asignado_a_id como Int64 (8 bytes en lugar de una cadena de 17-19
+# dígitos, también en los índices) y estatus abreviado a una letra. El resto del bot sigue usando
+# cadenas y nombres completos: se convierten al escribir (storage_fields) y al leer (OrderRecord,
+# order_view). Mientras queden pedidos sin migrar, las consultas buscan ambos formatos.
+SCHEMA_VERSION = 2
+STATUS_CODES = {"PENDIENTE": "P", "ASIGNADA": "A", "LISTO PARA RECOGER": "L", "ENTREGADA": "E"}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+USER_ID_FIELDS = ("solicitante_id", "asignado_a_id")
+
+class SchemaState:
+    """Si las consultas buscan también el formato anterior (hasta que terminan las migraciones)."""
+
+    def __init__(self):
+        self.compat_reads = True
+
+    def disable_compat_reads(self, _=None):
+        if SCHEMA_COMPAT_READS == "auto":
+            self.compat_reads = False
+
+schema_state = services.get("schema_state", SchemaState)
+# El proceso que migra avisa a los demás al terminar
+cache_bus.subscribe("schema", schema_state.disable_compat_reads)
+
+def status_name(value):
+    return STATUS_NAMES.get(value, value)
+
+def status_match(*names):
+    """Valor de consulta de estatus para uno o varios estados (en ambos formatos durante la transición)."""
+    values = [STATUS_CODES[name] for name in names]
+    if schema_state.compat_reads:
+        values += names
+    return values[0] if len(values) == 1 else {"$in": values}
+
+def user_id_value(user_id):
+    return Int64(int(user_id))
+
+def user_match(user_id):
+    if schema_state.compat_reads:
+        return {"$in": [user_id_value(user_id), str(user_id)]}
+    return user_id_value(user_id)
+
+def user_mismatch(user_id):
+    if schema_state.compat_reads:
+        return {"$nin": [user_id_value(user_id), str(user_id)]}
+    return {"$ne": user_id_value(user_id)}
+
+def storage_fields(fields):
+    """Copia de los campos de un pedido en el formato de Mongo (estatus abreviado, ids Int64)."""
+    stored = dict(fields)
+    if "estatus" in stored:
+        stored["estatus"] = STATUS_CODES.get(stored["estatus"], stored["estatus"])
+    for field in USER_ID_FIELDS:
+        if stored.get(field) is not None:
+            stored[field] = user_id_value(stored[field])
+    return stored
+
+def storage_order(doc):
+    return {**storage_fields(doc), "esquema": SCHEMA_VERSION}
+
+def order_view(doc):
+    """Pasa un pedido leído de Mongo (de cualquier versión) al formato del bot, en el mismo dict."""
+    if "estatus" in doc:
+        doc["estatus"] = status_name(doc["estatus"])
+    for field in USER_ID_FIELDS:
+        if doc.get(field) is not None:
+            doc[field] = str(doc[field])
+    return doc
+
+class SchemaMigration:
+    """Paso de una versión del esquema: etapas de un update con pipeline (atómico por documento e idempotente)."""
+    __slots__ = ("version", "name", "stages")
+
+    def __init__(self, version, name, stages):
+        self.version = version
+        self.name = name
+        self.stages = stages
+
+def to_long(field):
+    # Las cadenas numéricas pasan a Int64; lo demás (ya convertido, ausente o inválido) se conserva
+    return {"$cond": [
+        {"$eq": [{"$type": f"${field}"}, "string"]},
+        {"$convert": {"input": f"${field}", "to": "long", "onError": f"${field}"}},
+        f"${field}"
+    ]}
+
+SCHEMA_MIGRATIONS = [
+    SchemaMigration(1, "ids_int64", [{"$set": {field: to_long(field) for field in USER_ID_FIELDS}}]),
+    SchemaMigration(2, "estatus_abreviado", [{"$set": {"estatus": {"$switch": {
+        "branches": [{"case": {"$eq": ["$estatus", name]}, "then": code} for name, code in STATUS_CODES.items()],
+        "default": "$estatus"
+    }}}}]),
+]
+# Primero los pedidos activos: los que se archivan durante su migración llegan al archivo antes de migrarlo
+MIGRATED_COLLECTIONS = (pedidos_col, pedidos_archivo_col)
+
+def migration_pipeline(migration):
+    """
+    Update de una migración: las etapas de todas las versiones hasta la suya, de modo que un documento
+    escrito en el formato anterior después de una migración ya terminada también queda completo.
+    """
+    stages = [stage for step in SCHEMA_MIGRATIONS if step.version <= migration.version for stage in step.stages]
+    return stages + [{"$set": {"esquema": migration.version}}]
+
+def run_schema_migration_batch(migration, collection, batch_size):
+    """
+    Migra un lote de documentos en orden de _id desde donde se quedó la migración (progreso en
+    migraciones_col, así que se reanuda tras un reinicio). Retorna (migrados, terminada) o None si falla.
+    """
+    key = f"{migration.version}:{migration.name}:{collection.name}"
+    pending = {"esquema": {"$not": {"$gte": migration.version}}}
+    try:
+        progress = migraciones_col.find_one({"_id": key}) or {}
+        if progress.get("terminada"):
+            return 0, True
+        query = dict(pending, _id={"$gt": progress["ultimo_id"]}) if "ultimo_id" in progress else pending
+        ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+        migrated = 0
+        if ids:
+            migrated = collection.update_many({"_id": {"$in": ids}, **pending}, migration_pipeline(migration)).modified_count
+        done = len(ids) < batch_size
+        migraciones_col.update_one(
+            {"_id": key},
+            {
+                "$set": {"terminada": done, "actualizada": discord.utils.utcnow(), **({"ultimo_id": ids[-1]} if ids else {})},
+                "$inc": {"migrados": migrated},
+            },
+            upsert=True
+        )
+        return migrated, done
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "run_schema_migration_batch", "migration": key, "error": str(e)})
+        return None
+
+def pending_schema_migrations():
+    """Cantidad de pares (migración, colección) sin terminar, o None si falla la consulta."""
+    try:
+        finished = {doc["_id"] for doc in migraciones_col.find({"terminada": True}, {"_id": 1})}
+        return sum(
+            1 for migration in SCHEMA_MIGRATIONS for collection in MIGRATED_COLLECTIONS
+            if f"{migration.version}:{migration.name}:{collection.name}" not in finished
+        )
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "pending_schema_migrations", "error": str(e)})
+        return None
+
+def get_inventory_all_names(guild_id, search_query):
+    """Obtiene NOMBRES de ítems de la colección 'inventario' del servidor, incluyendo stock 0."""
+    try:
+        # Autocompletado: ruta de lectura (secundarios)
+        items = inventario_lectura_col.find(
+            {"guild_id": guild_id, "name": {"$regex": f"^{search_query}", "$options": "i"}},
+            {"name": 1, "_id": 0} 
+        ).limit(25)
+        
+        return [item['name'] for item in items]
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_inventory_all_names", "error": str(e)})
+        # Devuelve una lista vacía para evitar que Discord falle
+        return []
+
+
+def get_unique_categories():
+    """Consulta MongoDB síncronamente para obtener categorías únicas."""
+    try:
+        # Consulta sincrona.
+        categories = items_col.distinct("category") 
+        mongo_log.debug("Categorías encontradas", extra={"operation": "get_categories", "count": len(categories)}) # Muestreado
+        return categories
+    except Exception as e:
+        # Debería capturar y mostrar cualquier error de conexión/colección
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_categories", "error": str(e)})
+        return []
+
+def get_unique_types(category):
+    """Consulta MongoDB síncronamente para obtener tipos únicos por categoría."""
+    try:
+        # Consulta simplificada, filtra solo por categoría.
+        types = items_col.distinct("type", {"category": category}) 
+        return types
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_types", "error": str(e)})
+        return []
+
+def get_item_details(category, item_type):
+    """Obtiene todos los documentos de recetas que coinciden con la categoría y el tipo."""
+    try:
+        # Consulta síncrona: encuentra todos los documentos que coinciden
+        recipes = items_col.find(
+            {"category": category, "type": item_type},
+            {"name": 1, "variations": 1, "_id": 0, "recipe_id": 1} # Proyectamos solo los campos necesarios
+        )
+        # Convertimos el cursor de MongoDB a una lista para enviarla fuera del thread
+        return list(recipes)
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_item_details", "error": str(e)})
+        return []
+
+def get_recipe_names(category, item_type):
+    """Obtiene nombre y recipe_id de las recetas de una categoría y tipo, ordenadas por nombre."""
+    try:
+        # Proyectamos solo el nombre y el recipe_id
+        recipes = items_col.find(
+            {"category": category, "type": item_type},
+            {"name": 1, "recipe_id": 1, "_id": 0} 
+        ).sort("name", 1)
+        
+        return list(recipes)
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_recipe_names", "error": str(e)})
+        return []
+
+def get_catalog_pairs():
+    """Obtiene todas las combinaciones (categoría, tipo) del catálogo de recetas."""
+    try:
+        pairs = items_col.aggregate([
+            {"$group": {"_id": {"category": "$category", "type": "$type"}}}
+        ])
+        return [(pair["_id"].get("category"), pair["_id"].get("type")) for pair in pairs]
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_catalog_pairs", "error": str(e)})
+        return []
+
+def load_catalog_entries(kind, category=None, item_type=None):
+    """
+    Carga una lista del asistente como pares (etiqueta, valor) ordenados:
+    'cat' = categorías, 'typ' = tipos de una categoría, 'item' = recetas de una categoría y tipo.
+    """
+    if kind == "cat":
+        return [(cat[:100], cat) for cat in sorted(get_unique_categories())]
+    if kind == "typ":
+        return [(t[:100], t) for t in sorted(get_unique_types(category))]
+    if kind == "item":
+        return [(recipe['name'][:100], recipe['recipe_id']) for recipe in get_recipe_names(category, item_type)]
+    return []
+
+# Discord permite como máximo 25 opciones por Select
+CATALOG_PAGE_SIZE = 25
+# Longitud máxima de la clave de una lista del asistente: con el paso, la página y el filtro
+# (hasta 30 caracteres) cualquier custom_id que la lleve queda por debajo de los 100 de Discord
+CATALOG_KEY_MAX_LENGTH = 40
+
+class CatalogList:
+    """Una lista del asistente con sus páginas de opciones ya construidas y sus letras iniciales."""
+    __slots__ = ("entries", "pages", "letters")
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.pages = self._paginate(entries)
+        self.letters = sorted({label[:1].upper() for label, _ in entries if label})[:CATALOG_PAGE_SIZE]
+
+    @staticmethod
+    def _paginate(entries):
+        return [
+            [SelectOption(label=label, value=value) for label, value in entries[i:i + CATALOG_PAGE_SIZE]]
+            for i in range(0, len(entries), CATALOG_PAGE_SIZE)
+        ]
+
+    def page(self, text_filter, page):
+        """
+        Devuelve (opciones, página, total_de_páginas) aplicando el filtro:
+        "^X" = empieza por la letra X, cualquier otro texto = lo contiene (sin distinguir mayúsculas).
+        """
+        if not text_filter:
+            pages = self.pages
+        else:
+            if text_filter.startswith("^"):
+                prefix = text_filter[1:].lower()
+                matches = [entry for entry in self.entries if entry[0].lower().startswith(prefix)]
+            else:
+                needle = text_filter.lower()
+                matches = [entry for entry in self.entries if needle in entry[0].lower()]
+            pages = self._paginate(matches)
+
+        if not pages:
+            return [], 0, 0
+        page = min(max(page, 0), len(pages) - 1)
+        return pages[page], page, len(pages)
+
+class CatalogCache:
+    """
+    Caché de las listas del asistente /crearpedido. Cada lista guarda sus páginas ya
+    construidas, así que paginar y filtrar no consulta Mongo. Las recetas de una
+    (categoría, tipo) se identifican con una clave corta que cabe en un custom_id, igual
+    que una categoría demasiado larga para usarla tal cual.
+    """
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._lists = {}          # (tipo_de_lista, clave) -> (expira, CatalogList)
+        self._item_keys = {}      # clave corta -> (categoría, tipo)
+        self._category_keys = {}  # clave corta ("#...") -> categoría
+
+    def item_key(self, category, item_type):
+        key = hashlib.sha1(f"{category}|{item_type}".encode("utf-8")).hexdigest()[:12]
+        self._item_keys[key] = (category, item_type)
+        return key
+
+    async def resolve_item_key(self, key):
+        """Traduce una clave corta a (categoría, tipo); tras un reinicio recarga las combinaciones."""
+        if key not in self._item_keys:
+            for category, item_type in await run_blocking(get_catalog_pairs):
+                self.item_key(category, item_type)
+        return self._item_keys.get(key)
+
+    def category_key(self, category):
+        """Clave de la lista de tipos de una categoría: la propia categoría si es corta, si no un hash."""
+        if len(category) <= CATALOG_KEY_MAX_LENGTH and not category.startswith("#"):
+            return category
+        key = "#" + hashlib.sha1(category.encode("utf-8")).hexdigest()[:12]
+        self._category_keys[key] = category
+        return key
+
+    async def resolve_category_key(self, key):
+        """Traduce la clave de category_key a la categoría; tras un reinicio recarga las categorías."""
+        if not key.startswith("#"):
+            return key
+        if key not in self._category_keys:
+            for category in await run_blocking(get_unique_categories):
+                self.category_key(category)
+        return self._category_keys.get(key)
+
+    async def get(self, kind, key):
+        """Devuelve la CatalogList de una lista ('cat', 'typ' o 'item'), o None si no existe."""
+        cached = self._lists.get((kind, key))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        if kind == "item":
+            pair = await self.resolve_item_key(key)
+            if pair is None:
+                return None
+            loader = partial(load_catalog_entries, kind, *pair)
+        elif kind == "typ":
+            category = await self.resolve_category_key(key)
+            if category is None:
+                return None
+            loader = partial(load_catalog_entries, kind, category)
+        else:
+            loader = partial(load_catalog_entries, kind, key)
+
+        entries = await run_blocking(loader)
+        if not entries:
+            return None # No guardamos listas vacías (pueden venir de un fallo de conexión)
+
+        catalog_list = CatalogList(entries)
+        self._lists[(kind, key)] = (time.monotonic() + self.ttl_seconds, catalog_list)
+        return catalog_list
+
+    def invalidate(self, _key=None):
+        """Descarta las listas construidas (las claves cortas no caducan: dependen solo del texto)."""
+        self._lists.clear()
+
+catalog_cache = services.get("catalog_cache", lambda: CatalogCache(CATALOG_CACHE_SECONDS))
+cache_bus.subscribe("catalog", catalog_cache.invalidate)
+    
+def apply_inventory_deltas(changes):
+    """
+    Aplica los cambios de una ventana ({(guild_id, nombre): [cambio, ...]} en orden de llegada) con
+    la misma regla que si llegaran de uno en uno: tras cada cambio la cantidad no baja de 0.
+    Esa cadena se reduce a max(cantidad + suma, piso), así que cada ítem se escribe con un único
+    find_one_and_update (pipeline con upsert) que devuelve la cantidad previa en la misma operación.
+    Los ítems que terminan en 0 se eliminan con un delete_many filtrado por cantidad.
+    Retorna {(guild_id, nombre): (cantidad_previa, [cantidad tras cada cambio])}, o None para un
+    ítem cuya escritura falló.
+    """
+    quantities = {}
+    emptied = []
+    for (guild_id, name), item_changes in changes.items():
+        total, floor = 0, None
+        for change in item_changes:
+            # max(max(q + a, piso) + c, 0) = max(q + a + c, max(piso + c, 0)): tras el primer cambio el piso es 0
+            total += change
+            floor = 0 if floor is None else max(floor + change, 0)
+        try:
+            previous_doc = inventario_col.find_one_and_update(
+                {"guild_id": guild_id, "name": name},
+                [{"$set": {"quantity": {"$max": [{"$add": [{"$ifNull": ["$quantity", 0]}, total]}, floor]}}}],
+                projection={"quantity": 1, "_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except PyMongoError as e:
+            # Solo fallan los comandos de este ítem: los que ya se escribieron conservan su resultado
+            mongo_log.error("ERROR DE MONGO", extra={"operation": "apply_inventory_deltas", "item": name, "error": str(e)})
+            quantities[(guild_id, name)] = None
+            continue
+
+        # La misma cadena en local da la cantidad tras cada cambio (para cada comando y el historial)
+        previous_quantity = quantity = previous_doc.get("quantity", 0) if previous_doc else 0
+        steps = []
+        for change in item_changes:
+            quantity = max(quantity + change, 0)
+            steps.append(quantity)
+        quantities[(guild_id, name)] = (previous_quantity, steps)
+        if quantity <= 0:
+            emptied.append({"guild_id": guild_id, "name": name})
+
+    if emptied:
+        # El filtro por cantidad evita borrar un ítem que otro comando repuso entretanto
+        try:
+            inventario_col.delete_many({"$or": emptied, "quantity": {"$lte": 0}})
+        except PyMongoError as e:
+            # Los cambios ya se aplicaron: el ítem se queda en 0 hasta su próxima escritura
+            mongo_log.error("ERROR DE MONGO", extra={"operation": "apply_inventory_deltas", "error": str(e)})
+    return quantities
+
+def record_inventory_movements(movements):
+    """
+    Agrega movimientos al historial del inventario. Cada movimiento guarda quién,
+    con qué comando, el cambio y la cantidad resultante.
+    insert_many deja el _id en cada movimiento, así que reintentar un lote ya escrito en
+    parte no duplica nada: los duplicados se dan por registrados. Otros errores se propagan.
+    """
+    if not movements:
+        return
+    try:
+        inventario_movimientos_col.insert_many(movements, ordered=False)
+    except BulkWriteError as e:
+        if not all(error.get("code") == 11000 for error in e.details.get("writeErrors", [])) or e.details.get("writeConcernErrors"):
+            raise
+
+def build_inventory_movement(guild_id, item_name, delta, quantity, user_id=None, command=None):
+    """Construye el documento de un movimiento del historial del inventario."""
+    return {
+        "guild_id": guild_id,
+        "name": item_name,
+        "timestamp": discord.utils.utcnow(),
+        "delta": delta,
+        "quantity": quantity,
+        "user_id": user_id,
+        "command": command,
+    }
+
+def is_transient_mongo_error(error):
+    """
+    Errores que se arreglan reintentando: circuito abierto, red (AutoReconnect, timeouts) o falta de
+    confirmación de escritura. Un lote con errores de escritura que no son duplicados no lo es.
+    """
+    if isinstance(error, (MongoUnavailable, ConnectionFailure, WriteConcernError)):
+        return True
+    if isinstance(error, BulkWriteError):
+        details = error.details
+        return bool(details.get("writeConcernErrors")) and all(
+            write_error.get("code") == 11000 for write_error in details.get("writeErrors", [])
+        )
+    return False
+
+class InventoryLedgerWriter:
+    """
+    Única vía de escritura del historial del inventario. Los movimientos se encolan en memoria y
+    un volcador los inserta por lotes; si Mongo no los acepta por un fallo pasajero (cortocircuito
+    abierto, red), quedan en la cola y se reintentan cada retry_seconds, con un aviso en el registro
+    en cada fallo. Un lote que falla por sí mismo (validación, tamaño) se registra y se descarta, para
+    no bloquear los movimientos que vienen detrás.
+    """
+
+    def __init__(self, retry_seconds):
+        self.retry_seconds = retry_seconds
+        self._pending = []
+        self._task = None
+
+    def record(self, movements):
+        """Encola movimientos ya construidos; vuelve enseguida (el comando no espera al historial)."""
+        self._pending.extend(movements)
+        if self._task is None:
+            self._task = bot.loop.create_task(self._flush())
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    async def _flush(self):
+        try:
+            while self._pending:
+                batch = self._pending[:]
+                try:
+                    await run_blocking(partial(record_inventory_movements, batch))
+                except Exception as e:
+                    if not is_transient_mongo_error(e):
+                        # Un movimiento inválido o demasiado grande no se arregla reintentando: se descarta el lote
+                        # (con ordered=False los demás ya se insertaron), pero no en silencio
+                        mongo_log.error("ERROR DE MONGO", extra={
+                            "operation": "record_inventory_movements", "dropped": len(batch), "error": str(e) or type(e).__name__
+                        })
+                        del self._pending[:len(batch)]
+                        continue
+                    mongo_log.warning("Movimientos del inventario pendientes de registrar", extra={
+                        "operation": "record_inventory_movements", "movements": len(self._pending),
+                        "retry_in": self.retry_seconds, "error": str(e) or type(e).__name__
+                    })
+                    await asyncio.sleep(self.retry_seconds)
+                    continue
+                del self._pending[:len(batch)]
+        finally:
+            self._task = None
+
+inventory_ledger = services.get("inventory_ledger", lambda: InventoryLedgerWriter(INVENTORY_LEDGER_RETRY_SECONDS))
+
+class InventoryWriteCoalescer:
+    """
+    Agrupa los cambios de inventario que llegan dentro de una ventana corta
+    (varios maestros usando /inventarioagregar a la vez) y los escribe juntos
+    con apply_inventory_deltas: una escritura por ítem y ventana, con el mismo
+    resultado para cada comando que si se hubieran aplicado uno tras otro.
+    Los movimientos se registran en el historial después de responder a los comandos.
+    """
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self._pending = {}  # (guild_id, nombre) -> [(future, cambio, datos_del_movimiento)] en orden de llegada
+        self._flush_task = None
+        self._lock = asyncio.Lock()  # Una escritura a la vez: las cantidades devueltas son coherentes
+
+    async def apply(self, guild_id, item_name, quantity_change, user_id=None, command=None):
+        """
+        Agrega (positivo) o retira (negativo) una cantidad de un ítem del inventario de un servidor.
+        Retorna (resultado, cantidad_final) con resultado "SUCCESS", "DELETED" o "ERROR".
+        """
+        future = bot.loop.create_future()
+        self._pending.setdefault((guild_id, item_name), []).append(
+            (future, quantity_change, {"user_id": user_id, "command": command})
+        )
+
+        if self._flush_task is None:
+            self._flush_task = bot.loop.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window_seconds)
+        async with self._lock:
+            batch, self._pending = self._pending, {}
+            self._flush_task = None
+
+            changes = {key: [change for _, change, _ in waiters] for key, waiters in batch.items()}
+            try:
+                quantities = await run_blocking(partial(apply_inventory_deltas, changes))
+            except Exception as e:
+                mongo_log.error("ERROR DE MONGO", extra={"operation": "apply_inventory_deltas", "error": str(e)})
+                quantities = None
+
+            movements = []
+            for (guild_id, name), waiters in batch.items():
+                if quantities is None or quantities[(guild_id, name)] is None:
+                    for future, _, _ in waiters:
+                        if not future.done():
+                            future.set_result(("ERROR", None))
+                    continue
+
+                # Cada comando recibe la cantidad tras su propio cambio; el historial guarda el cambio efectivo
+                previous, steps = quantities[(guild_id, name)]
+                for (future, _, meta), quantity in zip(waiters, steps):
+                    if not future.done():
+                        future.set_result(("DELETED" if quantity <= 0 else "SUCCESS", quantity))
+                    movements.append(build_inventory_movement(guild_id, name, quantity - previous, quantity, **meta))
+                    previous = quantity
+
+            # El historial se escribe cuando los comandos ya tienen su respuesta
+            if movements:
+                inventory_ledger.record(movements)
+
+inventory_writer = services.get("inventory_writer", lambda: InventoryWriteCoalescer(INVENTORY_COALESCE_MS / 1000))
+
+def get_inventory_items(search_query):
+    """Obtiene una lista de NOMBRES DE RECETA de la colección maestra 'item' para autocompletado."""
+    try:
+        # Buscamos nombres de ítems en la colección maestra 'item'
+        items = items_col.find(
+            {"name": {"$regex": f"^{search_query}", "$options": "i"}},
+            {"name": 1, "_id": 0} # Proyectar solo el nombre
+        ).limit(25)
+        
+        return [item['name'] for item in items]
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_inventory_items", "error": str(e)})
+        return []
+    
+
+def get_inventory_stock_names(guild_id, search_query):
+    """Obtiene NOMBRES de ítems que tienen stock en el inventario del servidor."""
+    try:
+        # Consultamos directamente inventario_col y filtramos por stock > 0
+        items = inventario_lectura_col.find(
+            {"guild_id": guild_id, "name": {"$regex": f"^{search_query}", "$options": "i"}, "quantity": {"$gt": 0}},
+            {"name": 1, "_id": 0} 
+        ).limit(25)
+        
+        return [item['name'] for item in items]
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_inventory_stock_names", "error": str(e)})
+        return []
+
+
+# Función para obtener los datos finales de la receta
+def get_final_recipe_data(context_string, quality):
+    # Asumimos que el contexto es "recipe_id|level_name"
+    recipe_id, level_name = context_string.split('|')
+    
+    # Buscamos la receta completa para obtener el nombre y validar
+    full_recipe = items_col.find_one({"recipe_id": recipe_id})
+    if not full_recipe: return None
+    
+    # Buscamos el objeto 'variation' específico
+    for var in full_recipe.get('variations', []):
+        if var.get('level_name') == level_name:
+            # Retornamos los datos necesarios para el Modal y la BD
+            return {
+                "recipe_id": recipe_id,
+                "name": full_recipe.get('name', 'N/A'),
+                "level_name": level_name,
+                "quality": quality,
+                "profession": full_recipe.get('profession', 'N/A'), # Oficio que lo crea
+            }
+    return None
+
+# Función para insertar el pedido en la BD
+# --- CÓDIGOS CORTOS DE PEDIDO ---
+# Se muestran y se escriben en lugar del ObjectId (sin 0/O ni 1/I para evitar confusiones)
+ORDER_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+ORDER_CODE_LENGTH = 6
+ORDER_CODE_PATTERN = re.compile(f"[{ORDER_CODE_ALPHABET}]{{{ORDER_CODE_LENGTH}}}")
+OBJECT_ID_PATTERN = re.compile(r"[0-9a-fA-F]{24}")
+
+def new_order_code():
+    return "".join(random.choices(ORDER_CODE_ALPHABET, k=ORDER_CODE_LENGTH))
+
+def parse_order_ref(value):
+    """
+    Convierte lo que escribe el usuario (código corto o ObjectId completo) en el filtro de Mongo.
+    Retorna None si no tiene ningún formato válido, sin consultar la base de datos.
+    """
+    value = value.strip()
+    if ORDER_CODE_PATTERN.fullmatch(value.upper()):
+        return {"codigo": value.upper()}
+    if OBJECT_ID_PATTERN.fullmatch(value):
+        return {"_id": ObjectId(value)}
+    return None
+
+def is_order_code_conflict(error_details):
+    # keyPattern llega desde MongoDB 4.4; en versiones anteriores solo el mensaje nombra el índice
+    return error_details.get("code") == 11000 and (
+        "codigo" in (error_details.get("keyPattern") or {}) or "codigo_1" in error_details.get("errmsg", "")
+    )
+
+def insert_pedido(doc):
+    # La colección 'pedido' se crea automáticamente si no existe.
+    # Si el código corto ya existe (muy improbable), se genera otro
+    stored = storage_order(doc)
+    while True:
+        try:
+            pedidos_col.insert_one(stored)
+            return True
+        except DuplicateKeyError as e:
+            if not is_order_code_conflict(e.details or {}):
+                raise
+            doc["codigo"] = stored["codigo"] = new_order_code()
+
+def upsert_pedidos(docs):
+    """
+    Inserta un lote de pedidos que ya traen su _id. Con upsert + $setOnInsert, repetir el lote
+    (p. ej. si el proceso cae antes de marcarlo como volcado) no duplica ni modifica nada.
+    """
+    while docs:
+        try:
+            pedidos_col.bulk_write([
+                UpdateOne(
+                    {"_id": doc["_id"]},
+                    {"$setOnInsert": {key: value for key, value in storage_order(doc).items() if key != "_id"}},
+                    upsert=True
+                )
+                for doc in docs
+            ], ordered=False)
+            return
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if not write_errors or not all(is_order_code_conflict(error) for error in write_errors):
+                raise
+            # Código repetido: el pedido ya se confirmó con ese código, así que se avisa en el registro
+            docs = [docs[error["index"]] for error in write_errors]
+            for doc in docs:
+                previous_code, doc["codigo"] = doc["codigo"], new_order_code()
+                mongo_log.warning("Código de pedido repetido, se asigna otro", extra={
+                    "operation": "upsert_pedidos", "previous_code": previous_code, "code": doc["codigo"]
+                })
+
+def apply_order_transition(intent):
+    """
+    Resuelve una transición pendiente del diario con su actualización condicional. La actualización
+    marca el pedido con el id de la intención: si el proceso cae después de aplicarla pero antes de
+    borrarla del diario, al repetirla se reconoce como ya aplicada en lugar de darla por rechazada.
+    Retorna (pedido antes del cambio o None si ya no cumple las condiciones, ya_aplicada).
+    """
+    marker = {"transicion_diario": intent["id"]}
+    update = dict(intent["update"], **{"$set": {**intent["update"].get("$set", {}), **marker}})
+    order_doc = pedidos_col.find_one_and_update(
+        {**intent["filter"], "transicion_diario": {"$ne": intent["id"]}}, update, projection=TRANSITION_PROJECTION
+    )
+    if order_doc:
+        return OrderRecord(order_doc), False
+    applied_doc = pedidos_col.find_one({**intent["order"], **marker}, TRANSITION_PROJECTION)
+    return (OrderRecord(applied_doc), True) if applied_doc else (None, False)
+
+def assign_missing_order_codes(batch_size=500):
+    """Asigna código corto a los pedidos creados antes de que existieran (se ejecuta al arrancar)."""
+    try:
+        assigned = 0
+        while True:
+            missing = list(pedidos_col.find({"codigo": {"$exists": False}}, {"_id": 1}).limit(batch_size))
+            if not missing:
+                return assigned
+            try:
+                result = pedidos_col.bulk_write([
+                    UpdateOne({"_id": doc["_id"], "codigo": {"$exists": False}}, {"$set": {"codigo": new_order_code()}})
+                    for doc in missing
+                ], ordered=False)
+                assigned += result.modified_count
+            except BulkWriteError as e:
+                # Los que chocaron con un código existente se reintentan en la siguiente vuelta
+                assigned += e.details.get("nModified", 0)
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "assign_missing_order_codes", "error": str(e)})
+        return 0
+
+class OrderJournal:
+    """
+    Diario local (SQLite, solo se agrega) de pedidos nuevos. OrderModal confirma el pedido en cuanto
+    está escrito en disco; un volcador en segundo plano lo replica en pedidos_col por lotes y lo borra
+    del diario. Si Mongo no responde, los pedidos esperan en el diario (también entre reinicios).
+
+    Las transiciones de estado (/asignar, /completar, /recoger) que llegan con Mongo caído se guardan
+    como intenciones pendientes: no se confirman, porque solo la actualización condicional sabe si el
+    pedido sigue en el estado esperado. El volcador las resuelve en orden, después de los pedidos
+    nuevos, y avisa por DM del resultado.
+    """
+
+    def __init__(self, path, flush_seconds, batch_size, retry_seconds):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL + synchronous=FULL: cada pedido confirmado ya está en disco
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pedidos_pendientes (seq INTEGER PRIMARY KEY AUTOINCREMENT, doc TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS transiciones_pendientes (seq INTEGER PRIMARY KEY AUTOINCREMENT, intent TEXT NOT NULL)"
+        )
+        self._wake = None
+        self._task = None
+
+    # --- Acceso a SQLite (en el pool de hilos, no depende del estado de Mongo) ---
+    def _append(self, doc):
+        with self._lock:
+            self._conn.execute("INSERT INTO pedidos_pendientes (doc) VALUES (?)", (json_util.dumps(doc),))
+
+    def _read_batch(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, doc FROM pedidos_pendientes ORDER BY seq LIMIT ?", (self.batch_size,)
+            ).fetchall()
+
+    def _ack(self, last_seq):
+        with self._lock:
+            self._conn.execute("DELETE FROM pedidos_pendientes WHERE seq <= ?", (last_seq,))
+
+    def _append_transition(self, intent):
+        with self._lock:
+            self._conn.execute("INSERT INTO transiciones_pendientes (intent) VALUES (?)", (json_util.dumps(intent),))
+
+    def _read_transitions(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, intent FROM transiciones_pendientes ORDER BY seq LIMIT ?", (self.batch_size,)
+            ).fetchall()
+
+    def _ack_transition(self, seq):
+        with self._lock:
+            self._conn.execute("DELETE FROM transiciones_pendientes WHERE seq = ?", (seq,))
+
+    def start(self):
+        if self._task is not None:
+            return # Ya en marcha: la extensión de pedidos lo vuelve a llamar al recargarse
+        # Al arrancar se vuelca lo que quedara pendiente de la ejecución anterior
+        self._wake = asyncio.Event()
+        self._wake.set()
+        self._task = bot.loop.create_task(self._run())
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def append(self, doc):
+        """Registra un pedido nuevo. Al volver, el pedido ya es durable y tiene su _id definitivo."""
+        doc.setdefault("_id", ObjectId())
+        await bot.loop.run_in_executor(None, partial(self._append, doc))
+        self.wake()
+
+    async def append_transition(self, intent):
+        """
+        Registra una transición pendiente: {"id", "guild_id", "order" (filtro del pedido), "filter" y
+        "update" (la actualización condicional), "track_load", "assignee_id", "applied" y "rejected"
+        (avisos [destinatario, plantilla con {code} e {item}] según el resultado; destinatario
+        "solicitante" = el del pedido)}.
+        """
+        intent.setdefault("id", str(ObjectId()))
+        await bot.loop.run_in_executor(None, partial(self._append_transition, intent))
+        self.wake()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.flush_seconds) # Agrupa los pedidos que llegan en la ventana
+            self._wake.clear()
+            try:
+                while await self._flush_batch():
+                    pass
+                # Después de los pedidos nuevos: una transición puede referirse a un pedido del diario
+                while await self._flush_transitions():
+                    pass
+            except Exception as e:
+                mongo_log.warning("Pedidos del diario pendientes de volcar", extra={
+                    "operation": "upsert_pedidos", "retry_in": self.retry_seconds, "error": str(e) or type(e).__name__
+                })
+                await asyncio.sleep(self.retry_seconds)
+                self._wake.set()
+
+    async def _flush_batch(self):
+        """Vuelca un lote; devuelve True si estaba completo (puede quedar más en el diario)."""
+        rows = await bot.loop.run_in_executor(None, self._read_batch)
+        if not rows:
+            return False
+        await run_blocking(partial(upsert_pedidos, [json_util.loads(doc) for _, doc in rows]))
+        await bot.loop.run_in_executor(None, partial(self._ack, rows[-1][0]))
+        return len(rows) == self.batch_size
+
+    async def _flush_transitions(self):
+        """
+        Resuelve las transiciones pendientes de una en una y en orden (cada una depende del estado que
+        dejó la anterior); devuelve True si el lote estaba completo. Un error pasajero corta el volcado
+        y se reintenta; una transición que falla por sí misma se descarta y se avisa como rechazada.
+        """
+        rows = await bot.loop.run_in_executor(None, self._read_transitions)
+        for seq, raw in rows:
+            intent = json_util.loads(raw)
+            try:
+                record, replayed = await run_blocking(partial(apply_order_transition, intent))
+            except Exception as e:
+                if is_transient_mongo_error(e):
+                    raise
+                mongo_log.error("ERROR DE MONGO", extra={"operation": "apply_order_transition", "error": str(e) or type(e).__name__})
+                record, replayed = None, False
+            await bot.loop.run_in_executor(None, partial(self._ack_transition, seq))
+            await resolve_journaled_transition(intent, record, replayed)
+        return len(rows) == self.batch_size
+
+async def resolve_journaled_transition(intent, record, replayed):
+    """Efectos de una transición pendiente ya resuelta: la carga de los artesanos y los avisos por DM."""
+    # Tras una caída el estado del reparto se vuelve a leer de Mongo, que ya incluye la transición repetida
+    if record is not None and not replayed and intent.get("track_load"):
+        assignment_dispatcher.record_transition(intent["guild_id"], record, intent.get("assignee_id"))
+    notices = intent["applied"] if record is not None else intent["rejected"]
+    for target, template in notices:
+        user_id = record.solicitante_id if target == "solicitante" else target
+        user = bot.get_user(int(user_id)) if user_id else None
+        if user is None:
+            command_log.warning("No se encontró al destinatario del aviso", extra={"command": "diario", "target_user": user_id})
+            continue
+        try:
+            # replace y no format: los nombres de ítems y usuarios pueden llevar llaves
+            await user.send(template.replace("{code}", record.code).replace("{item}", record.item_name or "") if record else template)
+        except Exception as e:
+            command_log.warning("Error al enviar DM de transición pendiente", extra={
+                "command": "diario", "target_user": user_id, "error": str(e)
+            })
+
+order_journal = services.get("order_journal", lambda: (
+    OrderJournal(ORDER_JOURNAL_PATH, ORDER_JOURNAL_FLUSH_MS / 1000, ORDER_JOURNAL_BATCH_SIZE, ORDER_JOURNAL_RETRY_SECONDS)
+    if ORDER_JOURNAL_PATH else None
+))
+
+# --- RECORDATORIOS DE PEDIDOS ESTANCADOS ---
+# Cada pedido PENDIENTE o ASIGNADA guarda fecha_estado (su última transición) y recordar_en (cuándo
+# vence su plazo). El barrido lee solo los pedidos con recordar_en ya vencido, por el índice
+# (guild_id, recordar_en), así que cada pasada es incremental. Al recordar un pedido se anota
+# recordado_en y recordar_en se aplaza REMINDER_REPEAT_HOURS.
+REMINDER_STATES = ("PENDIENTE", "ASIGNADA")
+
+def parse_reminder_slas(default, by_profession):
+    """
+    Convierte "24/72" y "Cocina=12/24,..." en {oficio: {estado: timedelta}}; la clave None es el
+    plazo por defecto. Sin plazo por defecto los recordatorios quedan desactivados ({}).
+    """
+    def parse(value):
+        pending, _, assigned = value.partition("/")
+        return {"PENDIENTE": timedelta(hours=float(pending)), "ASIGNADA": timedelta(hours=float(assigned or pending))}
+
+    if not default:
+        return {}
+    slas = {None: parse(default)}
+    for entry in filter(None, (entry.strip() for entry in by_profession.split(","))):
+        oficio, _, value = entry.partition("=")
+        slas[oficio.strip()] = parse(value)
+    return slas
+
+REMINDER_SLAS = parse_reminder_slas(REMINDER_SLA_HOURS, REMINDER_SLA_BY_PROFESSION)
+REMINDER_REPEAT = timedelta(hours=REMINDER_REPEAT_HOURS)
+
+def as_utc(value):
+    """Las fechas vuelven de Mongo sin zona horaria (están en UTC)."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def reminder_sla(estatus, oficio=None):
+    """Plazo de un estado para un oficio; sin oficio, el más corto de todos. None si no se recuerda."""
+    if not REMINDER_SLAS or estatus not in REMINDER_STATES:
+        return None
+    if not isinstance(oficio, str):
+        return min(slas[estatus] for slas in REMINDER_SLAS.values())
+    return REMINDER_SLAS.get(oficio, REMINDER_SLAS[None])[estatus]
+
+def reminder_fields(estatus, since, oficio=None):
+    """Campos de recordatorio de un pedido que entra en 'estatus' en el momento 'since'."""
+    sla = reminder_sla(estatus, oficio)
+    return {"fecha_estado": since} if sla is None else {"fecha_estado": since, "recordar_en": since + sla}
+
+def order_state_update(estatus, fields=None, oficio=None, now=None):
+    """
+    Update de una transición de estado: estatus, fecha_estado y el próximo recordatorio (o ninguno).
+    Si no se conoce el oficio exacto, recordar_en usa el plazo más corto y el barrido lo corrige.
+    """
+    since = now or discord.utils.utcnow()
+    update = {"$set": storage_fields({"estatus": estatus, **(fields or {}), **reminder_fields(estatus, since, oficio)})}
+    if "recordar_en" not in update["$set"]:
+        update["$unset"] = {"recordar_en": ""}
+    return update
+
+REMINDER_PROJECTION = {
+    "item_name": 1, "quality": 1, "cantidad": 1, "estatus": 1, "codigo": 1, "oficio_requerido": 1,
+    "asignado_a_id": 1, "guild_id": 1, "fecha_estado": 1, "fecha_solicitud": 1, "recordar_en": 1
+}
+
+def claim_due_reminders(guild_ids, now, batch_size):
+    """
+    Lee un lote de pedidos con recordar_en vencido en los servidores de este proceso. Los que superan
+    el plazo de su oficio se marcan como recordados (recordado_en) y se aplazan; los que solo habían
+    alcanzado el plazo más corto se reprograman a su plazo exacto.
+    Retorna (pedidos a recordar, pedidos leídos).
+    """
+    try:
+        docs = list(
+            pedidos_col.find({"guild_id": {"$in": guild_ids}, "recordar_en": {"$lte": now}}, REMINDER_PROJECTION)
+            .sort("recordar_en", 1).limit(batch_size)
+        )
+        if not docs:
+            return [], 0
+
+        due = []
+        operations = []
+        for doc in map(order_view, docs):
+            since = doc.get("fecha_estado") or doc.get("fecha_solicitud")
+            sla = reminder_sla(doc.get("estatus"), doc.get("oficio_requerido"))
+            if sla is None:
+                update = {"$unset": {"recordar_en": ""}} # Recordatorios desactivados o estado sin plazo
+            elif since is not None and as_utc(since) + sla > now:
+                update = {"$set": {"recordar_en": as_utc(since) + sla}}
+            else:
+                update = {"$set": {"recordar_en": now + REMINDER_REPEAT, "recordado_en": now}}
+                due.append(doc)
+            # Solo si recordar_en no cambió: una transición simultánea ya lo reprogramó
+            operations.append(UpdateOne({"_id": doc["_id"], "recordar_en": doc["recordar_en"]}, update))
+        pedidos_col.bulk_write(operations, ordered=False)
+        return due, len(docs)
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "claim_due_reminders", "error": str(e)})
+        return [], 0
+
+def schedule_missing_reminders(batch_size=500):
+    """
+    Programa recordar_en en los pedidos abiertos que no lo tienen (anteriores a los recordatorios o
+    creados con ellos desactivados), por lotes. Retorna cuántos se programaron.
+    """
+    if not REMINDER_SLAS:
+        return 0
+    scheduled = 0
+    try:
+        while True:
+            docs = list(pedidos_col.find(
+                {"estatus": status_match(*REMINDER_STATES), "recordar_en": {"$exists": False}},
+                {"estatus": 1, "oficio_requerido": 1, "fecha_estado": 1, "fecha_solicitud": 1}
+            ).limit(batch_size))
+            if not docs:
+                break
+            operations = []
+            for doc in docs:
+                since = as_utc(doc.get("fecha_estado") or doc.get("fecha_solicitud") or discord.utils.utcnow())
+                operations.append(UpdateOne(
+                    {"_id": doc["_id"], "recordar_en": {"$exists": False}},
+                    {"$set": reminder_fields(status_name(doc["estatus"]), since, doc.get("oficio_requerido"))}
+                ))
+            pedidos_col.bulk_write(operations, ordered=False)
+            scheduled += len(operations)
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "schedule_missing_reminders", "error": str(e)})
+    return scheduled
+
+# --- ASIGNACIÓN AUTOMÁTICA ---
+def load_assignment_state(guild_id):
+    """
+    Carga de trabajo de un servidor: {artesano: pedidos ASIGNADA} y los artesanos que pausaron la
+    asignación automática. Retorna None si falla la consulta.
+    """
+    try:
+        loads = {}
+        # Durante la migración un artesano puede aparecer con su id en los dos formatos
+        for row in pedidos_col.aggregate([
+            {"$match": {"guild_id": guild_id, "estatus": status_match("ASIGNADA"), "asignado_a_id": {"$ne": None}}},
+            {"$group": {"_id": "$asignado_a_id", "abiertos": {"$sum": 1}}},
+        ]):
+            loads[str(row["_id"])] = loads.get(str(row["_id"]), 0) + row["abiertos"]
+        opted_out = {
+            doc["user_id"] for doc in preferencias_asignacion_col.find(
+                {"guild_id": guild_id, "auto_asignacion": False}, {"user_id": 1}
+            )
+        }
+        return loads, opted_out
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "load_assignment_state", "error": str(e)})
+        return None
+
+def set_auto_assign_preference(guild_id, user_id, available):
+    try:
+        preferencias_asignacion_col.update_one(
+            {"guild_id": guild_id, "user_id": user_id}, {"$set": {"auto_asignacion": available}}, upsert=True
+        )
+        return "OK"
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "set_auto_assign_preference", "error": str(e)})
+        return "ERROR"
+
+class WorkloadHeap:
+    """
+    Montículo de artesanos ordenado por (pedidos abiertos, turno de su última asignación). Cambiar la
+    carga de un artesano inserta una entrada nueva; las anteriores se descartan al salir (borrado perezoso).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {} # artesano -> (carga, turno) vigente
+
+    def __contains__(self, member_id):
+        return member_id in self._entries
+
+    def push(self, member_id, load, turn):
+        self._entries[member_id] = (load, turn)
+        heapq.heappush(self._heap, (load, turn, member_id))
+        # Compactar cuando las entradas obsoletas superan a las vigentes
+        if len(self._heap) > 2 * len(self._entries) + 32:
+            self._heap = [(load, turn, member_id) for member_id, (load, turn) in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, member_id):
+        self._entries.pop(member_id, None)
+
+    def pop(self):
+        """Saca el artesano menos cargado: (artesano, carga, turno) o None."""
+        while self._heap:
+            load, turn, member_id = heapq.heappop(self._heap)
+            if self._entries.get(member_id) == (load, turn):
+                del self._entries[member_id]
+                return member_id, load, turn
+        return None
+
+class AssignmentDispatcher:
+    """
+    Elige el artesano de cada pedido nuevo en O(log n). La carga de un servidor se lee de Mongo una
+    sola vez (al primer pedido) y después se mantiene con las transiciones (/asignar, /completar).
+    Hay un montículo por servidor y rol base (los oficios del Herrero comparten el suyo); el empate
+    lo gana quien lleva más tiempo sin recibir un pedido.
+    """
+
+    def __init__(self, max_open, include_masters):
+        self.max_open = max_open
+        self.include_masters = include_masters
+        self._loads = {}      # guild_id -> {artesano: pedidos ASIGNADA}
+        self._opted_out = {}  # guild_id -> {artesanos con la asignación pausada}
+        self._heaps = {}      # guild_id -> {rol_base: WorkloadHeap}
+        self._turns = {}      # (guild_id, artesano) -> turno de su última asignación
+        self._counter = itertools.count(1)
+
+    async def _ensure_guild(self, guild_id):
+        if guild_id in self._loads:
+            return True
+        try:
+            state = await run_blocking(partial(load_assignment_state, guild_id))
+        except MongoUnavailable:
+            return False
+        if state is None:
+            return False
+        loads, opted_out = state
+        # Otro pedido pudo cargar el servidor mientras tanto: se conserva su estado
+        self._loads.setdefault(guild_id, loads)
+        self._opted_out.setdefault(guild_id, opted_out)
+        return True
+
+    def _is_eligible(self, member, base_role):
+        guild_id = str(member.guild.id)
+        if member.bot or str(member.id) in self._opted_out.get(guild_id, ()):
+            return False
+        role_ids = permission_resolver.profession_role_ids(member.guild, base_role, self.include_masters)
+        return any(role.id in role_ids for role in member.roles)
+
+    def _entry(self, guild_id, member_id):
+        return self._loads[guild_id].get(member_id, 0), self._turns.get((guild_id, member_id), 0)
+
+    def _heap(self, guild, base_role):
+        guild_id = str(guild.id)
+        heaps = self._heaps.setdefault(guild_id, {})
+        heap = heaps.get(base_role)
+        if heap is None:
+            heap = heaps[base_role] = WorkloadHeap()
+            opted_out = self._opted_out.get(guild_id, ())
+            for role_id in permission_resolver.profession_role_ids(guild, base_role, self.include_masters):
+                role = guild.get_role(role_id)
+                for member in (role.members if role else ()):
+                    member_id = str(member.id)
+                    if not member.bot and member_id not in opted_out and member_id not in heap:
+                        heap.push(member_id, *self._entry(guild_id, member_id))
+        return heap
+
+    def _refresh(self, guild_id, member_id):
+        """Reordena al artesano en los montículos del servidor en los que está."""
+        for heap in self._heaps.get(guild_id, {}).values():
+            if member_id in heap:
+                heap.push(member_id, *self._entry(guild_id, member_id))
+
+    async def pick(self, guild, oficio, exclude_id=None):
+        """
+        Asigna el pedido al artesano elegible menos cargado (nunca al solicitante) y le suma el pedido.
+        Retorna el Member, o None si nadie está por debajo del límite o no se pudo leer la carga.
+        """
+        base_role = get_role_from_profession(oficio)
+        guild_id = str(guild.id)
+        if base_role is None or not await self._ensure_guild(guild_id):
+            return None
+        heap = self._heap(guild, base_role)
+        skipped = []
+        chosen = None
+        while True:
+            entry = heap.pop()
+            if entry is None:
+                break
+            member_id, load, _ = entry
+            if self.max_open and load >= self.max_open:
+                skipped.append(entry) # El menos cargado ya está en el límite: el resto también
+                break
+            member = guild.get_member(int(member_id))
+            if member is None:
+                continue # Dejó el servidor: sale del montículo
+            skipped.append(entry)
+            if member_id != exclude_id:
+                chosen = member
+                break
+        for entry in skipped:
+            heap.push(*entry)
+        if chosen is not None:
+            self.acquire(guild_id, str(chosen.id))
+        return chosen
+
+    def acquire(self, guild_id, member_id):
+        """Un pedido pasó a ASIGNADA con este artesano."""
+        loads = self._loads.get(guild_id)
+        if loads is None:
+            return # Servidor aún no cargado: la carga se leerá de Mongo con este pedido incluido
+        loads[member_id] = loads.get(member_id, 0) + 1
+        self._turns[(guild_id, member_id)] = next(self._counter)
+        self._refresh(guild_id, member_id)
+
+    def release(self, guild_id, member_id):
+        """Un pedido ASIGNADA de este artesano dejó de estarlo."""
+        loads = self._loads.get(guild_id)
+        if loads is None or not member_id:
+            return
+        loads[member_id] = max(loads.get(member_id, 0) - 1, 0)
+        self._refresh(guild_id, member_id)
+
+    def record_transition(self, guild_id, previous, new_assignee=None):
+        """Aplica una transición a partir del pedido anterior a ella (estatus y asignado_a_id)."""
+        if previous.estatus == "ASIGNADA":
+            self.release(guild_id, previous.asignado_a_id)
+        if new_assignee:
+            self.acquire(guild_id, new_assignee)
+
+    def set_available(self, member, available):
+        guild_id = str(member.guild.id)
+        opted_out = self._opted_out.get(guild_id)
+        if opted_out is None:
+            return # Se leerá de Mongo al cargar el servidor
+        (opted_out.discard if available else opted_out.add)(str(member.id))
+        self.sync_member(member)
+
+    def sync_member(self, member):
+        """Añade o saca al miembro de los montículos ya construidos según sus roles actuales."""
+        guild_id = str(member.guild.id)
+        member_id = str(member.id)
+        for base_role, heap in self._heaps.get(guild_id, {}).items():
+            if not self._is_eligible(member, base_role):
+                heap.discard(member_id)
+            elif member_id not in heap:
+                heap.push(member_id, *self._entry(guild_id, member_id))
+
+    def invalidate_guild(self, guild_id):
+        """Los roles del servidor cambiaron: los montículos se reconstruyen (la carga se conserva)."""
+        self._heaps.pop(str(guild_id), None)
+
+assignment_dispatcher = services.get(
+    "assignment_dispatcher", lambda: AssignmentDispatcher(AUTO_ASSIGN_MAX_OPEN, AUTO_ASSIGN_MASTERS)
+)
+
+# --- REGISTROS TIPADOS ---
+# Las consultas de listados y transiciones proyectan solo los campos que usa cada vista y
+# devuelven registros compactos (__slots__) en lugar de diccionarios BSON completos.
+class OrderRecord:
+    """Pedido con los campos proyectados; los que no se pidieron quedan en None."""
+    __slots__ = (
+        "id", "item_name", "level", "quality", "cantidad", "oficio_requerido",
+        "solicitante_id", "asignado_a_id", "estatus", "codigo"
+    )
+
+    def __init__(self, doc):
+        order_view(doc)
+        self.id = doc.get("_id")
+        self.item_name = doc.get("item_name")
+        self.level = doc.get("level")
+        self.quality = doc.get("quality")
+        self.cantidad = doc.get("cantidad")
+        self.oficio_requerido = doc.get("oficio_requerido")
+        self.solicitante_id = doc.get("solicitante_id")
+        self.asignado_a_id = doc.get("asignado_a_id")
+        self.estatus = doc.get("estatus")
+        self.codigo = doc.get("codigo")
+
+    @property
+    def code(self):
+        """Código visible del pedido (los anteriores a los códigos cortos muestran su ObjectId)."""
+        return self.codigo or str(self.id)
+
+class InventoryRecord:
+    """Ítem del inventario: nombre y cantidad."""
+    __slots__ = ("name", "quantity")
+
+    def __init__(self, doc):
+        self.name = doc.get("name", "Ítem Desconocido")
+        self.quantity = doc.get("quantity", 0)
+
+# Proyecciones por vista (_id se incluye por defecto)
+USER_ORDERS_PROJECTION = {"item_name": 1, "quality": 1, "level": 1, "cantidad": 1, "asignado_a_id": 1, "estatus": 1, "codigo": 1}
+MANAGED_ORDERS_PROJECTION = dict(USER_ORDERS_PROJECTION, solicitante_id=1)
+# Las transiciones devuelven el pedido anterior al cambio: estatus y asignado_a_id mantienen la carga de trabajo
+TRANSITION_PROJECTION = {"item_name": 1, "solicitante_id": 1, "codigo": 1, "estatus": 1, "asignado_a_id": 1}
+BULK_TRANSITION_PROJECTION = dict(TRANSITION_PROJECTION, oficio_requerido=1)
+ACTIONABLE_ORDERS_PROJECTION = {"item_name": 1, "quality": 1, "cantidad": 1, "estatus": 1, "codigo": 1}
+INVENTORY_PROJECTION = {"name": 1, "quantity": 1, "_id": 0}
+
+def get_user_orders(guild_id, user_id, page=0, include_history=False, page_size=10):
+    """
+    Obtiene los pedidos realizados por un usuario en un servidor, del más reciente al más antiguo.
+    Con include_history=True, al agotarse los pedidos activos la paginación continúa
+    en la colección de archivo (pedidos entregados hace tiempo).
+    """
+    try:
+        query = {"guild_id": guild_id, "solicitante_id": user_match(user_id)}
+        offset = page * page_size
+
+        # Busca los pedidos donde el solicitante_id coincide con el ID de Discord
+        orders = [
+            OrderRecord(doc) for doc in
+            pedidos_lectura_col.find(query, USER_ORDERS_PROJECTION).sort("fecha_solicitud", -1).skip(offset).limit(page_size)
+        ]
+        if not include_history or len(orders) == page_size:
+            return orders
+
+        # La página continúa en el archivo: calculamos cuántos archivados saltar
+        archive_offset = max(0, offset - pedidos_lectura_col.count_documents(query))
+        archived = pedidos_archivo_lectura_col.find(query, USER_ORDERS_PROJECTION).sort("fecha_solicitud", -1).skip(archive_offset).limit(page_size - len(orders))
+        return orders + [OrderRecord(doc) for doc in archived]
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_user_orders", "error": str(e)})
+        return []
+
+def archive_delivered_orders_batch(cutoff, batch_size):
+    """
+    Mueve un lote de pedidos ENTREGADOS antes de 'cutoff' a la colección de archivo.
+    Es idempotente: si un lote se interrumpe, los duplicados del reintento se ignoran.
+    Retorna la cantidad de pedidos movidos (0 cuando ya no quedan).
+    """
+    try:
+        query = {
+            "estatus": status_match("ENTREGADA"),
+            "$or": [
+                {"fecha_entrega": {"$lt": cutoff}},
+                # Pedidos entregados antes de que existiera fecha_entrega
+                {"fecha_entrega": {"$exists": False}, "fecha_solicitud": {"$lt": cutoff}},
+            ]
+        }
+        batch = list(pedidos_col.find(query).limit(batch_size))
+        if not batch:
+            return 0
+
+        try:
+            pedidos_archivo_col.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Solo toleramos claves duplicadas (lote ya copiado en un intento anterior)
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+        pedidos_col.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}, "estatus": status_match("ENTREGADA")})
+        return len(batch)
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "archive_delivered_orders_batch", "error": str(e)})
+        return 0
+
+def get_managed_orders(guild_id, query_type, identifier):
+    """
+    Obtiene pedidos del servidor según el rol. Si identifier es una LISTA, usa $in.
+    """
+    try:
+        if query_type == 'profession':
+            # 🛠️ LÓGICA DE BÚSQUEDA DEL OFICIO
+            if isinstance(identifier, list):
+                # Si identifier es una lista (Herrero), usa $in para buscar múltiples oficios
+                profession_query = {"$in": identifier}
+            else:
+                # Si es una cadena (Sastrería, Peletería), usa la búsqueda normal
+                profession_query = identifier
+
+            query = {
+                "guild_id": guild_id,
+                "estatus": status_match(*ESTADOS_ABIERTOS),
+                "oficio_requerido": profession_query # <-- CAMBIO APLICADO AQUÍ
+            }
+        elif query_type == 'worker_id':
+            # Subditos: ver todos los pedidos ASIGNADOS a ellos
+            query = {
+                "guild_id": guild_id,
+                "asignado_a_id": user_match(identifier),
+                # Estatus: Ver asignados que aún no estén COMPLETED o CANCELADO
+                "estatus": status_match("LISTO PARA RECOGER", "ASIGNADA")
+            }
+        else:
+            return []
+
+        orders = pedidos_lectura_col.find(query, MANAGED_ORDERS_PROJECTION).sort("fecha_solicitud", -1).limit(20)
+        return [OrderRecord(doc) for doc in orders]
+        
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_managed_orders", "error": str(e)})
+        return []
+
+def get_actionable_orders(query, code_prefix, limit=25, skip=0):
+    """
+    Pedidos sobre los que el usuario puede actuar (autocompletado de pedido_id y listas de /asignarvarios
+    y /completarvarios), los más antiguos primero. La query llega ya acotada por oficio, artesano o
+    solicitante, así que la resuelven los índices de pedidos.
+    """
+    try:
+        if code_prefix:
+            query = dict(query, codigo={"$regex": f"^{re.escape(code_prefix.strip().upper())}"})
+        orders = pedidos_lectura_col.find(query, ACTIONABLE_ORDERS_PROJECTION).sort("fecha_solicitud", 1).skip(skip).limit(limit)
+        return [OrderRecord(doc) for doc in orders]
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_actionable_orders", "error": str(e)})
+        return []
+
+def bulk_order_transition(query, order_ids, estatus, fields=None):
+    """
+    Aplica la misma transición a varios pedidos con una lectura y un solo bulk_write. Cada UpdateOne
+    repite la condición de acceso ('query') y además fija el estatus y el artesano leídos: si otro
+    usuario cambió el pedido entretanto, esa escritura no coincide y el pedido se salta.
+    Retorna los pedidos anteriores al cambio (OrderRecord) que se aplicaron, o None si falla Mongo.
+    """
+    try:
+        ids = [ObjectId(order_id) for order_id in order_ids if OBJECT_ID_PATTERN.fullmatch(order_id)]
+        selected = list(pedidos_col.find({**query, "_id": {"$in": ids}}, BULK_TRANSITION_PROJECTION))
+        if not selected:
+            return []
+
+        # Mongo guarda milisegundos: con la misma fecha_estado se reconocen después las escrituras propias
+        now = discord.utils.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        operations = [
+            UpdateOne(
+                {**query, "_id": doc["_id"], "estatus": doc.get("estatus"), "asignado_a_id": doc.get("asignado_a_id")},
+                order_state_update(estatus, fields, oficio=doc.get("oficio_requerido"), now=now)
+            )
+            for doc in selected
+        ]
+        result = pedidos_col.bulk_write(operations, ordered=False)
+
+        if result.matched_count < len(operations):
+            # Alguno cambió entre la lectura y la escritura: una lectura más separa los aplicados
+            applied = {
+                doc["_id"] for doc in pedidos_col.find({"_id": {"$in": [doc["_id"] for doc in selected]}, "fecha_estado": now}, {"_id": 1})
+            }
+            selected = [doc for doc in selected if doc["_id"] in applied]
+        return [OrderRecord(doc) for doc in selected]
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "bulk_order_transition", "error": str(e)})
+        return None
+
+def check_item_exists(name):
+    """Verifica si un ítem existe en la colección maestra de recetas."""
+    try:
+        # Busca el documento, proyectando solo el _id para eficiencia.
+        return items_col.find_one({"name": name}, {"_id": 1}) is not None
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "check_item_exists", "error": str(e)})
+        return False
+
+
+def get_full_inventory(guild_id):
+    """Obtiene todos los ítems y cantidades del inventario del servidor ordenados alfabéticamente."""
+    try:
+        # Usamos .sort("name", 1) para ordenar por el campo 'name' en orden ascendente (alfabético)
+        # Solo ítems con stock (los que se muestran) y solo nombre y cantidad; el índice (guild_id, name) da el orden
+        inventory = inventario_lectura_col.find({"guild_id": guild_id, "quantity": {"$gt": 0}}, INVENTORY_PROJECTION).sort("name", 1) 
+        return [InventoryRecord(doc) for doc in inventory]
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_full_inventory", "error": str(e)})
+        return []
+
+def set_inventory_quantity(guild_id, item_name, new_quantity, user_id=None, command=None):
+    """
+    Establece la cantidad de un ítem en el inventario al valor exacto (new_quantity).
+    Si new_quantity es <= 0, el ítem se elimina del inventario.
+    Retorna (resultado, movimiento) donde movimiento es el registro para el historial.
+    """
+    try:
+        if new_quantity <= 0:
+            # Si la cantidad es cero o negativa, eliminamos el ítem para limpiar el inventario
+            previous_doc = inventario_col.find_one_and_delete({"guild_id": guild_id, "name": item_name}, {"quantity": 1})
+            result, final_quantity = "DELETED", 0
+        else:
+            # 🟢 CORRECCIÓN: Usamos $set para reemplazar el valor de 'quantity'
+            # ReturnDocument.BEFORE nos da la cantidad anterior en la misma operación (para el historial)
+            previous_doc = inventario_col.find_one_and_update(
+                {"guild_id": guild_id, "name": item_name},
+                {"$set": {"quantity": new_quantity}},
+                projection={"quantity": 1},
+                upsert=True, # Si el ítem no existe (aunque no debería pasar con el autocomplete), lo crea.
+                return_document=ReturnDocument.BEFORE
+            )
+            result, final_quantity = "SUCCESS", new_quantity
+
+        previous_quantity = previous_doc.get("quantity", 0) if previous_doc else 0
+        movement = build_inventory_movement(
+            guild_id, item_name, final_quantity - previous_quantity, final_quantity, user_id=user_id, command=command
+        )
+        return result, movement
+
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "set_inventory_quantity", "error": str(e)})
+        return "ERROR", None
+
+def get_inventory_history(guild_id, item_name, limit=10):
+    """Obtiene los últimos movimientos de un ítem (usa el índice (guild_id, name, timestamp))."""
+    try:
+        movements = inventario_movimientos_lectura_col.find(
+            {"guild_id": guild_id, "name": item_name},
+            {"_id": 0}
+        ).sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(limit)
+        return list(movements)
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_inventory_history", "error": str(e)})
+        return []
+
+def get_inventory_quantity_at(guild_id, item_name, when):
+    """
+    Reconstruye la cantidad de un ítem en un momento dado.
+    Cada movimiento guarda la cantidad resultante, así que basta con el último
+    movimiento (o checkpoint) anterior a 'when': una sola consulta indexada.
+    """
+    try:
+        query = {"guild_id": guild_id, "name": item_name, "timestamp": {"$lte": when}}
+        for collection in (inventario_movimientos_col, inventario_checkpoints_col):
+            # _id desempata los movimientos de una misma ventana (se insertan en orden)
+            doc = collection.find_one(query, {"quantity": 1, "_id": 0}, sort=[("timestamp", DESCENDING), ("_id", DESCENDING)])
+            if doc:
+                return doc.get("quantity", 0)
+        return 0
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "get_inventory_quantity_at", "error": str(e)})
+        return None
+
+def compact_inventory_ledger(cutoff):
+    """
+    Compacta los movimientos anteriores a 'cutoff': por cada ítem guarda un checkpoint
+    con la última cantidad conocida y borra esos movimientos del historial.
+    """
+    try:
+        pipeline = [
+            {"$match": {"timestamp": {"$lt": cutoff}}},
+            {"$sort": {"guild_id": 1, "name": 1, "timestamp": 1, "_id": 1}},
+            {"$group": {
+                "_id": {"guild_id": "$guild_id", "name": "$name"},
+                "timestamp": {"$last": "$timestamp"},
+                "quantity": {"$last": "$quantity"},
+                "movimientos": {"$sum": 1},
+            }},
+        ]
+        checkpoints = [
+            {"guild_id": doc["_id"]["guild_id"], "name": doc["_id"]["name"], "timestamp": doc["timestamp"], "quantity": doc["quantity"], "movimientos": doc["movimientos"]}
+            for doc in inventario_movimientos_col.aggregate(pipeline)
+        ]
+        if not checkpoints:
+            return 0
+
+        inventario_checkpoints_col.insert_many(checkpoints, ordered=False)
+        # Los checkpoints ya están guardados: podemos borrar los movimientos que resumen
+        result = inventario_movimientos_col.delete_many({"timestamp": {"$lt": cutoff}})
+        return result.deleted_count
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "compact_inventory_ledger", "error": str(e)})
+        return 0
+
+# --- EXPORTACIÓN DEL HISTORIAL DE PEDIDOS ---
+EXPORT_FIELDS = (
+    "codigo", "item_name", "level", "quality", "cantidad", "oficio_requerido", "estatus",
+    "solicitante_id", "asignado_a_id", "fecha_solicitud", "fecha_estado", "fecha_entrega"
+)
+EXPORT_PROJECTION = {field: 1 for field in EXPORT_FIELDS}
+
+def order_export_cursors(guild_id, oficios, estatus=None, desde=None, hasta=None, batch_size=1000):
+    """
+    Cursores (perezosos: aún no consultan) de los pedidos a exportar: los activos y, si el filtro de
+    estado admite ENTREGADA, los archivados. Las fechas filtran por fecha_solicitud [desde, hasta).
+    """
+    query = {"guild_id": guild_id, "oficio_requerido": {"$in": oficios}}
+    if estatus:
+        query["estatus"] = status_match(estatus)
+    if desde or hasta:
+        query["fecha_solicitud"] = {
+            **({"$gte": desde} if desde else {}), **({"$lt": hasta} if hasta else {})
+        }
+    collections = [pedidos_lectura_col]
+    if estatus in (None, "ENTREGADA"):
+        collections.append(pedidos_archivo_lectura_col)
+    return [collection.find(query, EXPORT_PROJECTION).batch_size(batch_size) for collection in collections]
+
+def export_row(doc):
+    """Campos exportados de un pedido como texto plano (fechas en ISO 8601 UTC)."""
+    order_view(doc)
+    row = {"id": str(doc["_id"])}
+    for field in EXPORT_FIELDS:
+        value = doc.get(field)
+        row[field] = as_utc(value).isoformat() if isinstance(value, datetime) else value
+    return row
+
+class OrderExportWriter:
+    """
+    Escribe pedidos en archivos .jsonl.gz o .csv.gz a medida que llegan del cursor: en memoria solo
+    está el lote en curso. Cuando la parte abierta alcanza part_bytes (comprimidos) se cierra y
+    queda en ready_parts para enviarla y borrarla mientras se escribe la siguiente.
+    """
+
+    def __init__(self, directory, basename, fmt, part_bytes):
+        self.directory = directory
+        self.basename = basename
+        self.fmt = fmt
+        self.part_bytes = part_bytes
+        self.ready_parts = [] # Partes cerradas pendientes de enviar
+        self.part_count = 0
+        self.rows = 0
+        self._path = self._raw = self._text = self._csv = None
+
+    def _open_part(self):
+        self.part_count += 1
+        self._path = os.path.join(self.directory, f"{self.basename}-{self.part_count:03d}.{self.fmt}.gz")
+        self._raw = open(self._path, "wb")
+        self._text = io.TextIOWrapper(gzip.GzipFile(fileobj=self._raw, mode="wb"), encoding="utf-8", newline="")
+        if self.fmt == "csv":
+            self._csv = csv.DictWriter(self._text, fieldnames=("id",) + EXPORT_FIELDS)
+            self._csv.writeheader()
+
+    def _close_part(self):
+        try:
+            self._text.close() # Cierra el GzipFile (escribe el final del stream), no el archivo
+        finally:
+            self._raw.close()
+        self.ready_parts.append(self._path)
+        self._path = self._raw = self._text = self._csv = None
+
+    def write(self, doc):
+        if self._raw is None:
+            self._open_part()
+        row = export_row(doc)
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._text.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.rows += 1
+        # El tamaño del archivo va por detrás de lo escrito (búferes de texto y de zlib): el límite
+        # se puede superar en unos pocos KB
+        if self._raw.tell() >= self.part_bytes:
+            self._close_part()
+
+    def close(self):
+        if self._raw is not None:
+            self._close_part()
+
+    def discard(self):
+        """Cierra la parte abierta y borra del disco las partes que no se llegaron a enviar."""
+        try:
+            self.close()
+        finally:
+            for path in self.ready_parts:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.ready_parts.clear()
+
+def export_orders_batch(cursor, writer, batch_size):
+    """
+    Escribe hasta batch_size pedidos del cursor (un lote por llamada al hilo).
+    Retorna cuántos escribió, o None si falló la consulta.
+    """
+    written = 0
+    try:
+        for doc in cursor:
+            writer.write(doc)
+            written += 1
+            if written >= batch_size:
+                break
+        return written
+    except Exception as e:
+        mongo_log.error("ERROR DE MONGO", extra={"operation": "export_orders", "error": str(e)})
+        return None
@@ -0,0 +1 @@
+# Extensiones de discord.py (ver core.EXTENSIONS); se recargan con /recargar
@@ -0,0 +1,261 @@
+# extensions/admin.py - Diagnóstico y mantenimiento: /ping, /perfil, /recargarcatalogo y /recargar
+import io
+import gc
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+import discord
+from discord import app_commands
+from functools import partial
+
+from core import (
+    PROFILE_MAX_SECONDS, PROFILE_SAMPLE_MS, TRACEMALLOC_FRAMES,
+    bot, cache_bus, client, elapsed_ms, log, permission_resolver, reload_code, respond, run_blocking, services,
+)
+from datos import catalog_cache
+
+# --- /Ping ---
+@app_commands.command(name="ping", description="Responde con Ping y verifica la BD.")
+async def ping_command(interaction: discord.Interaction):
+    try:
+        # Ping en un hilo (con el circuito abierto falla al instante, sin bloquear el loop)
+        await run_blocking(partial(client.admin.command, "ping"))
+        db_status = "✅ BD Conectada y funcionando."
+    except Exception:
+        db_status = "❌ BD Desconectada o error de consulta."
+        
+    await respond(interaction).send_message(f"Pong! {db_status}", ephemeral=True)
+
+# --- PERFILADO EN PRODUCCIÓN (SOLO PROPIETARIO) ---
+class SamplingProfiler:
+    """
+    Perfilador de CPU por muestreo. Un hilo propio lee cada intervalo las pilas de todos los hilos
+    (sys._current_frames): el event loop con todos los handlers y los hilos del executor. Cuesta
+    casi nada con el bot en marcha, a diferencia de cProfile, que instrumenta cada llamada.
+    """
+
+    def __init__(self, interval_seconds):
+        self.interval_seconds = interval_seconds
+        self._thread = None
+        self._stop = threading.Event()
+        self.run_id = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.run_id += 1
+        self._stop.clear()
+        self._samples = 0
+        self._self_counts = {}
+        self._total_counts = {}
+        self._thread_counts = {}
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="cpu-profiler", daemon=True)
+        self._thread.start()
+        return self.run_id
+
+    def stop(self):
+        """Detiene el muestreo y devuelve el informe en texto."""
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return self._report(time.monotonic() - self._started)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._samples += 1
+                name = thread_names.get(thread_id, str(thread_id))
+                self._thread_counts[name] = self._thread_counts.get(name, 0) + 1
+
+                location = (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+                self._self_counts[location] = self._self_counts.get(location, 0) + 1
+                # Acumulado: cada función cuenta una vez por muestra aunque sea recursiva
+                seen = set()
+                while frame is not None:
+                    function = (frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+                    if function not in seen:
+                        seen.add(function)
+                        self._total_counts[function] = self._total_counts.get(function, 0) + 1
+                    frame = frame.f_back
+
+    def _report(self, duration):
+        samples = self._samples or 1
+        lines = [
+            f"Perfil de CPU por muestreo: {duration:.1f} s, intervalo {self.interval_seconds * 1000:g} ms, {self._samples} muestras",
+            "",
+            "Muestras por hilo:",
+        ]
+        for name, count in sorted(self._thread_counts.items(), key=lambda entry: -entry[1]):
+            lines.append(f"  {count:>7}  {count * 100 / samples:5.1f}%  {name}")
+        lines += ["", "Propio (línea en ejecución):"]
+        for (filename, lineno, function), count in sorted(self._self_counts.items(), key=lambda entry: -entry[1])[:30]:
+            lines.append(f"  {count:>7}  {count * 100 / samples:5.1f}%  {function}  {filename}:{lineno}")
+        lines += ["", "Acumulado (función en la pila):"]
+        for (filename, lineno, function), count in sorted(self._total_counts.items(), key=lambda entry: -entry[1])[:30]:
+            lines.append(f"  {count:>7}  {count * 100 / samples:5.1f}%  {function}  {filename}:{lineno}")
+        return "\n".join(lines)
+
+# El perfil en curso y la instantánea de referencia sobreviven a /recargar
+cpu_profiler = services.get("cpu_profiler", lambda: SamplingProfiler(PROFILE_SAMPLE_MS / 1000))
+memory_snapshots = services.get("memory_snapshots", dict) # "last" -> instantánea anterior de tracemalloc
+
+def memory_report():
+    """Instantánea de tracemalloc: mayores asignaciones, crecimiento desde la anterior y objetos vivos."""
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"Memoria rastreada: {current / 1024 / 1024:.1f} MiB (pico {peak / 1024 / 1024:.1f} MiB)", ""]
+
+    lines.append("Mayores asignaciones (por línea):")
+    for stat in snapshot.statistics("lineno")[:25]:
+        frame = stat.traceback[0]
+        lines.append(f"  {stat.size / 1024:>10.1f} KiB  {stat.count:>8}  {frame.filename}:{frame.lineno}")
+
+    last_snapshot = memory_snapshots.get("last")
+    if last_snapshot is not None:
+        lines += ["", "Crecimiento desde la instantánea anterior:"]
+        for stat in snapshot.compare_to(last_snapshot, "lineno")[:25]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size_diff / 1024:>+10.1f} KiB  {stat.count_diff:>+8}  {frame.filename}:{frame.lineno}")
+    memory_snapshots["last"] = snapshot
+
+    # Objetos que suelen acumularse: vistas/formularios sin terminar y miembros en caché
+    views = modals = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, discord.ui.Modal):
+            modals += 1
+        elif isinstance(obj, discord.ui.View):
+            views += 1
+    lines += [
+        "",
+        "Objetos vivos:",
+        f"  discord.ui.View:  {views}",
+        f"  discord.ui.Modal: {modals}",
+        f"  Miembros en caché: {sum(len(guild.members) for guild in bot.guilds)} ({len(bot.guilds)} servidores)",
+        f"  Usuarios en caché: {len(bot.users)}",
+        f"  Contextos de permisos en caché: {len(permission_resolver._members)}",
+    ]
+    return "\n".join(lines)
+
+def report_file(text, filename):
+    return discord.File(io.BytesIO(text.encode("utf-8")), filename=filename)
+
+async def is_bot_owner(interaction: discord.Interaction):
+    return await bot.is_owner(interaction.user)
+
+profile_group = app_commands.Group(
+    name="perfil",
+    description="Perfilado de CPU y memoria del bot en marcha (solo propietario).",
+    default_permissions=discord.Permissions(administrator=True)
+)
+
+@profile_group.command(name="cpu", description="Perfila la CPU por muestreo durante N segundos y envía el informe.")
+@app_commands.describe(segundos="Duración del muestreo (se puede cortar antes con /perfil detener).")
+@app_commands.check(is_bot_owner)
+async def profile_cpu_command(interaction: discord.Interaction, segundos: app_commands.Range[int, 1, PROFILE_MAX_SECONDS]):
+    if cpu_profiler.running:
+        await respond(interaction).send_message("⚠️ Ya hay un perfil de CPU en curso. Usa **/perfil detener**.", ephemeral=True)
+        return
+
+    run_id = cpu_profiler.start()
+    await respond(interaction).send_message(f"⏱️ Perfilando la CPU durante **{segundos}** s...", ephemeral=True)
+
+    await asyncio.sleep(segundos)
+    if cpu_profiler.running and cpu_profiler.run_id == run_id: # No se detuvo antes con /perfil detener
+        report = cpu_profiler.stop()
+        await interaction.followup.send("📈 Perfil de CPU terminado.", file=report_file(report, "perfil_cpu.txt"), ephemeral=True)
+
+@profile_group.command(name="detener", description="Detiene el perfil de CPU en curso y envía el informe.")
+@app_commands.check(is_bot_owner)
+async def profile_stop_command(interaction: discord.Interaction):
+    if not cpu_profiler.running:
+        await respond(interaction).send_message("ℹ️ No hay ningún perfil de CPU en curso.", ephemeral=True)
+        return
+    report = cpu_profiler.stop()
+    await respond(interaction).send_message("📈 Perfil de CPU detenido.", file=report_file(report, "perfil_cpu.txt"), ephemeral=True)
+
+@profile_group.command(name="memoria", description="Toma una instantánea de memoria y la compara con la anterior.")
+@app_commands.check(is_bot_owner)
+async def profile_memory_command(interaction: discord.Interaction):
+    if not tracemalloc.is_tracing():
+        # El rastreo empieza con la primera llamada: esta instantánea sirve de base para las siguientes
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        await respond(interaction).send_message(
+            "🧠 Rastreo de memoria activado. Vuelve a usar **/perfil memoria** para ver asignaciones y crecimiento.",
+            ephemeral=True
+        )
+        return
+
+    await respond(interaction).defer(ephemeral=True, thinking=True)
+    report = await bot.loop.run_in_executor(None, memory_report)
+    await interaction.followup.send("🧠 Informe de memoria.", file=report_file(report, "perfil_memoria.txt"), ephemeral=True)
+
+@profile_group.error
+async def profile_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.CheckFailure):
+        await respond(interaction).send_message("🔒 Solo el propietario del bot puede usar los comandos de perfilado.", ephemeral=True)
+
+@app_commands.command(name="recargarcatalogo", description="Descarta la caché del catálogo en todos los procesos del bot (solo propietario).")
+@app_commands.default_permissions(administrator=True)
+@app_commands.check(is_bot_owner)
+async def reload_catalog_command(interaction: discord.Interaction):
+    catalog_cache.invalidate()
+    await cache_bus.publish("catalog")
+    scope = "todos los procesos" if cache_bus.enabled else "este proceso"
+    await respond(interaction).send_message(f"♻️ Caché del catálogo descartada en {scope}.", ephemeral=True)
+
+@reload_catalog_command.error
+async def reload_catalog_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.CheckFailure):
+        await respond(interaction).send_message("🔒 Solo el propietario del bot puede recargar el catálogo.", ephemeral=True)
+
+# --- /recargar ---
+@app_commands.command(name="recargar", description="Recarga comandos y consultas sin reconectar el bot (solo propietario).")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(sincronizar="Vuelve a registrar los comandos en Discord (solo si cambiaron nombres u opciones).")
+@app_commands.check(is_bot_owner)
+async def reload_command(interaction: discord.Interaction, sincronizar: bool = False):
+    await respond(interaction).defer(ephemeral=True, thinking=True)
+    started = time.perf_counter()
+    try:
+        timings = await reload_code()
+        if sincronizar:
+            await bot.tree.sync()
+    except Exception as e:
+        log.error("Error al recargar el código", exc_info=e)
+        await interaction.followup.send(f"❌ Error al recargar: `{type(e).__name__}: {e}`"[:2000], ephemeral=True)
+        return
+
+    total_ms = elapsed_ms(started)
+    log.info("Código recargado", extra={"total_ms": total_ms, "modules": timings, "synced": sincronizar})
+    lines = [f"`{name}`: {ms} ms" for name, ms in timings.items()]
+    await interaction.followup.send(
+        f"♻️ Código recargado en **{total_ms} ms** (sin reconectar el gateway).\n" + "\n".join(lines),
+        ephemeral=True
+    )
+
+@reload_command.error
+async def reload_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.CheckFailure):
+        await respond(interaction).send_message("🔒 Solo el propietario del bot puede recargar el código.", ephemeral=True)
+
+COMMANDS = [ping_command, profile_group, reload_catalog_command, reload_command]
+
+async def setup(bot):
+    for command in COMMANDS:
+        bot.tree.add_command(command)
+
+async def teardown(bot):
+    for command in COMMANDS:
+        bot.tree.remove_command(command.name)
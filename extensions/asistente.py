@@ -0,0 +1,503 @@
+# extensions/asistente.py - Asistente de /crearpedido: pasos del catálogo, listas paginadas y formulario final
+import discord
+from discord import SelectOption, app_commands
+from functools import partial
+
+from core import AUTO_ASSIGN, TracedComponent, admission_control, command_log, items_col, mongo_log, respond, run_blocking
+from datos import (
+    assignment_dispatcher, catalog_cache, get_final_recipe_data, insert_pedido, new_order_code, order_journal, reminder_fields,
+)
+
+# ==============================================================================
+# SECCIÓN 6: CALLBACKS DE INTERACCIÓN (MANEJO DE MENÚS DESPLEGABLES)
+# ==============================================================================
+
+# Función que se ejecuta cuando el usuario selecciona el Nombre del Ítem (Paso 3)
+async def item_name_select_callback(interaction: discord.Interaction, state):
+    # El valor es el recipe_id (Ej: ARM_TELA_ALBA_CLERIGO)
+    selected_recipe_id = interaction.data['values'][0] 
+    
+    # 1. Obtener la receta completa (Necesaria para extraer las variations)
+    def get_full_recipe(recipe_id):
+        try:
+            # Buscamos por el recipe_id
+            return items_col.find_one({"recipe_id": recipe_id})
+        except Exception as e:
+            mongo_log.error("ERROR DE MONGO", extra={"operation": "get_full_recipe", "error": str(e)})
+            return None
+    
+    full_recipe = await run_blocking(
+        partial(get_full_recipe, selected_recipe_id)
+    )
+    
+    if not full_recipe or not full_recipe.get('variations'):
+        await respond(interaction).edit_message(content="❌ Error: La receta no tiene niveles (variations) definidos.", view=None)
+        return
+
+    # 2. Construir las Opciones de Nivel (Ej: III, IV)
+    level_options = []
+    for variation in full_recipe.get('variations'):
+        level_name = variation.get('level_name')
+        
+        # El valor ahora contiene el recipe_id y el nivel
+        option_value = f"{selected_recipe_id}|{level_name}" 
+        
+        level_options.append(SelectOption(label=f"Nivel {level_name}", value=option_value))
+
+    # 3. Crear el Select Menu (Paso 4: Nivel) y 4. su vista sin estado
+    view = build_wizard_view(WizardSelect(
+        "lvl",
+        placeholder=f"Selecciona el Nivel para {full_recipe['name']}...",
+        options=level_options
+    ))
+    
+    # 5. Actualizar el mensaje
+    await respond(interaction).edit_message(
+        content=f"**⚙️ Nuevo Pedido:**\n**Paso 4:** Selecciona el Nivel de Crafteo:", 
+        view=view
+    )
+
+# Función que se ejecuta cuando el usuario selecciona el Nivel (Paso 4)
+async def level_select_callback(interaction: discord.Interaction, state):
+    
+    # El valor viene como "recipe_id|level_name"
+    recipe_id, level_name = interaction.data['values'][0].split('|')
+    
+    # 1. Obtener la receta completa (Necesaria para las quality_options)
+    def get_recipe_and_variation(r_id, l_name):
+        full_recipe = items_col.find_one({"recipe_id": r_id})
+        if not full_recipe: return None
+        
+        # Encontrar el objeto 'variation' específico para el nivel
+        for var in full_recipe.get('variations', []):
+            if var.get('level_name') == l_name:
+                return {
+                    "recipe_id": r_id,
+                    "level_name": l_name,
+                    "name": full_recipe.get('name'),
+                    "quality_options": var.get('quality_options', [])
+                }
+        return None
+        
+    recipe_data = await run_blocking(
+        partial(get_recipe_and_variation, recipe_id, level_name)
+    )
+
+    if not recipe_data or not recipe_data['quality_options']:
+        await respond(interaction).edit_message(content="❌ Error: No se encontraron opciones de calidad para este nivel.", view=None)
+        return
+
+    # 2. Construir las Opciones de Calidad (Común, Poco Común, Rara)
+    quality_options = [
+        SelectOption(label=q['quality_name'], value=q['quality_name']) 
+        for q in recipe_data['quality_options']
+    ]
+    
+    # 3. Crear el Select Menu (Paso 5: Calidad)
+    # El estado "recipe_id|level_name" viaja en el custom_id para el formulario final (Paso 6)
+    view = build_wizard_view(WizardSelect(
+        "q",
+        f"{recipe_id}|{level_name}",
+        placeholder=f"Selecciona la Calidad...",
+        options=quality_options
+    ))
+    
+    # 5. Actualizar el mensaje
+    await respond(interaction).edit_message(
+        content=f"**⚙️ Nuevo Pedido:**\n**Paso 5:** Selecciona la Calidad deseada:", 
+        view=view
+    )
+
+
+# Función que se ejecutará cuando el usuario seleccione un Tipo (Paso 3)
+async def type_select_callback(interaction: discord.Interaction, state):
+    selected_type = interaction.data['values'][0]
+    # La categoría elegida en el Paso 1 viaja en el custom_id (como clave corta si es muy larga)
+    selected_category = await catalog_cache.resolve_category_key(state)
+    if selected_category is None:
+        await respond(interaction).edit_message(content="❌ Este menú ya no es válido. Usa **/crearpedido** de nuevo.", view=None)
+        return
+    
+    # 1. Mostrar la primera página de recetas de la Categoría y Tipo (Paso 3: Nombre del Ítem)
+    item_key = catalog_cache.item_key(selected_category, selected_type)
+    step = await build_catalog_step("item", item_key)
+
+    if step is None:
+        await respond(interaction).edit_message(content=f"❌ Error: No se encontraron nombres de ítems para '{selected_type}'.", view=None)
+        return
+
+    # 2. Actualizar el mensaje
+    content, view = step
+    await respond(interaction).edit_message(content=content, view=view)
+
+# Función que se ejecuta cuando el usuario selecciona una categoría
+async def category_select_callback(interaction: discord.Interaction, state):
+    
+    selected_category = interaction.data['values'][0]
+
+    # 1. Obtener la primera página de 'tipos' de esa 'category' (desde la caché del catálogo)
+    step = await build_catalog_step("typ", catalog_cache.category_key(selected_category))
+    
+    if step is None:
+        await respond(interaction).edit_message(content=f"❌ Error: No se encontraron Tipos (Placas/Tela) para la categoría '{selected_category}'. Verifica tus datos en MongoDB.", view=None)
+        return
+
+    # 2. Actualizar el mensaje original
+    content, view = step
+    await respond(interaction).edit_message(content=content, view=view)
+
+# Función que se ejecuta cuando el usuario selecciona la Calidad (Paso 5)
+async def final_quality_select_callback(interaction: discord.Interaction, state):
+    
+    selected_quality = interaction.data['values'][0]
+    
+    # El estado del custom_id contiene el contexto de la receta: "recipe_id|level_name"
+    recipe_context = state
+    
+    # 1. Obtener los datos necesarios para abrir el Modal
+    final_data = await run_blocking(
+        partial(get_final_recipe_data, recipe_context, selected_quality)
+    )
+
+    if not final_data:
+        await respond(interaction).edit_message(content="❌ Error: No se encontraron los detalles de la receta. Contacta al administrador.", view=None)
+        return
+
+    # 2. Mostrar el formulario Modal (Paso 6: Cantidad y Envío)
+    await respond(interaction).send_modal(OrderModal(final_data))
+
+# --- COMPONENTES PERSISTENTES DEL ASISTENTE /crearpedido ---
+# Cada paso del asistente es un Select cuyo custom_id lleva el paso y el estado acumulado
+# ("pw:<paso>:<estado>"). La clase se registra una sola vez en setup(), así que el bot no
+# guarda una View por usuario y los asistentes en curso siguen funcionando tras reiniciar o recargar.
+WIZARD_STEPS = {
+    "cat": category_select_callback,       # Paso 1 -> 2 (valor: categoría)
+    "typ": type_select_callback,           # Paso 2 -> 3 (estado: clave de la categoría, valor: tipo)
+    "item": item_name_select_callback,     # Paso 3 -> 4 (valor: recipe_id)
+    "lvl": level_select_callback,          # Paso 4 -> 5 (valor: "recipe_id|level_name")
+    "q": final_quality_select_callback,    # Paso 5 -> 6 (estado: "recipe_id|level_name", valor: calidad)
+}
+
+def wizard_custom_id(*parts):
+    """custom_id "pw:..." de un componente del asistente; si supera el límite de Discord falla aquí, no al enviar."""
+    custom_id = ":".join(("pw",) + parts)
+    if len(custom_id) > 100:
+        raise ValueError(f"Estado del asistente demasiado largo: {custom_id!r}")
+    return custom_id
+
+class WizardSelect(TracedComponent, discord.ui.DynamicItem[discord.ui.Select], template=r"pw:(?P<step>cat|typ|item|lvl|q):(?P<state>.*)"):
+
+    @property
+    def auto_defer_kwargs(self):
+        # El paso de Calidad responde abriendo el formulario, y un modal no puede ir tras un diferido
+        return None if self.step == "q" else {}
+
+    def __init__(self, step, state="", **select_kwargs):
+        custom_id = wizard_custom_id(step, state)
+        super().__init__(discord.ui.Select(custom_id=custom_id, min_values=1, max_values=1, row=0, **select_kwargs))
+        self.step = step
+        self.state = state
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Select, match):
+        return cls(match["step"], match["state"])
+
+    async def callback(self, interaction: discord.Interaction):
+        handler = WIZARD_STEPS.get(self.step)
+        if handler is None:
+            await respond(interaction).edit_message(content="❌ Este menú ya no es válido. Usa **/crearpedido** de nuevo.", view=None)
+            return
+        await handler(interaction, self.state)
+
+def build_wizard_view(*items):
+    """
+    Construye la vista de un paso del asistente. Se detiene antes de enviarla para que
+    discord.py no la guarde en memoria: las interacciones las despachan los DynamicItem registrados.
+    """
+    view = discord.ui.View(timeout=None)
+    for item in items:
+        view.add_item(item)
+    view.stop()
+    return view
+
+# --- LISTAS PAGINADAS DEL ASISTENTE ---
+# Las listas de más de 25 opciones se muestran por páginas, con un Select de letra inicial,
+# botones ◀ ▶ y un filtro de texto. Todo el estado (lista, clave, filtro, página) viaja en
+# los custom_id, igual que en WizardSelect; las claves largas se sustituyen por un hash (CatalogCache).
+WIZARD_LISTS = {
+    # tipo de lista: (paso del Select que elige la opción, placeholder)
+    "cat": ("cat", "Selecciona la Categoría (Armadura, Arma...)"),
+    "typ": ("typ", "Selecciona el Tipo..."),
+    "item": ("item", "Selecciona el Nombre del Ítem..."),
+}
+
+def wizard_list_content(kind, title, page, total_pages, text_filter):
+    """Texto del mensaje del asistente para una página de una lista ('title': la categoría en el Paso 2)."""
+    if kind == "cat":
+        content = "**⚙️ Nuevo Pedido:**\n**Paso 1:** Selecciona la categoría del artículo:"
+    elif kind == "typ":
+        content = f"**⚙️ Nuevo Pedido:**\n**Paso 2:** Selecciona el Tipo de Material/Ítem para **{title}**:"
+    else:
+        content = "**⚙️ Nuevo Pedido:**\n**Paso 3:** Selecciona el Nombre del Ítem:"
+
+    if text_filter:
+        shown = f"empieza por **{text_filter[1:]}**" if text_filter.startswith("^") else f"contiene **{text_filter}**"
+        content += f"\n🔍 Filtro: {shown}"
+    if total_pages == 0:
+        content += "\n❌ No hay resultados con este filtro."
+    elif total_pages > 1:
+        content += f"\n📄 Página {page + 1} de {total_pages}"
+    return content
+
+async def build_catalog_step(kind, key, text_filter="", page=0):
+    """Construye (contenido, vista) de una página de una lista del asistente, o None si la lista no existe."""
+    catalog_list = await catalog_cache.get(kind, key)
+    if catalog_list is None:
+        return None
+
+    options, page, total_pages = catalog_list.page(text_filter, page)
+    step, placeholder = WIZARD_LISTS[kind]
+
+    items = []
+    if options:
+        items.append(WizardSelect(step, key if kind == "typ" else "", placeholder=placeholder, options=options))
+
+    # Controles de búsqueda solo cuando la lista no cabe en un único Select
+    if len(catalog_list.pages) > 1:
+        if len(catalog_list.letters) > 1:
+            items.append(WizardLetterSelect(kind, key, catalog_list.letters))
+        items.append(WizardPageButton(kind, key, text_filter, max(page - 1, 0), "◀", disabled=page <= 0))
+        items.append(WizardPageButton(kind, key, text_filter, page + 1, "▶", disabled=page >= total_pages - 1))
+        items.append(WizardFilterButton(kind, key))
+        if text_filter:
+            items.append(WizardPageButton(kind, key, "", 0, "✖ Quitar filtro"))
+
+    title = await catalog_cache.resolve_category_key(key) if kind == "typ" else key
+    content = wizard_list_content(kind, title, page, total_pages, text_filter)
+    return content, build_wizard_view(*items)
+
+async def show_catalog_step(interaction: discord.Interaction, kind, key, text_filter="", page=0):
+    """Reemplaza el mensaje del asistente con otra página o filtro de la misma lista."""
+    step = await build_catalog_step(kind, key, text_filter, page)
+    if step is None:
+        await respond(interaction).edit_message(content="❌ Esta lista ya no está disponible. Usa **/crearpedido** de nuevo.", view=None)
+        return
+    content, view = step
+    await respond(interaction).edit_message(content=content, view=view)
+
+class WizardPageButton(TracedComponent, discord.ui.DynamicItem[discord.ui.Button], template=r"pw:pg:(?P<kind>cat|typ|item):(?P<page>\d+):(?P<filter>[^:]*):(?P<key>.*)"):
+
+    def __init__(self, kind, key, text_filter, page, label="", disabled=False):
+        super().__init__(discord.ui.Button(
+            label=label or "·",
+            style=discord.ButtonStyle.secondary,
+            custom_id=wizard_custom_id("pg", kind, str(page), text_filter, key),
+            disabled=disabled,
+            row=2
+        ))
+        self.kind = kind
+        self.key = key
+        self.text_filter = text_filter
+        self.page = page
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["kind"], match["key"], match["filter"], int(match["page"]))
+
+    async def callback(self, interaction: discord.Interaction):
+        await show_catalog_step(interaction, self.kind, self.key, self.text_filter, self.page)
+
+class WizardLetterSelect(TracedComponent, discord.ui.DynamicItem[discord.ui.Select], template=r"pw:ltr:(?P<kind>cat|typ|item):(?P<key>.*)"):
+
+    def __init__(self, kind, key, letters=()):
+        super().__init__(discord.ui.Select(
+            custom_id=wizard_custom_id("ltr", kind, key),
+            placeholder="🔤 Filtrar por letra inicial...",
+            options=[SelectOption(label=letter, value=letter) for letter in letters],
+            min_values=1,
+            max_values=1,
+            row=1
+        ))
+        self.kind = kind
+        self.key = key
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Select, match):
+        return cls(match["kind"], match["key"])
+
+    async def callback(self, interaction: discord.Interaction):
+        await show_catalog_step(interaction, self.kind, self.key, f"^{interaction.data['values'][0]}")
+
+class WizardFilterButton(TracedComponent, discord.ui.DynamicItem[discord.ui.Button], template=r"pw:flt:(?P<kind>cat|typ|item):(?P<key>.*)"):
+    auto_defer_kwargs = None # Responde abriendo un modal
+
+    def __init__(self, kind, key):
+        super().__init__(discord.ui.Button(
+            label="🔍 Buscar",
+            style=discord.ButtonStyle.primary,
+            custom_id=wizard_custom_id("flt", kind, key),
+            row=2
+        ))
+        self.kind = kind
+        self.key = key
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["kind"], match["key"])
+
+    async def callback(self, interaction: discord.Interaction):
+        await respond(interaction).send_modal(CatalogFilterModal(self.kind, self.key))
+
+class CatalogFilterModal(TracedComponent, discord.ui.Modal, title='Buscar en la Lista'):
+
+    def __init__(self, kind, key):
+        super().__init__(timeout=300)
+        self.kind = kind
+        self.key = key
+        self.text = discord.ui.TextInput(
+            label="Texto a buscar",
+            placeholder="Ej: espada",
+            min_length=1,
+            max_length=30,
+            required=True
+        )
+        self.add_item(self.text)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        # ':' separa los campos del custom_id y '^' marca el filtro por letra inicial
+        text_filter = self.text.value.replace(":", "").lstrip("^").strip()
+        await show_catalog_step(interaction, self.kind, self.key, text_filter)
+
+class OrderModal(TracedComponent, discord.ui.Modal, title='Detalles Finales del Pedido'):
+    auto_defer_kwargs = {"thinking": True} # La confirmación del pedido es un mensaje público nuevo
+
+    @property
+    def available_offline(self):
+        # Con el diario local el pedido se guarda aunque Mongo no responda (para eso existe el diario);
+        # la asignación automática no puede leer la carga y el pedido queda PENDIENTE
+        return order_journal is not None
+    
+    # El diccionario recipe_data contiene toda la información de contexto necesaria
+    def __init__(self, recipe_data, *args, **kwargs):
+        # Sin timeout un formulario cerrado sin enviar quedaría en memoria para siempre
+        kwargs.setdefault("timeout", 600)
+        super().__init__(*args, **kwargs)
+        self.recipe_data = recipe_data
+        
+        # Etiqueta dinámica para informar al usuario sobre qué calidad eligió
+        quality_label = f"Calidad: {recipe_data['quality']} | Cantidad"
+        
+        # Campo Cantidad
+        self.quantity = discord.ui.TextInput(
+            label=quality_label, # Muestra la calidad seleccionada
+            placeholder="Ingresa la cantidad de ítems (ej: 1)",
+            min_length=1,
+            max_length=3,
+            required=True
+        )
+        self.add_item(self.quantity) # Añadir el campo de cantidad al modal
+
+    async def on_submit(self, interaction: discord.Interaction):
+        # 1. Obtener valores y hacer una validación básica
+        req_quantity_str = self.quantity.value
+        
+        if not req_quantity_str.isdigit():
+             await respond(interaction).send_message("❌ Error: La cantidad debe ser un número válido.", ephemeral=True)
+             return
+        
+        req_quantity = int(req_quantity_str)
+        
+        # 2. Con la asignación automática, el pedido nace ASIGNADA al artesano menos cargado del oficio
+        assignee = None
+        if AUTO_ASSIGN and interaction.guild is not None:
+            assignee = await assignment_dispatcher.pick(
+                interaction.guild, self.recipe_data['profession'], exclude_id=str(interaction.user.id)
+            )
+        estatus = "ASIGNADA" if assignee else "PENDIENTE"
+
+        # 3. Construir el Documento 'pedido'
+        now = discord.utils.utcnow()
+        pedido_doc = {
+            "item_name": self.recipe_data['name'],
+            "recipe_id": self.recipe_data['recipe_id'],
+            "level": self.recipe_data['level_name'],
+            "quality": self.recipe_data['quality'],
+            "cantidad": req_quantity,
+            "oficio_requerido": self.recipe_data['profession'],
+            "solicitante_id": str(interaction.user.id),
+            "guild_id": str(interaction.guild_id),
+            "estatus": estatus,
+            **({"asignado_a_id": str(assignee.id)} if assignee else {}),
+            "fecha_solicitud": now,
+            **reminder_fields(estatus, now, self.recipe_data['profession']),
+            "codigo": new_order_code()
+        }
+        
+        # 4. Registrar en el diario local (se vuelca a Mongo en segundo plano) o insertar en MongoDB
+        # directamente (en un thread para no bloquear)
+        try:
+            if order_journal is not None:
+                await order_journal.append(pedido_doc)
+            else:
+                await run_blocking(partial(insert_pedido, pedido_doc))
+        except Exception as e:
+            mongo_log.error("ERROR AL INSERTAR PEDIDO", extra={"operation": "insert_pedido", "error": str(e)})
+            if assignee:
+                assignment_dispatcher.release(pedido_doc["guild_id"], pedido_doc["asignado_a_id"])
+            await respond(interaction).send_message("❌ Error crítico al guardar el pedido en la base de datos.", ephemeral=True)
+            return
+
+        # 5. Respuesta final (Pública para que los artesanos vean el pedido)
+        await respond(interaction).send_message(
+            f"✅ **¡NUEVO PEDIDO CREADO!** (Código: **{pedido_doc['codigo']}**)\n"
+            f"**Artículo:** {pedido_doc['item_name']} - Nivel {pedido_doc['level']} ({pedido_doc['quality']})\n"
+            f"**Cantidad:** {pedido_doc['cantidad']}\n"
+            f"**Oficio:** {pedido_doc['oficio_requerido']}\n"
+            f"Solicitado por: {interaction.user.mention}"
+            + (f"\nAsignado automáticamente a {assignee.mention}." if assignee else ""),
+            ephemeral=False
+        )
+
+        # 6. Avisar por DM al artesano asignado automáticamente
+        if assignee:
+            try:
+                await assignee.send(
+                    f"🛠️ **¡NUEVA TAREA ASIGNADA!** 🛠️\n\n"
+                    f"Se te ha asignado automáticamente un nuevo pedido:\n"
+                    f"**Artículo:** {pedido_doc['item_name']}\n"
+                    f"**Código de Pedido:** {pedido_doc['codigo']}\n"
+                    f"Usa el comando **/verpedidos** para ver tu lista de tareas y **/completar** cuando hayas terminado."
+                )
+            except Exception as e:
+                command_log.warning("Error al enviar DM de asignación", extra={"command": "crearpedido", "target_user": assignee.id, "error": str(e)})
+    
+
+# --- /crearpedido ---
+@app_commands.command(name="crearpedido", description="Inicia el proceso de creación de un pedido de crafteo.")
+@admission_control(cost=1)
+async def create_order_command(interaction: discord.Interaction):
+    
+    # 1. Obtener la primera página de categorías (caché del catálogo; consulta la BD en un Thread si expiró)
+    step = await build_catalog_step("cat", "")
+    
+    if step is None:
+        await respond(interaction).send_message("❌ Error: No se encontraron categorías de crafteo en la base de datos o hubo un fallo de conexión.", ephemeral=True)
+        return
+    
+    # 2. Enviar el mensaje inicial
+    content, view = step
+    await respond(interaction).send_message(content, view=view, ephemeral=True)
+
+COMMANDS = [create_order_command]
+# Los Select del asistente se despachan por su custom_id, incluso los creados antes de reiniciar o recargar
+DYNAMIC_ITEMS = (WizardSelect, WizardPageButton, WizardLetterSelect, WizardFilterButton)
+
+async def setup(bot):
+    for command in COMMANDS:
+        bot.tree.add_command(command)
+    bot.add_dynamic_items(*DYNAMIC_ITEMS)
+
+async def teardown(bot):
+    for command in COMMANDS:
+        bot.tree.remove_command(command.name)
+    bot.remove_dynamic_items(*DYNAMIC_ITEMS)
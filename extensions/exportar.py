@@ -0,0 +1,119 @@
+# extensions/exportar.py - Exportación del historial de pedidos (/exportarpedidos) en partes
+# comprimidas (JSONL o CSV) que se escriben y se envían a medida que avanza el cursor
+import os
+import tempfile
+import discord
+from discord import app_commands
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Literal
+
+from core import EXPORT_BATCH_SIZE, EXPORT_PART_MB, admission_control, command_log, permission_resolver, respond, run_blocking
+from datos import OrderExportWriter, export_orders_batch, order_export_cursors
+
+def profession_list(profession):
+    return profession if isinstance(profession, list) else [profession]
+
+async def export_profession_autocomplete(interaction: discord.Interaction, current: str):
+    # Solo los oficios del Maestro (el Herrero tiene dos)
+    context = permission_resolver.resolve(interaction.user)
+    if not context.profession:
+        return []
+    return [
+        app_commands.Choice(name=oficio, value=oficio)
+        for oficio in profession_list(context.profession) if current.lower() in oficio.lower()
+    ]
+
+def parse_export_date(value):
+    return datetime.strptime(value.strip(), "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+async def send_ready_parts(interaction: discord.Interaction, writer):
+    """Envía las partes ya cerradas y las borra: en disco solo queda la parte que se está escribiendo."""
+    while writer.ready_parts:
+        path = writer.ready_parts.pop(0)
+        await interaction.followup.send(f"📦 {os.path.basename(path)}", file=discord.File(path), ephemeral=True)
+        os.remove(path)
+
+# --- COMANDO /exportarpedidos ---
+@app_commands.command(name="exportarpedidos", description="Exporta el historial de pedidos de tu oficio (Maestro) como archivo comprimido.")
+@app_commands.describe(
+    formato="jsonl (un pedido por línea) o csv.",
+    oficio="Opcional: solo uno de tus oficios.",
+    estatus="Opcional: solo los pedidos en este estado.",
+    desde="Opcional: pedidos solicitados desde esta fecha (AAAA-MM-DD, UTC).",
+    hasta="Opcional: pedidos solicitados hasta esta fecha incluida (AAAA-MM-DD, UTC)."
+)
+@app_commands.autocomplete(oficio=export_profession_autocomplete)
+@admission_control(cost=5)
+async def export_orders_command(
+    interaction: discord.Interaction,
+    formato: Literal["jsonl", "csv"] = "jsonl",
+    oficio: str = None,
+    estatus: Literal["PENDIENTE", "ASIGNADA", "LISTO PARA RECOGER", "ENTREGADA"] = None,
+    desde: str = None,
+    hasta: str = None
+):
+    # 1. Solo los Maestros exportan, y solo los pedidos de sus oficios
+    context = permission_resolver.resolve(interaction.user)
+    if not context.is_maestro or not context.profession:
+        await respond(interaction).send_message("🔒 Solo los Maestros pueden exportar el historial de pedidos de su oficio.", ephemeral=True)
+        return
+    oficios = profession_list(context.profession)
+    if oficio:
+        if oficio not in oficios:
+            await respond(interaction).send_message(f"❌ Error: **{oficio}** no es uno de tus oficios ({', '.join(oficios)}).", ephemeral=True)
+            return
+        oficios = [oficio]
+
+    try:
+        start = parse_export_date(desde) if desde else None
+        end = parse_export_date(hasta) + timedelta(days=1) if hasta else None # Día de 'hasta' incluido
+    except ValueError:
+        await respond(interaction).send_message("❌ Error: Las fechas deben tener el formato AAAA-MM-DD.", ephemeral=True)
+        return
+
+    await respond(interaction).defer(ephemeral=True, thinking=True)
+    guild_id = str(interaction.guild_id)
+    cursors = order_export_cursors(guild_id, oficios, estatus, start, end, EXPORT_BATCH_SIZE)
+
+    # 2. Un lote por llamada al hilo; cada parte se envía en cuanto se cierra
+    with tempfile.TemporaryDirectory(prefix="exportar-") as directory:
+        basename = f"pedidos-{discord.utils.utcnow():%Y%m%d-%H%M%S}"
+        writer = OrderExportWriter(directory, basename, formato, int(EXPORT_PART_MB * 1024 * 1024))
+        try:
+            for cursor in cursors:
+                while True:
+                    written = await run_blocking(partial(export_orders_batch, cursor, writer, EXPORT_BATCH_SIZE))
+                    if written is None:
+                        await interaction.followup.send(
+                            f"❌ Error al leer los pedidos. Se exportaron {writer.rows} antes del fallo.", ephemeral=True
+                        )
+                        return
+                    await send_ready_parts(interaction, writer)
+                    if written < EXPORT_BATCH_SIZE:
+                        break
+            await run_blocking(writer.close)
+            await send_ready_parts(interaction, writer)
+        finally:
+            # Tras un fallo (o si se cancela el comando) no queda abierto el gzip ni partes en disco
+            writer.discard()
+
+    command_log.info("Historial de pedidos exportado", extra={
+        "command": "exportarpedidos", "guild": guild_id, "orders": writer.rows, "parts": writer.part_count, "format": formato
+    })
+    if not writer.rows:
+        await interaction.followup.send("📭 No hay pedidos que coincidan con los filtros.", ephemeral=True)
+        return
+    await interaction.followup.send(
+        f"✅ Exportados **{writer.rows}** pedidos en **{writer.part_count}** parte(s) ({formato}, gzip).", ephemeral=True
+    )
+
+COMMANDS = [export_orders_command]
+
+async def setup(bot):
+    for command in COMMANDS:
+        bot.tree.add_command(command)
+
+async def teardown(bot):
+    for command in COMMANDS:
+        bot.tree.remove_command(command.name)
@@ -0,0 +1,312 @@
+# extensions/inventario.py - Inventario de cada servidor (/inventarioagregar, /inventarioretirar,
+# /verinventario, /setitem, /inventariohistorial), sus autocompletados y la compactación del historial
+import discord
+from discord import app_commands
+from discord.ext import tasks
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from core import (
+    IS_PRIMARY_PROCESS, LEDGER_COMPACTION_HOURS, LEDGER_RETENTION_DAYS, MANAGEMENT_ROLES, MongoUnavailable,
+    admission_control, mongo_manager, respond, run_blocking, task_log,
+)
+from datos import (
+    compact_inventory_ledger, get_full_inventory, get_inventory_all_names, get_inventory_history, get_inventory_items,
+    get_inventory_quantity_at, get_inventory_stock_names, inventory_ledger, inventory_writer, set_inventory_quantity,
+)
+
+async def inventory_all_autocomplete(interaction: discord.Interaction, current: str):
+    # Execute the database search synchronously in a thread
+    item_names = await run_blocking(
+        partial(get_inventory_all_names, str(interaction.guild_id), current)
+    )
+    
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in item_names
+    ]
+
+async def inventory_item_autocomplete(interaction: discord.Interaction, current: str):
+    # Execute the database search synchronously in a thread
+    item_names = await run_blocking(
+        partial(get_inventory_items, current)
+    )
+    
+    # Create the autocomplete choices
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in item_names
+    ]
+
+async def inventory_stock_autocomplete(interaction: discord.Interaction, current: str):
+    # Ejecuta la búsqueda de ítems en STOCK (inventario_col)
+    item_names = await run_blocking(
+        partial(get_inventory_stock_names, str(interaction.guild_id), current)
+    )
+    
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in item_names
+    ]
+
+# --- TAREAS PERIÓDICAS ---
+async def on_mongo_connected():
+    if IS_PRIMARY_PROCESS:
+        compact_inventory_ledger_task.start()
+
+@tasks.loop(hours=LEDGER_COMPACTION_HOURS)
+async def compact_inventory_ledger_task():
+    cutoff = discord.utils.utcnow() - timedelta(days=LEDGER_RETENTION_DAYS)
+    compacted = await run_blocking(partial(compact_inventory_ledger, cutoff))
+    if compacted:
+        task_log.info("Historial de inventario compactado", extra={"movements": compacted})
+
+# Si Mongo cae, la tarea se reintenta con espera en lugar de detenerse
+compact_inventory_ledger_task.add_exception_type(MongoUnavailable)
+
+# --- COMANDO /inventarioagregar ---
+@app_commands.command(name="inventarioagregar", description="Agrega nuevos ítems o aumenta la cantidad de un ítem existente.")
+@app_commands.describe(
+    item_name="Nombre del ítem (debe existir en el inventario, incluso si está en 0).",
+    cantidad="Cantidad a agregar (número entero positivo)."
+)
+@app_commands.autocomplete(item_name=inventory_all_autocomplete) # <-- USA EL AUTOCOMPLETADO DE TODO EL INVENTARIO
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+async def add_inventory_command(interaction: discord.Interaction, item_name: str, cantidad: int):
+    
+    await respond(interaction).defer(ephemeral=True)
+    item_name_stripped = item_name.strip()
+
+    # La validación implícita es que el nombre proviene del autocompletado (ítems existentes)
+    
+    if cantidad <= 0:
+        await interaction.followup.send("❌ Error: La cantidad debe ser mayor a cero para agregar.", ephemeral=True)
+        return
+
+    # 🛠️ LÓGICA DE ACTUALIZACIÓN (Suma el valor y devuelve la cantidad final en la misma escritura)
+    result, final_quantity = await inventory_writer.apply(
+        str(interaction.guild_id), item_name_stripped, cantidad, user_id=str(interaction.user.id), command="inventarioagregar"
+    )
+
+    if result == "ERROR":
+        await interaction.followup.send("❌ Error: Fallo al agregar el ítem al inventario.", ephemeral=True)
+        return
+
+    if result == "DELETED":
+        # Los cambios se aplican en orden y sin bajar de 0, así que sumar una cantidad positiva deja stock:
+        # solo un documento con cantidad negativa previa (datos antiguos) puede terminar aquí
+        await interaction.followup.send(
+            f"⚠️ Se agregaron **{cantidad}** de **{item_name_stripped}**, pero el ítem sigue en 0 o menos unidades "
+            f"y fue **eliminado** del inventario.",
+            ephemeral=True
+        )
+        return
+
+    await interaction.followup.send(
+        f"✅ Inventario Actualizado:\n"
+        f"Se agregaron **{cantidad}** de **{item_name_stripped}**.\n"
+        f"Cantidad total: **{final_quantity}**.",
+        ephemeral=False
+    )
+
+# --- COMANDO /inventarioretirar ---
+@app_commands.command(name="inventarioretirar", description="Retira una cantidad de un ítem existente del inventario.")
+@app_commands.describe(
+    item_name="Nombre del ítem (se autocompleta si existe).",
+    cantidad="Cantidad a retirar (debe ser un número entero positivo)."
+)
+@app_commands.autocomplete(item_name=inventory_stock_autocomplete) # Usa el mismo autocompletado
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+async def remove_inventory_command(interaction: discord.Interaction, item_name: str, cantidad: int):
+    
+    await respond(interaction).defer(ephemeral=True)
+    
+    # Validacion simple de cantidad
+    if cantidad <= 0:
+        await interaction.followup.send("❌ Error: La cantidad a retirar debe ser mayor a cero.", ephemeral=True)
+        return
+        
+    item_name_stripped = item_name.strip()
+    
+    # Encolar la actualización con cantidad negativa (se agrupa con otros cambios concurrentes)
+    # Nota: Si el resultado es "DELETED", la cantidad fue <= 0
+    result, final_quantity = await inventory_writer.apply(
+        str(interaction.guild_id), item_name_stripped, -cantidad, user_id=str(interaction.user.id), command="inventarioretirar" # CANTIDAD NEGATIVA
+    )
+
+    if result == "ERROR":
+        await interaction.followup.send("❌ Error: Fallo al actualizar el inventario.", ephemeral=True)
+        return
+    
+    if result == "DELETED":
+        await interaction.followup.send(
+            f"✅ Inventario Actualizado:\n"
+            f"Se retiraron **{cantidad}** de **{item_name_stripped}**.\n"
+            f"El ítem fue **eliminado** del inventario por tener 0 o menos unidades.",
+            ephemeral=False
+        )
+        return
+
+    # Si no fue eliminado, confirmar la cantidad final
+    await interaction.followup.send(
+        f"✅ Inventario Actualizado:\n"
+        f"Se retiraron **{cantidad}** de **{item_name_stripped}**.\n"
+        f"Cantidad restante: **{final_quantity}**.",
+        ephemeral=False
+    )
+
+# --- COMANDO /inventariover ---
+@app_commands.command(name="verinventario", description="Muestra la lista completa de ítems en el inventario y sus cantidades.")
+@admission_control(cost=3) # Lee toda la colección 'inventario'
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+async def view_inventory_command(interaction: discord.Interaction):
+    
+    await respond(interaction).defer(ephemeral=True) # DEFERIR RESPUESTA
+    
+    # 1. Consultar inventario ordenado en segundo plano
+    inventory_list = await run_blocking(
+        partial(get_full_inventory, str(interaction.guild_id))
+    )
+    
+    if not inventory_list:
+        await interaction.followup.send("✅ El inventario está actualmente vacío.", ephemeral=True)
+        return
+
+    # 2. Formatear los resultados
+    inventory_text = []
+    
+    for item in inventory_list:
+        inventory_text.append(f"• {item.name} **{item.quantity}**")
+    
+    # Si la lista de texto es demasiado larga para un solo campo (límite de 1024 caracteres), 
+    # la dividimos en un solo bloque unido por saltos de línea.
+    
+    final_output = "\n".join(inventory_text)
+    
+    embed = discord.Embed(
+        title=f"📦 Inventario del Gremio",
+        description=final_output, # Mostrar todo el listado en la descripción
+        color=discord.Color.blue()
+    )
+    
+    # 3. Respuesta final
+    await interaction.followup.send(embed=embed, ephemeral=False)
+
+# Manejo de error de roles para /verinventario (mantener igual)
+@view_inventory_command.error
+async def view_inventory_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.errors.MissingAnyRole):
+        await respond(interaction).send_message("🔒 No tienes un rol de gestión de oficios para ver el inventario.", ephemeral=True)
+
+# --- COMANDO /setitem ---
+@app_commands.command(name="setitem", description="Fija la cantidad total de un ítem en el inventario al valor exacto.")
+@app_commands.describe(
+    item_name="Ítem del inventario para actualizar.",
+    cantidad="El número TOTAL que tiene el inventario ahora."
+)
+@app_commands.autocomplete(item_name=inventory_stock_autocomplete)
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+async def set_inventory_command(interaction: discord.Interaction, item_name: str, cantidad: int):
+    
+    await respond(interaction).defer(ephemeral=True)
+    item_name_stripped = item_name.strip()
+
+    if cantidad < 0:
+        await interaction.followup.send("❌ Error: La cantidad no puede ser negativa. Usa 0 para eliminar el ítem.", ephemeral=True)
+        return
+    
+    # Ejecutar la actualización en un hilo de fondo
+    result, movement = await run_blocking(
+        partial(set_inventory_quantity, str(interaction.guild_id), item_name_stripped, cantidad, str(interaction.user.id), "setitem")
+    )
+
+    if result == "ERROR":
+        await interaction.followup.send("❌ Error: Fallo al actualizar el inventario.", ephemeral=True)
+        return
+
+    # El historial se registra en segundo plano, sin retrasar la respuesta (con reintentos si Mongo cae)
+    inventory_ledger.record([movement])
+
+    # 3. Confirmar la acción
+    if result == "DELETED":
+        await interaction.followup.send(
+            f"✅ Inventario Actualizado:\n"
+            f"El ítem **{item_name_stripped}** ha sido **eliminado** del inventario (Cantidad fijada en 0 o menos).",
+            ephemeral=False
+        )
+    else:
+        await interaction.followup.send(
+            f"✅ Inventario Actualizado:\n"
+            f"La cantidad total de **{item_name_stripped}** se ha fijado en **{cantidad}**.",
+            ephemeral=False
+        )
+
+# --- COMANDO /inventariohistorial ---
+@app_commands.command(name="inventariohistorial", description="Muestra los últimos movimientos de un ítem del inventario.")
+@app_commands.describe(
+    item_name="Ítem del inventario a consultar.",
+    fecha="Opcional: muestra la cantidad que había en esa fecha (AAAA-MM-DD o AAAA-MM-DD HH:MM, hora UTC)."
+)
+@app_commands.autocomplete(item_name=inventory_all_autocomplete)
+@admission_control(cost=2)
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+async def inventory_history_command(interaction: discord.Interaction, item_name: str, fecha: str = None):
+
+    await respond(interaction).defer(ephemeral=True)
+    item_name_stripped = item_name.strip()
+
+    when = None
+    if fecha:
+        for date_format in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                when = datetime.strptime(fecha.strip(), date_format).replace(tzinfo=timezone.utc)
+                break
+            except ValueError:
+                continue
+        if when is None:
+            await interaction.followup.send("❌ Error: La fecha debe tener el formato AAAA-MM-DD o AAAA-MM-DD HH:MM.", ephemeral=True)
+            return
+
+    movements = await run_blocking(partial(get_inventory_history, str(interaction.guild_id), item_name_stripped))
+
+    embed = discord.Embed(
+        title=f"📚 Historial de {item_name_stripped}",
+        color=discord.Color.blue()
+    )
+
+    if when is not None:
+        quantity_at = await run_blocking(partial(get_inventory_quantity_at, str(interaction.guild_id), item_name_stripped, when))
+        if quantity_at is None:
+            await interaction.followup.send("❌ Error: Fallo al consultar el historial del inventario.", ephemeral=True)
+            return
+        embed.description = f"Cantidad el **{when:%Y-%m-%d %H:%M} UTC**: **{quantity_at}**"
+
+    if not movements:
+        embed.add_field(name="\u200b", value="No hay movimientos recientes para este ítem.", inline=False)
+
+    for movement in movements:
+        delta = movement.get("delta", 0)
+        user_text = f"<@{movement['user_id']}>" if movement.get("user_id") else "Sistema"
+        embed.add_field(
+            name=f"{movement['timestamp']:%Y-%m-%d %H:%M} | {delta:+d} → {movement.get('quantity', 0)}",
+            value=f"Por: {user_text} | Comando: /{movement.get('command') or 'N/A'}",
+            inline=False
+        )
+
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+COMMANDS = [add_inventory_command, remove_inventory_command, view_inventory_command, set_inventory_command, inventory_history_command]
+
+async def setup(bot):
+    for command in COMMANDS:
+        bot.tree.add_command(command)
+    bot.add_listener(on_mongo_connected)
+    # Al recargar con Mongo ya conectado, on_mongo_connected no se repite: solo se relanza la tarea
+    if mongo_manager.connected_once:
+        await on_mongo_connected()
+
+async def teardown(bot):
+    for command in COMMANDS:
+        bot.tree.remove_command(command.name)
+    bot.remove_listener(on_mongo_connected)
+    compact_inventory_ledger_task.cancel()
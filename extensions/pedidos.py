@@ -0,0 +1,989 @@
+# extensions/pedidos.py - Listados y ciclo de vida de los pedidos (/verpedidos, /mispedidos, /asignar,
+# /recoger, /completar, /asignarvarios, /completarvarios, /disponibilidad), sus autocompletados y el
+# archivado de pedidos entregados
+import asyncio
+import discord
+from discord import SelectOption, app_commands
+from discord.ext import tasks
+from datetime import timedelta
+from functools import partial
+
+from core import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_MINUTES, AUTO_ASSIGN, ESTADOS_ABIERTOS,
+    GUILD_MIGRATION_BATCH_SIZE, IS_PRIMARY_PROCESS, LEGACY_GUILD_ID, MANAGEMENT_ROLES, MongoUnavailable,
+    REMINDER_BATCH_SIZE, REMINDER_INTERVAL_MINUTES, SCHEMA_MIGRATION_BATCH_SIZE, SCHEMA_MIGRATION_PAUSE_MS,
+    TracedComponent, admission_control, bot, cache_bus, command_log, mongo_log, mongo_manager, pedidos_col, permission_resolver,
+    respond, run_blocking, task_log,
+)
+from datos import (
+    MIGRATED_COLLECTIONS, REMINDER_SLAS, SCHEMA_MIGRATIONS, TRANSITION_PROJECTION, OrderRecord, archive_delivered_orders_batch,
+    as_utc, assign_missing_order_codes, assignment_dispatcher, bulk_order_transition, claim_due_reminders, ensure_indexes,
+    get_actionable_orders, get_managed_orders, get_user_orders, migrate_guild_ids, order_journal, order_state_update, parse_order_ref,
+    pending_schema_migrations, run_schema_migration_batch, schedule_missing_reminders, schema_state, set_auto_assign_preference,
+    status_match, user_match, user_mismatch,
+)
+
+# Función para autocompletar la lista de artesanos disponibles
+async def artisan_autocomplete(interaction: discord.Interaction, current: str):
+    # 1. Obtener el oficio del Maestro que ejecuta el comando (resuelto desde la caché de permisos)
+    context = permission_resolver.resolve(interaction.user)
+            
+    if not context.profession:
+        return [] # Si el maestro no tiene un rol válido, no ofrecemos sugerencias
+
+    # 2. Roles de Subdito y Maestro del oficio (ej. "Herrero" y "Herrero Maestro")
+    artisan_role_ids = permission_resolver.profession_role_ids(interaction.guild, context.base_role)
+
+    # 3. Filtrar los miembros que tienen alguno de esos roles
+    available_members = []
+    seen_ids = set()
+    current_lower = current.lower()
+
+    for role_id in artisan_role_ids:
+        role = interaction.guild.get_role(role_id)
+        if not role:
+            continue
+        for member in role.members:
+            if member.id in seen_ids or current_lower not in member.display_name.lower():
+                continue
+            seen_ids.add(member.id)
+            available_members.append(app_commands.Choice(name=member.display_name, value=str(member.id)))
+            
+    # Discord solo permite un máximo de 25 opciones de autocompletado
+    return available_members[:25]
+
+# Autocompletado de pedido_id: solo los pedidos sobre los que el usuario puede actuar con cada comando
+def profession_filter(profession):
+    return {"$in": profession} if isinstance(profession, list) else profession
+
+def order_label(order):
+    return f"{order.code} · {order.item_name} ({order.quality}) x{order.cantidad} · {order.estatus}"[:100]
+
+async def order_choices(interaction: discord.Interaction, query, current):
+    query = {"guild_id": str(interaction.guild_id), **query}
+    orders = await run_blocking(partial(get_actionable_orders, query, current))
+    return [app_commands.Choice(name=order_label(order), value=order.code) for order in orders]
+
+async def assignable_order_autocomplete(interaction: discord.Interaction, current: str):
+    # /asignar: pedidos abiertos del oficio del Maestro (sin asignar o para reasignar)
+    context = permission_resolver.resolve(interaction.user)
+    if not context.profession:
+        return []
+    return await order_choices(
+        interaction,
+        {"oficio_requerido": profession_filter(context.profession), "estatus": status_match("PENDIENTE", "ASIGNADA")},
+        current
+    )
+
+async def completable_order_autocomplete(interaction: discord.Interaction, current: str):
+    # /completar: Maestro -> pedidos abiertos de su oficio; Subdito -> sus asignaciones (no sus propios pedidos)
+    context = permission_resolver.resolve(interaction.user)
+    if not context.profession:
+        return []
+    if context.is_maestro:
+        query = {"oficio_requerido": profession_filter(context.profession), "estatus": status_match("PENDIENTE", "ASIGNADA")}
+    else:
+        user_id = interaction.user.id
+        query = {"asignado_a_id": user_match(user_id), "estatus": status_match("ASIGNADA"), "solicitante_id": user_mismatch(user_id)}
+    return await order_choices(interaction, query, current)
+
+async def pickup_order_autocomplete(interaction: discord.Interaction, current: str):
+    # /recoger: pedidos propios que ya están LISTO PARA RECOGER
+    return await order_choices(
+        interaction, {"solicitante_id": user_match(interaction.user.id), "estatus": status_match("LISTO PARA RECOGER")}, current
+    )
+
+# --- ARRANQUE Y TAREAS PERIÓDICAS ---
+async def on_mongo_connected():
+    # Primera conexión a Mongo: índices, pedidos del diario pendientes y migraciones de datos
+    await run_blocking(ensure_indexes)
+    if order_journal is not None:
+        order_journal.wake()
+    # Cada proceso recuerda los pedidos de sus propios servidores
+    if REMINDER_SLAS:
+        order_reminders_task.start()
+    # Con las migraciones de esquema terminadas, las consultas dejan de buscar el formato anterior
+    pending_migrations = await run_blocking(pending_schema_migrations)
+    if pending_migrations == 0:
+        schema_state.disable_compat_reads()
+    if not IS_PRIMARY_PROCESS:
+        return
+    if LEGACY_GUILD_ID:
+        migrated = await run_blocking(partial(migrate_guild_ids, LEGACY_GUILD_ID, GUILD_MIGRATION_BATCH_SIZE))
+        if migrated:
+            task_log.info("Documentos asignados al servidor heredado", extra={"guild": LEGACY_GUILD_ID, **migrated})
+    assigned = await run_blocking(assign_missing_order_codes)
+    if assigned:
+        task_log.info("Códigos cortos asignados a pedidos existentes", extra={"orders": assigned})
+    scheduled = await run_blocking(schedule_missing_reminders)
+    if scheduled:
+        task_log.info("Recordatorios programados en pedidos existentes", extra={"orders": scheduled})
+    if pending_migrations:
+        schema_migrations_task.start()
+    archive_delivered_orders_task.start()
+
+@tasks.loop(minutes=ARCHIVE_INTERVAL_MINUTES)
+async def archive_delivered_orders_task():
+    cutoff = discord.utils.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    archived_total = 0
+    # Un lote por llamada al hilo: el proceso nunca acapara el pool durante mucho tiempo
+    while True:
+        archived = await run_blocking(
+            partial(archive_delivered_orders_batch, cutoff, ARCHIVE_BATCH_SIZE)
+        )
+        archived_total += archived
+        if archived < ARCHIVE_BATCH_SIZE:
+            break
+    if archived_total:
+        task_log.info("Pedidos entregados archivados", extra={"orders": archived_total})
+
+# Si Mongo cae, la tarea se reintenta con espera en lugar de detenerse
+archive_delivered_orders_task.add_exception_type(MongoUnavailable)
+
+# Migraciones de esquema en segundo plano: un lote por llamada al hilo y una pausa entre lotes para
+# no competir con los comandos. El progreso queda en Mongo: si el proceso cae, se reanuda al arrancar.
+@tasks.loop(count=1)
+async def schema_migrations_task():
+    for migration in SCHEMA_MIGRATIONS:
+        for collection in MIGRATED_COLLECTIONS:
+            migrated_total = 0
+            while True:
+                result = await run_blocking(
+                    partial(run_schema_migration_batch, migration, collection, SCHEMA_MIGRATION_BATCH_SIZE)
+                )
+                if result is None:
+                    return # Error ya registrado: las consultas siguen en modo compatible hasta el próximo arranque
+                migrated, done = result
+                migrated_total += migrated
+                if done:
+                    break
+                await asyncio.sleep(SCHEMA_MIGRATION_PAUSE_MS / 1000)
+            if migrated_total:
+                task_log.info("Migración de esquema aplicada", extra={
+                    "migration": migration.name, "collection": collection.name, "documents": migrated_total
+                })
+    schema_state.disable_compat_reads()
+    await cache_bus.publish("schema", "migrated")
+    task_log.info("Migraciones de esquema completadas")
+
+schema_migrations_task.add_exception_type(MongoUnavailable)
+
+# --- RECORDATORIOS DE PEDIDOS ESTANCADOS ---
+REMINDER_DIGEST_LINES = 20
+
+def reminder_recipients(guild, doc):
+    """Un pedido ASIGNADA se recuerda a su artesano; uno PENDIENTE, a los Maestros de su oficio."""
+    if doc.get("estatus") == "ASIGNADA" and doc.get("asignado_a_id"):
+        member = guild.get_member(int(doc["asignado_a_id"]))
+        return [member] if member else []
+    recipients = {}
+    for role_id in permission_resolver.master_role_ids(guild, doc.get("oficio_requerido")):
+        role = guild.get_role(role_id)
+        if role:
+            recipients.update((member.id, member) for member in role.members)
+    return list(recipients.values())
+
+def format_age(delta):
+    hours = int(delta.total_seconds() // 3600)
+    return f"{hours // 24}d {hours % 24}h" if hours >= 24 else f"{hours}h"
+
+async def send_reminder_digests(due, now):
+    """Agrupa los pedidos vencidos por destinatario y envía un solo DM a cada uno."""
+    digests = {}
+    for doc in due:
+        guild = bot.get_guild(int(doc["guild_id"]))
+        if guild is None:
+            continue
+        for member in reminder_recipients(guild, doc):
+            digests.setdefault((guild, member), []).append(doc)
+
+    for (guild, member), docs in digests.items():
+        lines = [
+            f"• **{OrderRecord(doc).code}** · {doc['item_name']} ({doc.get('quality')}) x{doc.get('cantidad')} · "
+            f"{doc['estatus']} desde hace {format_age(now - as_utc(doc.get('fecha_estado') or doc['fecha_solicitud']))}"
+            for doc in docs[:REMINDER_DIGEST_LINES]
+        ]
+        if len(docs) > REMINDER_DIGEST_LINES:
+            lines.append(f"…y {len(docs) - REMINDER_DIGEST_LINES} más.")
+        try:
+            await member.send(f"⏰ Pedidos estancados en **{guild.name}**:\n" + "\n".join(lines))
+        except Exception as e:
+            task_log.warning("No se pudo enviar el recordatorio", extra={"guild": guild.id, "target_user": member.id, "error": str(e)})
+
+@tasks.loop(minutes=REMINDER_INTERVAL_MINUTES)
+async def order_reminders_task():
+    guild_ids = [str(guild.id) for guild in bot.guilds]
+    if not guild_ids:
+        return
+    now = discord.utils.utcnow()
+    due = []
+    # Lotes de REMINDER_BATCH_SIZE hasta agotar los vencidos; cada lote ya queda reprogramado
+    while True:
+        batch, scanned = await run_blocking(partial(claim_due_reminders, guild_ids, now, REMINDER_BATCH_SIZE))
+        due.extend(batch)
+        if scanned < REMINDER_BATCH_SIZE:
+            break
+    if due:
+        await send_reminder_digests(due, now)
+        task_log.info("Recordatorios de pedidos enviados", extra={"orders": len(due)})
+
+order_reminders_task.add_exception_type(MongoUnavailable)
+
+# --- ASIGNACIÓN AUTOMÁTICA: ELEGIBILIDAD ---
+# Los montículos de carga se corrigen con los cambios de roles, sin volver a recorrer los miembros
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        assignment_dispatcher.sync_member(after)
+
+async def refresh_assignment_roles(role, *_):
+    assignment_dispatcher.invalidate_guild(role.guild.id)
+
+ROLE_EVENTS = ("on_guild_role_create", "on_guild_role_update", "on_guild_role_delete")
+
+# --- COMANDO /verpedidos ---
+@app_commands.command(name="verpedidos", description="Muestra pedidos pendientes (Maestro) o asignados (Subdito).")
+@admission_control(cost=2)
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+async def view_orders_command(interaction: discord.Interaction):
+    
+    # 1. Determinar el rol y el oficio base (desde la caché de permisos)
+    context = permission_resolver.resolve(interaction.user)
+    is_maestro = context.is_maestro
+    chief_profession = context.profession
+
+    if not chief_profession:
+        await respond(interaction).send_message("❌ Error: No se pudo determinar tu oficio base (Sastrería, Herrería, etc.) a partir de tu rol.", ephemeral=True)
+        return
+
+    # 2. Definir la consulta a MongoDB
+    if is_maestro:
+        # MAESTRO: Ver todos los pedidos pendientes de su profesión
+        query_type = 'profession'
+        
+        # 🛠️ LÓGICA FINAL PARA EL HERRERO Y MULTI-OFICIOS
+        if isinstance(chief_profession, list): # Detecta si es una lista (Herrero)
+            identifier = chief_profession # El identifier ahora es la lista de oficios
+            chief_profession_display = "Forja (Armas y Armaduras)" # Nombre a mostrar al usuario
+        else:
+            identifier = chief_profession # Para Sastre, Peletero, etc., sigue siendo la cadena
+            chief_profession_display = chief_profession # Nombre a mostrar al usuario
+            
+        list_title = f"👑 Pedidos PENDIENTES de {chief_profession_display}"
+        no_orders_msg = f"✅ ¡No hay pedidos pendientes para el oficio **{chief_profession_display}**!"
+    else:
+        # SUBDITO/TRABAJADOR: Ver pedidos asignados a su ID
+        query_type = 'worker_id'
+        identifier = interaction.user.id
+        list_title = f"✍️ Pedidos ASIGNADOS a ti ({chief_profession})"
+        no_orders_msg = "✅ ¡No tienes pedidos asignados en este momento!"
+
+
+    # 3. Consultar pedidos en segundo plano
+    managed_orders = await run_blocking(
+        partial(get_managed_orders, str(interaction.guild_id), query_type, identifier)
+    )
+
+    if not managed_orders:
+        await respond(interaction).send_message(no_orders_msg, ephemeral=True)
+        return
+
+    # 4. Formatear y Mostrar Resultados
+    embed = discord.Embed(
+        title=list_title,
+        color=discord.Color.gold() if is_maestro else discord.Color.teal()
+    )
+    
+    for order in managed_orders:
+        order_id_visible = order.code # Código corto (o el ObjectId en pedidos antiguos)
+        solicitante_mention = f"<@{order.solicitante_id}>"
+        
+        # Muestra el artesano asignado
+        asignado_a_text = f"Asignado a: <@{order.asignado_a_id}>" if order.asignado_a_id else "**SIN ASIGNAR**"
+        
+        # El estatus
+        current_status = order.estatus or 'N/A'
+
+        field_value = (
+            f"**Cantidad:** {order.cantidad} | **Nivel:** {order.level} ({order.quality})\n"
+            f"**Solicitado por:** {solicitante_mention}\n"
+        )
+        
+        # Lógica de Maestro/Subdito para el valor del campo
+        if is_maestro:
+             field_value += f"**Estatus:** **{current_status}** | {asignado_a_text}"
+        else:
+             field_value += f"**Estatus:** **{current_status}**"
+        
+        # 1. Añadir el campo del Pedido
+        embed.add_field(
+            name=f"ID: {order_id_visible} | {order.item_name} ({order.quality})",
+            value=field_value,
+            inline=False
+        )
+        
+        # 2. AÑADIR SEPARADOR INVISIBLE
+        # El campo vacío 'inline=False' garantiza una línea de separación completa
+        embed.add_field(
+            name="\u200b", # Carácter de espacio invisible
+            value="---", # Puedes usar tres guiones para una línea visual ligera
+            inline=False 
+        )
+        
+    await respond(interaction).send_message(embed=embed, ephemeral=True) 
+
+# Manejo de error de roles para /verpedidos
+@view_orders_command.error
+async def view_orders_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.errors.MissingAnyRole):
+        # 🛠️ CORRECCIÓN: Cambiar el mensaje de error para ser consistente
+        await respond(interaction).send_message("🔒 No tienes un rol de gestión de oficios para usar este comando.", ephemeral=True)
+
+
+@app_commands.command(name="mispedidos", description="Muestra el estado de los pedidos que has solicitado.")
+@admission_control(cost=2)
+@app_commands.describe(
+    historial="Incluir pedidos entregados hace tiempo (archivados).",
+    pagina="Página de resultados (10 pedidos por página)."
+)
+async def my_orders_command(interaction: discord.Interaction, historial: bool = False, pagina: int = 1):
+    user_id = interaction.user.id
+    page = max(pagina, 1) - 1
+    
+    # 1. Consultar pedidos del usuario en segundo plano
+    user_orders = await run_blocking(
+        partial(get_user_orders, str(interaction.guild_id), user_id, page, historial)
+    )
+    
+    if not user_orders:
+        if page > 0:
+            await respond(interaction).send_message(f"✅ No hay más pedidos en la página {pagina}.", ephemeral=True)
+        else:
+            await respond(interaction).send_message("✅ ¡No has solicitado ningún pedido aún!", ephemeral=True)
+        return
+
+    # 2. Formatear y Mostrar Resultados
+    embed = discord.Embed(
+        title=f"📋 Estado de tus Pedidos Recientes" if not historial else f"📋 Historial de tus Pedidos (Página {page + 1})",
+        color=discord.Color.green()
+    )
+    
+    status_emoji = {
+        "PENDIENTE": "🕒",
+        "ASIGNADO": "✍️",
+        "COMPLETADO": "✅",
+        "CANCELADO": "❌"
+    }
+    
+    for order in user_orders:
+        status = order.estatus or 'N/A'
+        emoji = status_emoji.get(status, '❓')
+        
+        # Código corto como ID visible (o el ObjectId en pedidos antiguos)
+        order_id_visible = order.code
+
+        # Mostrar el nombre del artesano si está asignado
+        asignado_a = order.asignado_a_id
+        
+        # Discord usa <@ID_DE_USUARIO> para mencionar a alguien
+        asignado_text = f"**Artesano:** <@{asignado_a}>" if asignado_a else "**Artesano:** Pendiente"
+
+        embed.add_field(
+            name=f"{emoji} ID {order_id_visible} | {order.item_name} ({order.quality})",
+            value=(
+                f"**Cantidad:** {order.cantidad} | **Nivel:** {order.level}\n"
+                f"{asignado_text} | **Estatus:** **{status}**"
+            ),
+            inline=False
+        )
+        
+    await respond(interaction).send_message(embed=embed, ephemeral=True) # ephemeral=True: Solo el usuario ve sus pedidos
+
+# --- TRANSICIONES CON MONGO CAÍDO ---
+async def journal_transition(interaction: discord.Interaction, command_name, pedido_id, order_filter, query, update, applied, **extra):
+    """
+    Con el circuito de Mongo abierto y el diario local configurado, guarda la transición como intención
+    pendiente (ver OrderJournal) y responde que se resolverá al volver la base de datos.
+    Retorna False sin diario: el comando deja que MongoUnavailable llegue al manejador general.
+    """
+    if order_journal is None:
+        return False
+    guild_id = str(interaction.guild_id)
+    await order_journal.append_transition({
+        "guild_id": guild_id, "order": {**order_filter, "guild_id": guild_id}, "filter": query, "update": update,
+        "applied": applied,
+        "rejected": [[
+            str(interaction.user.id),
+            f"❌ Tu /{command_name} del pedido #{pedido_id} no se aplicó: el pedido no existe o ya no cumple las condiciones."
+        ]],
+        **extra,
+    })
+    await respond(interaction).send_message(
+        f"⏳ La base de datos no está disponible. Tu /{command_name} del pedido #{pedido_id} quedó registrado y se aplicará "
+        f"cuando vuelva, si el pedido sigue cumpliendo las condiciones. Te avisaré por DM del resultado.",
+        ephemeral=True
+    )
+    return True
+
+# --- COMANDO /asignar ---
+@app_commands.command(name="asignar", description="Asigna un pedido a un artesano y cambia el estado.", extras={"ephemeral_response": False})
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES) 
+@app_commands.autocomplete(pedido_id=assignable_order_autocomplete, artesano=artisan_autocomplete)
+@app_commands.describe(
+    pedido_id="El código del pedido a asignar (ej. K7M2QX) o su ID completo.",
+    artesano="El miembro de Discord que crafteará el ítem."
+)
+async def assign_order_command(interaction: discord.Interaction, pedido_id: str, artesano: str):
+    pedido_id = pedido_id.strip()
+
+    # 0. Validar el formato del pedido antes de consultar nada
+    order_filter = parse_order_ref(pedido_id)
+    if order_filter is None:
+        await respond(interaction).send_message("❌ Error: El pedido debe ser su código (ej. K7M2QX) o su ID completo de 24 caracteres.", ephemeral=True)
+        return
+    
+    # 1. Obtener el objeto Member a partir del ID (string)
+    member_to_assign = interaction.guild.get_member(int(artesano))
+    
+    if not member_to_assign:
+        await respond(interaction).send_message("❌ Error: No se pudo encontrar el miembro con el ID proporcionado.", ephemeral=True)
+        return
+
+    # 2. Obtener el Oficio del Maestro (desde la caché de permisos)
+    context = permission_resolver.resolve(interaction.user)
+    maestro_profession = context.profession
+
+    if not maestro_profession:
+        await respond(interaction).send_message("❌ Error: No se pudo determinar tu oficio para asignar pedidos.", ephemeral=True)
+        return
+            
+    # VALIDACIÓN DEL ROL DEL ARTESANO ASIGNADO
+    # El artesano debe tener el rol Subdito o Maestro del oficio (ej. "Herrero" o "Herrero Maestro")
+    required_role_name = context.base_role
+    required_role_ids = permission_resolver.profession_role_ids(interaction.guild, required_role_name)
+
+    # Validación 2: El artesano DEBE tener el rol de oficio correcto
+    if not any(r.id in required_role_ids for r in member_to_assign.roles):
+        await respond(interaction).send_message(f"🔒 Error: Solo puedes asignar pedidos a artesanos que tengan el rol **{required_role_name}**.", ephemeral=True)
+        return
+        
+    # 🛠️ AJUSTE PARA EL QUERY DE MONGO: Crear el identificador de MongoDB
+    if isinstance(maestro_profession, list):
+        mongo_identifier = {"$in": maestro_profession} # { "$in": ["Forja de armas", "Forja de armaduras"] }
+    else:
+        mongo_identifier = maestro_profession
+    query = {
+        **order_filter, # Código corto o ObjectId completo
+        "guild_id": str(interaction.guild_id),
+        "oficio_requerido": mongo_identifier # <- ¡USAR EL IDENTIFICADOR CORREGIDO!
+    }
+    update = order_state_update(
+        "ASIGNADA", {"asignado_a_id": str(member_to_assign.id)},
+        oficio=None if isinstance(maestro_profession, list) else maestro_profession
+    )
+
+    # --- FUNCIÓN ANIDADA PARA MONGO DB ---
+    def update_assignment():
+        # Buscamos y actualizamos en una sola operación; devuelve solo los campos proyectados
+        order_doc = pedidos_col.find_one_and_update(query, update, projection=TRANSITION_PROJECTION)
+            
+        if not order_doc:
+            return "NOT_FOUND"
+        return OrderRecord(order_doc)
+
+    # 3. Ejecutar la actualización en segundo plano (con Mongo caído, queda pendiente en el diario)
+    try:
+        result = await run_blocking(update_assignment)
+    except MongoUnavailable:
+        applied = [
+            [str(interaction.user.id), f"✅ Se aplicó tu /asignar pendiente: el pedido #{{code}} (**{{item}}**) quedó **ASIGNADO** a {member_to_assign.display_name}."],
+            [str(member_to_assign.id), (
+                f"🛠️ **¡NUEVA TAREA ASIGNADA!** 🛠️\n\n"
+                f"El Maestro {interaction.user.display_name} te ha asignado un nuevo pedido:\n"
+                f"**Artículo:** {{item}}\n"
+                f"**Código de Pedido:** {{code}}\n"
+                f"Usa el comando **/verpedidos** para ver tu lista de tareas y **/completar** cuando hayas terminado."
+            )],
+        ]
+        if not await journal_transition(
+            interaction, "asignar", pedido_id, order_filter, query, update, applied,
+            track_load=True, assignee_id=str(member_to_assign.id)
+        ):
+            raise
+        return
+
+    if result == "NOT_FOUND":
+        await respond(interaction).send_message(f"❌ Error: Pedido #{pedido_id} no encontrado o no pertenece a tu oficio ({maestro_profession}).", ephemeral=True)
+        return
+    # El registro es el pedido antes del cambio: si ya estaba asignado, la carga pasa al nuevo artesano
+    assignment_dispatcher.record_transition(str(interaction.guild_id), result, str(member_to_assign.id))
+    result_name = result.item_name
+
+    # 4. Respuesta final (Pública)
+    await respond(interaction).send_message(
+        f"✅ Pedido #{result.code} **ASIGNADO** a {member_to_assign.mention} ({maestro_profession}).\n"
+        f"El estado del ítem **{result_name}** ha cambiado a **ASIGNADA**.",
+        ephemeral=False
+    )
+    
+    # 5. ¡ENVIAR NOTIFICACIÓN POR DM AL ARTESANO ASIGNADO!
+    try:
+        # Obtenemos el objeto usuario (Member) que ya lo tenemos como member_to_assign
+        
+        await member_to_assign.send(
+            f"🛠️ **¡NUEVA TAREA ASIGNADA!** 🛠️\n\n"
+            f"El Maestro {interaction.user.display_name} te ha asignado un nuevo pedido:\n"
+            f"**Artículo:** {result_name}\n"
+            f"**Código de Pedido:** {result.code}\n"
+            f"Usa el comando **/verpedidos** para ver tu lista de tareas y **/completar** cuando hayas terminado."
+        )
+    except Exception as e:
+        command_log.warning("Error al enviar DM de asignación", extra={"command": "asignar", "target_user": member_to_assign.id, "error": str(e)})
+        # Notificamos al Maestro en privado si el DM falla
+        await interaction.followup.send(f"⚠️ Advertencia: No pude enviar el DM de notificación a {member_to_assign.display_name}.", ephemeral=True)
+
+# --- COMANDO /recoger ---
+@app_commands.command(name="recoger", description="Marca tu pedido como Entregado, confirmando la recepción del ítem.", extras={"ephemeral_response": False})
+@app_commands.autocomplete(pedido_id=pickup_order_autocomplete)
+@app_commands.describe(pedido_id="El código del pedido (ej. K7M2QX) o su ID completo que deseas marcar como Entregado.")
+async def pickup_order_command(interaction: discord.Interaction, pedido_id: str):
+    pedido_id = pedido_id.strip()    
+    user_id_str = str(interaction.user.id)
+
+    # Validar el formato antes de consultar la base de datos
+    order_filter = parse_order_ref(pedido_id)
+    if order_filter is None:
+        await respond(interaction).send_message("❌ Error: El pedido debe ser su código (ej. K7M2QX) o su ID completo de 24 caracteres.", ephemeral=True)
+        return
+    
+    # Buscamos el pedido, verificando que el usuario sea el solicitante y que el estado sea 'LISTO PARA RECOGER',
+    # y lo marcamos como ENTREGADA en la misma operación
+    query = {
+        **order_filter,
+        "guild_id": str(interaction.guild_id),
+        "solicitante_id": user_match(user_id_str),
+        "estatus": status_match("LISTO PARA RECOGER")
+    }
+    update = order_state_update("ENTREGADA", {"fecha_entrega": discord.utils.utcnow()})
+
+    def update_status():
+        order_doc = pedidos_col.find_one_and_update(query, update, projection=TRANSITION_PROJECTION)
+        
+        if not order_doc:
+            return "NOT_FOUND"
+        return OrderRecord(order_doc)
+
+    try:
+        result = await run_blocking(update_status)
+    except MongoUnavailable:
+        applied = [[user_id_str, "🎉 Se aplicó tu /recoger pendiente: el pedido #{code} del ítem **{item}** está **ENTREGADA**."]]
+        if not await journal_transition(interaction, "recoger", pedido_id, order_filter, query, update, applied):
+            raise
+        return
+
+    if result == "NOT_FOUND":
+        await respond(interaction).send_message(
+            f"❌ Error: Pedido #{pedido_id} no encontrado, no eres el solicitante, o aún no está **LISTO PARA RECOGER**.",
+            ephemeral=True
+        )
+        return
+        
+    # Respuesta final
+    await respond(interaction).send_message(
+        f"🎉 ¡Tu pedido #{result.code} del ítem **{result.item_name}** ha sido marcado como **ENTREGADA**!\n"
+        f"Gracias por tu compra.",
+        ephemeral=False
+    )
+
+# --- COMANDO /completar ---
+@app_commands.command(name="completar", description="Marca un pedido como LISTO PARA RECOGER.", extras={"ephemeral_response": False})
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+@app_commands.autocomplete(pedido_id=completable_order_autocomplete)
+@app_commands.describe(
+    pedido_id="El código del pedido que has terminado (ej. K7M2QX) o su ID completo."
+)
+async def complete_order_command(interaction: discord.Interaction, pedido_id: str):
+    pedido_id = pedido_id.strip()    
+    user_id_str = str(interaction.user.id)
+
+    # 0. Validar el formato antes de consultar la base de datos
+    order_filter = parse_order_ref(pedido_id)
+    if order_filter is None:
+        await respond(interaction).send_message("❌ Error: El pedido debe ser su código (ej. K7M2QX) o su ID completo de 24 caracteres.", ephemeral=True)
+        return
+    # 1. Obtener el Oficio del usuario y si es Maestro (desde la caché de permisos)
+    context = permission_resolver.resolve(interaction.user)
+    is_maestro = context.is_maestro
+    worker_profession = context.profession
+            
+    if not worker_profession:
+        await respond(interaction).send_message("❌ Error: No se pudo determinar tu oficio para completar pedidos.", ephemeral=True)
+        return
+        
+    # 2a. DEFINICIÓN DE LA QUERY DE BÚSQUEDA BASE (código corto o ObjectId ya validados)
+    query = {
+        **order_filter,
+        "guild_id": str(interaction.guild_id),
+        "estatus": status_match(*ESTADOS_ABIERTOS),
+        # El pedido debe ser del oficio del usuario (Herrero: lista de oficios)
+        "oficio_requerido": {"$in": worker_profession} if isinstance(worker_profession, list) else worker_profession
+    }
+
+    # 2b. REGLA DE ACCESO: SOLO MAESTRO O ASIGNADO PUEDEN COMPLETAR
+    
+    # Si el usuario NO es maestro (es Subdito o trabajador):
+    if not is_maestro:
+        # 1. El pedido DEBE estar asignado a este usuario
+        query["asignado_a_id"] = user_match(user_id_str)
+        # 2. El Subdito NO puede completar su propio pedido (aunque se lo asigne un maestro)
+        query["solicitante_id"] = user_mismatch(user_id_str)
+        
+    # Si es MAESTRO, la query ya está lista (solo necesita _id y oficio_requerido)
+    update = order_state_update("LISTO PARA RECOGER")
+
+    # 2c. Función síncrona para actualizar el estado
+    def update_status_to_ready():
+        # Buscamos y actualizamos el estado en una sola operación (devuelve nombre y solicitante)
+        try:
+            order_doc = pedidos_col.find_one_and_update(query, update, projection=TRANSITION_PROJECTION)
+        except Exception as e:
+            mongo_log.error("ERROR DE MONGO", extra={"operation": "complete", "error": str(e)})
+            return "NOT_FOUND" 
+
+        if not order_doc:
+            return "NOT_FOUND" # El pedido no cumple las reglas de acceso (no es Maestro ni asignado)
+        return OrderRecord(order_doc)
+
+    # 3. Ejecutar la actualización en segundo plano (con Mongo caído, queda pendiente en el diario)
+    try:
+        result = await run_blocking(update_status_to_ready)
+    except MongoUnavailable:
+        applied = [
+            [user_id_str, "✅ Se aplicó tu /completar pendiente: **{item}** (Pedido: **{code}**) está **LISTO PARA RECOGER**."],
+            ["solicitante", (
+                "🎉 ¡Tu pedido está listo para recoger!\n\n"
+                "El ítem **{item}** (Pedido: **{code}**) ha sido completado por el artesano.\n"
+                "Usa el comando **/recoger pedido_id: {code}** en el servidor de Discord para marcarlo como **ENTREGADA**."
+            )],
+        ]
+        if not await journal_transition(
+            interaction, "completar", pedido_id, order_filter, query, update, applied, track_load=True
+        ):
+            raise
+        return
+
+    # 4. Manejo de resultados (Mantenemos igual)
+    if result == "NOT_FOUND":
+        await respond(interaction).send_message(
+            f"❌ Error: El pedido #{pedido_id} no fue encontrado o no está asignado a ti/tu oficio.", 
+            ephemeral=True
+        )
+        return
+    assignment_dispatcher.record_transition(str(interaction.guild_id), result)
+        
+    # 5. Respuesta final (Pública y Envío de DM)
+    
+    # El registro devuelto por la transición ya trae el nombre y el ID del solicitante
+    result_name = result.item_name
+    solicitante_id = result.solicitante_id
+    
+    # 5a. Enviamos el mensaje público al canal de pedidos
+    await respond(interaction).send_message(
+        f"✅ ¡PEDIDO COMPLETADO! **{result_name}** ha sido marcado como **LISTO PARA RECOGER**.\n"
+        f"El solicitante (<@{solicitante_id}>) puede usar el comando **/recoger** para finalizar.",
+        ephemeral=False
+    )
+
+    # 5b. ¡ENVIAR NOTIFICACIÓN POR DM!
+    try:
+        # 1. Obtenemos el objeto usuario a partir de su ID
+        solicitante = bot.get_user(int(solicitante_id))
+        
+        if solicitante:
+            # 2. Le enviamos un DM (Mensaje Directo)
+            await solicitante.send(
+                f"🎉 ¡Tu pedido está listo para recoger!\n\n"
+                f"El ítem **{result_name}** (Pedido: **{result.code}**) ha sido completado por el artesano.\n"
+                f"Usa el comando **/recoger pedido_id: {result.code}** en el servidor de Discord para marcarlo como **ENTREGADA**."
+            )
+        else:
+            # Esto puede pasar si el usuario ya no está en el servidor
+            command_log.warning("No se encontró al solicitante para enviar DM", extra={"command": "completar", "target_user": solicitante_id})
+            
+    except Exception as e:
+        command_log.warning("Error al enviar DM al solicitante", extra={"command": "completar", "target_user": solicitante_id, "error": str(e)})
+        # La interacción ya fue respondida, así que solo registramos el error
+
+# --- OPERACIONES EN LOTE (/asignarvarios y /completarvarios) ---
+# El Maestro elige hasta 25 pedidos por página en un Select múltiple. Al elegir, la transición se
+# aplica a todos con una lectura y un solo bulk_write (bulk_order_transition), se publica un único
+# resumen y cada destinatario recibe un único DM. La lista se actualiza con los pedidos que quedan.
+# Como en el asistente de /crearpedido, la acción, la página y el artesano viajan en el custom_id.
+BULK_PAGE_SIZE = 25 # Máximo de opciones de un Select
+BULK_STATES = {"asg": "ASIGNADA", "cmp": "LISTO PARA RECOGER"}
+
+def bulk_order_query(action, context, guild_id, artisan_id=None):
+    """Condición de acceso de un lote: pedidos abiertos del oficio del Maestro (/asignarvarios: no asignados ya al artesano)."""
+    query = {
+        "guild_id": str(guild_id),
+        "oficio_requerido": profession_filter(context.profession),
+        "estatus": status_match("PENDIENTE", "ASIGNADA"),
+    }
+    if action == "asg":
+        query["asignado_a_id"] = user_mismatch(artisan_id)
+    return query
+
+async def bulk_context(interaction: discord.Interaction, action, artisan_id):
+    """(contexto del Maestro, artesano del lote); si no puede operar, responde con el error y retorna None."""
+    context = permission_resolver.resolve(interaction.user)
+    if not context.is_maestro or not context.profession:
+        await respond(interaction).send_message("🔒 Solo los Maestros pueden gestionar pedidos en lote.", ephemeral=True)
+        return None
+    if action != "asg":
+        return context, None
+
+    # El artesano debe tener el rol Subdito o Maestro del oficio, como en /asignar
+    artisan = interaction.guild.get_member(int(artisan_id)) if artisan_id.isdigit() else None
+    role_ids = permission_resolver.profession_role_ids(interaction.guild, context.base_role)
+    if artisan is None or not any(role.id in role_ids for role in artisan.roles):
+        await respond(interaction).send_message(
+            f"🔒 Error: Solo puedes asignar pedidos a artesanos que tengan el rol **{context.base_role}**.", ephemeral=True
+        )
+        return None
+    return context, artisan
+
+async def build_bulk_step(interaction: discord.Interaction, context, action, page, artisan=None):
+    """Construye (contenido, vista) de una página de la lista de un lote."""
+    query = bulk_order_query(action, context, interaction.guild_id, artisan and artisan.id)
+    # Se pide uno de más para saber si hay página siguiente sin contar los pedidos
+    orders = await run_blocking(partial(get_actionable_orders, query, "", BULK_PAGE_SIZE + 1, page * BULK_PAGE_SIZE))
+    has_next = len(orders) > BULK_PAGE_SIZE
+    orders = orders[:BULK_PAGE_SIZE]
+    artisan_id = str(artisan.id) if artisan else ""
+
+    if action == "asg":
+        content = f"**📋 Asignar pedidos a {artisan.mention}**"
+    else:
+        content = "**📋 Marcar pedidos como LISTO PARA RECOGER**"
+    if orders:
+        content += f"\nSelecciona uno o varios pedidos: se aplicará a todos a la vez.\n📄 Página {page + 1}"
+    else:
+        content += "\n✅ No quedan pedidos abiertos de tu oficio" + (" en esta página." if page else ".")
+
+    # Vista sin estado (como las del asistente): la despachan los DynamicItem registrados
+    view = discord.ui.View(timeout=None)
+    if orders:
+        view.add_item(BulkOrderSelect(
+            action, page, artisan_id,
+            options=[SelectOption(label=order_label(order), value=str(order.id)) for order in orders],
+            max_values=len(orders)
+        ))
+    if page > 0 or has_next:
+        view.add_item(BulkOrderPageButton(action, page - 1 if page else 0, artisan_id, "◀", disabled=page == 0))
+        view.add_item(BulkOrderPageButton(action, page + 1, artisan_id, "▶", disabled=not has_next))
+    view.stop()
+    return content, view
+
+async def send_bulk_dms(action, orders, artisan, maestro):
+    """Un solo DM por destinatario con todos sus pedidos del lote."""
+    if action == "asg":
+        recipients = [(artisan.id, artisan, orders)]
+    else:
+        by_requester = {}
+        for order in orders:
+            by_requester.setdefault(order.solicitante_id, []).append(order)
+        recipients = [(user_id, bot.get_user(int(user_id)), user_orders) for user_id, user_orders in by_requester.items()]
+
+    for user_id, user, user_orders in recipients:
+        if user is None:
+            # Esto puede pasar si el usuario ya no está en el servidor
+            command_log.warning("No se encontró al solicitante para enviar DM", extra={"command": "completarvarios", "target_user": user_id})
+            continue
+        lines = "\n".join(f"• **{order.code}** · {order.item_name}" for order in user_orders)
+        if action == "asg":
+            message = (
+                f"🛠️ **¡NUEVAS TAREAS ASIGNADAS!** 🛠️\n\n"
+                f"El Maestro {maestro.display_name} te ha asignado {len(user_orders)} pedido(s):\n{lines}\n"
+                f"Usa el comando **/verpedidos** para ver tu lista de tareas y **/completar** cuando hayas terminado."
+            )
+        else:
+            message = (
+                f"🎉 ¡Tienes {len(user_orders)} pedido(s) listos para recoger!\n\n{lines}\n"
+                f"Usa el comando **/recoger** en el servidor de Discord para marcar cada uno como **ENTREGADA**."
+            )
+        try:
+            await user.send(message)
+        except Exception as e:
+            command_log.warning("Error al enviar DM del lote", extra={"command": f"pb:{action}", "target_user": user_id, "error": str(e)})
+
+async def apply_bulk_selection(interaction: discord.Interaction, action, page, artisan_id, order_ids):
+    checked = await bulk_context(interaction, action, artisan_id)
+    if checked is None:
+        return
+    context, artisan = checked
+    guild_id = str(interaction.guild_id)
+    assignee_id = str(artisan.id) if artisan else None
+
+    # 1. Una lectura y un bulk_write para todo el lote (los pedidos que otro usuario cambió se saltan)
+    applied = await run_blocking(partial(
+        bulk_order_transition,
+        bulk_order_query(action, context, guild_id, assignee_id),
+        order_ids,
+        BULK_STATES[action],
+        {"asignado_a_id": assignee_id} if artisan else None
+    ))
+    if applied is None:
+        await respond(interaction).edit_message(content="❌ Error: No se pudieron actualizar los pedidos en la base de datos.", view=None)
+        return
+    for previous in applied:
+        assignment_dispatcher.record_transition(guild_id, previous, assignee_id)
+
+    # 2. La lista se actualiza con los pedidos que quedan en la misma página
+    content, view = await build_bulk_step(interaction, context, action, page, artisan)
+    await respond(interaction).edit_message(content=content, view=view)
+
+    skipped = len(order_ids) - len(applied)
+    command_log.info("Pedidos actualizados en lote", extra={
+        "command": f"pb:{action}", "guild": guild_id, "orders": len(applied), "skipped": skipped
+    })
+    if not applied:
+        await interaction.followup.send("⚠️ Ninguno de los pedidos elegidos seguía disponible: otro usuario ya los cambió.", ephemeral=True)
+        return
+
+    # 3. Un único resumen público y un DM por destinatario
+    if artisan:
+        header = f"✅ **{len(applied)}** pedido(s) **ASIGNADOS** a {artisan.mention}:"
+        lines = "\n".join(f"• **{order.code}** · {order.item_name}" for order in applied)
+    else:
+        header = f"✅ **{len(applied)}** pedido(s) marcados como **LISTO PARA RECOGER** (usad **/recoger** para finalizar):"
+        lines = "\n".join(f"• **{order.code}** · {order.item_name} · <@{order.solicitante_id}>" for order in applied)
+    if skipped:
+        lines += f"\n⚠️ {skipped} pedido(s) se saltaron porque otro usuario los cambió."
+    await interaction.followup.send(f"{header}\n{lines}", ephemeral=False)
+    await send_bulk_dms(action, applied, artisan, interaction.user)
+
+class BulkOrderSelect(TracedComponent, discord.ui.DynamicItem[discord.ui.Select], template=r"pb:(?P<action>asg|cmp):(?P<page>\d+):(?P<artisan>\d*)"):
+
+    def __init__(self, action, page, artisan_id="", **select_kwargs):
+        super().__init__(discord.ui.Select(
+            custom_id=f"pb:{action}:{page}:{artisan_id}",
+            placeholder="Selecciona los pedidos...",
+            min_values=1,
+            row=0,
+            **select_kwargs
+        ))
+        self.action = action
+        self.page = page
+        self.artisan_id = artisan_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Select, match):
+        return cls(match["action"], int(match["page"]), match["artisan"])
+
+    async def callback(self, interaction: discord.Interaction):
+        await apply_bulk_selection(interaction, self.action, self.page, self.artisan_id, interaction.data['values'])
+
+class BulkOrderPageButton(TracedComponent, discord.ui.DynamicItem[discord.ui.Button], template=r"pb:pg:(?P<action>asg|cmp):(?P<page>\d+):(?P<artisan>\d*)"):
+
+    def __init__(self, action, page, artisan_id="", label="", disabled=False):
+        super().__init__(discord.ui.Button(
+            label=label or "·",
+            style=discord.ButtonStyle.secondary,
+            custom_id=f"pb:pg:{action}:{page}:{artisan_id}",
+            disabled=disabled,
+            row=1
+        ))
+        self.action = action
+        self.page = page
+        self.artisan_id = artisan_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["action"], int(match["page"]), match["artisan"])
+
+    async def callback(self, interaction: discord.Interaction):
+        checked = await bulk_context(interaction, self.action, self.artisan_id)
+        if checked is None:
+            return
+        content, view = await build_bulk_step(interaction, checked[0], self.action, self.page, checked[1])
+        await respond(interaction).edit_message(content=content, view=view)
+
+# --- COMANDOS /asignarvarios y /completarvarios ---
+@app_commands.command(name="asignarvarios", description="Asigna varios pedidos de tu oficio a un artesano de una sola vez (Maestro).")
+@admission_control(cost=2)
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+@app_commands.autocomplete(artesano=artisan_autocomplete)
+@app_commands.describe(artesano="El miembro de Discord que crafteará los ítems.")
+async def bulk_assign_command(interaction: discord.Interaction, artesano: str):
+    checked = await bulk_context(interaction, "asg", artesano.strip())
+    if checked is None:
+        return
+    context, artisan = checked
+    content, view = await build_bulk_step(interaction, context, "asg", 0, artisan)
+    await respond(interaction).send_message(content, view=view, ephemeral=True)
+
+@app_commands.command(name="completarvarios", description="Marca varios pedidos de tu oficio como LISTO PARA RECOGER (Maestro).")
+@admission_control(cost=2)
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+async def bulk_complete_command(interaction: discord.Interaction):
+    checked = await bulk_context(interaction, "cmp", "")
+    if checked is None:
+        return
+    content, view = await build_bulk_step(interaction, checked[0], "cmp", 0)
+    await respond(interaction).send_message(content, view=view, ephemeral=True)
+
+# --- COMANDO /disponibilidad ---
+@app_commands.command(name="disponibilidad", description="Activa o pausa la asignación automática de pedidos para ti.")
+@app_commands.checks.has_any_role(*MANAGEMENT_ROLES)
+@app_commands.describe(disponible="Sí para recibir pedidos automáticamente; No para dejar de recibirlos.")
+async def availability_command(interaction: discord.Interaction, disponible: bool):
+    status = await run_blocking(
+        partial(set_auto_assign_preference, str(interaction.guild_id), str(interaction.user.id), disponible)
+    )
+    if status == "ERROR":
+        await respond(interaction).send_message("❌ Error: No se pudo guardar tu preferencia en la base de datos.", ephemeral=True)
+        return
+    assignment_dispatcher.set_available(interaction.user, disponible)
+    await respond(interaction).send_message(
+        "✅ Volverás a recibir pedidos automáticamente." if disponible
+        else "⏸️ Ya no recibirás pedidos automáticamente. Los Maestros aún pueden asignártelos con /asignar.",
+        ephemeral=True
+    )
+
+COMMANDS = [
+    view_orders_command, my_orders_command, assign_order_command, pickup_order_command, complete_order_command,
+    bulk_assign_command, bulk_complete_command,
+]
+DYNAMIC_ITEMS = (BulkOrderSelect, BulkOrderPageButton)
+if AUTO_ASSIGN:
+    COMMANDS.append(availability_command)
+
+async def setup(bot):
+    for command in COMMANDS:
+        bot.tree.add_command(command)
+    bot.add_dynamic_items(*DYNAMIC_ITEMS)
+    bot.add_listener(on_mongo_connected)
+    bot.add_listener(on_member_update)
+    for event in ROLE_EVENTS:
+        bot.add_listener(refresh_assignment_roles, event)
+    if order_journal is not None:
+        order_journal.start()
+    # Al recargar con Mongo ya conectado, on_mongo_connected no se repite: solo se relanza la tarea
+    if mongo_manager.connected_once and REMINDER_SLAS:
+        order_reminders_task.start()
+    if mongo_manager.connected_once and IS_PRIMARY_PROCESS:
+        archive_delivered_orders_task.start()
+        # Las migraciones ya terminadas se saltan con una lectura de su progreso
+        if schema_state.compat_reads:
+            schema_migrations_task.start()
+
+async def teardown(bot):
+    for command in COMMANDS:
+        bot.tree.remove_command(command.name)
+    bot.remove_dynamic_items(*DYNAMIC_ITEMS)
+    bot.remove_listener(on_mongo_connected)
+    bot.remove_listener(on_member_update)
+    for event in ROLE_EVENTS:
+        bot.remove_listener(refresh_assignment_roles, event)
+    archive_delivered_orders_task.cancel()
+    order_reminders_task.cancel()
+    schema_migrations_task.cancel()
@@ -0,0 +1,365 @@
+# tests/conftest.py - Banco de pruebas de idas a Mongo: colecciones de mongomock envueltas en un
+# contador, interacciones de Discord falsas y un executor en línea para que run_blocking sea determinista
+import asyncio
+import concurrent.futures
+from datetime import timedelta
+
+import discord
+import mongomock
+import pymongo.collection
+import pymongo.results
+import pytest
+
+import core
+import datos
+import extensions.admin
+import extensions.asistente
+import extensions.exportar
+import extensions.inventario
+import extensions.pedidos
+
+MODULES = (core, datos, extensions.admin, extensions.asistente, extensions.exportar, extensions.inventario, extensions.pedidos)
+
+GUILD_ID = 900
+MAESTRO_ID = 101
+SUBDITO_ID = 102
+CLIENTE_ID = 103
+
+# --- CONTADOR DE IDAS A MONGO ---
+class MongoCounter:
+    """Idas al servidor (comandos y getMore) y documentos devueltos, con el detalle de cada operación."""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.documents = 0
+        self.operations = []
+
+    def round_trip(self, collection, operation):
+        self.round_trips += 1
+        self.operations.append(f"{collection}.{operation}")
+
+    def reset(self):
+        self.round_trips = 0
+        self.documents = 0
+        self.operations = []
+
+class CountingCursor:
+    """
+    Cursor de mongomock que cuenta como un servidor real: una ida al empezar a iterar (find) y un
+    getMore por cada lote siguiente (batch_size documentos por lote si se fijó; si no, 101 en el
+    primero y el resto en un solo getMore).
+    """
+
+    def __init__(self, cursor, counter, collection, operation, batch_size=None):
+        self._cursor = cursor
+        self._counter = counter
+        self._collection = collection
+        self._operation = operation
+        self._batch_size = batch_size
+        self._returned = 0
+        self._started = False
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            if name == "batch_size":
+                self._batch_size = args[0]
+            result = attr(*args, **kwargs)
+            return self if result is self._cursor else result
+        return chained
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._started:
+            self._started = True
+            self._counter.round_trip(self._collection, self._operation)
+        doc = next(self._cursor)
+        batch = self._batch_size
+        if (batch and self._returned and self._returned % batch == 0) or (not batch and self._returned == 101):
+            self._counter.round_trip(self._collection, "getMore")
+        self._returned += 1
+        self._counter.documents += 1
+        return doc
+
+class CountingCollection:
+    """Colección de mongomock que anota una ida por operación y los documentos que devuelve."""
+    SINGLE_DOC = ("find_one", "find_one_and_update", "find_one_and_delete", "find_one_and_replace")
+
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    @property
+    def name(self):
+        return self._collection.name
+
+    def with_options(self, *args, **kwargs):
+        return self
+
+    def find(self, *args, **kwargs):
+        return CountingCursor(self._collection.find(*args, **kwargs), self._counter, self.name, "find")
+
+    def aggregate(self, *args, **kwargs):
+        self._counter.round_trip(self.name, "aggregate") # El servidor ejecuta la agregación al llamarla
+        cursor = CountingCursor(self._collection.aggregate(*args, **kwargs), self._counter, self.name, "aggregate")
+        cursor._started = True
+        return cursor
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        # Una sola ida; mongomock no entiende las operaciones de pymongo 4.9+ (llevan 'sort'), así que se aplican una a una
+        self._counter.round_trip(self.name, "bulk_write")
+        totals = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        for request in requests:
+            operation = type(request).__name__
+            if operation in ("UpdateOne", "UpdateMany", "ReplaceOne"):
+                method = {
+                    "UpdateOne": self._collection.update_one, "UpdateMany": self._collection.update_many,
+                    "ReplaceOne": self._collection.replace_one,
+                }[operation]
+                result = method(request._filter, request._doc, upsert=bool(request._upsert))
+                totals["nMatched"] += result.matched_count
+                totals["nModified"] += result.modified_count
+                totals["nUpserted"] += result.upserted_id is not None
+            elif operation in ("DeleteOne", "DeleteMany"):
+                method = self._collection.delete_one if operation == "DeleteOne" else self._collection.delete_many
+                totals["nRemoved"] += method(request._filter).deleted_count
+            else:
+                self._collection.insert_one(request._doc)
+                totals["nInserted"] += 1
+        return pymongo.results.BulkWriteResult(totals, True)
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter.round_trip(self.name, name)
+            result = attr(*args, **kwargs)
+            if name in self.SINGLE_DOC and result is not None:
+                self._counter.documents += 1
+            elif name == "distinct":
+                self._counter.documents += len(result)
+            return result
+        return counted
+
+class CountingClient:
+    def __init__(self, counter):
+        self.admin = self
+        self._counter = counter
+
+    def command(self, name, *args, **kwargs):
+        self._counter.round_trip("admin", name)
+        return {"ok": 1.0}
+
+class InlineExecutor(concurrent.futures.ThreadPoolExecutor):
+    """Ejecuta run_blocking en el mismo hilo: mongomock no es seguro entre hilos y las cuentas no dependen del orden."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+# --- DISCORD FALSO ---
+class FakeRole:
+    def __init__(self, role_id, name):
+        self.id = role_id
+        self.name = name
+        self.members = []
+
+class FakeMember:
+    def __init__(self, member_id, name, guild, roles=()):
+        self.id = member_id
+        self.display_name = name
+        self.name = name
+        self.mention = f"<@{member_id}>"
+        self.bot = False
+        self.guild = guild
+        self.roles = list(roles)
+        self.sent = []
+        for role in self.roles:
+            role.members.append(self)
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = "Gremio"
+        self.roles = []
+        self.members = {}
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+        self.modal = None
+        self.view = None
+        self.deferred = None
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self.messages.append(content or kwargs.get("embed"))
+        self.view = kwargs.get("view")
+
+    async def edit_message(self, content=None, **kwargs):
+        self._done = True
+        self.messages.append(content)
+        self.view = kwargs.get("view")
+
+    async def defer(self, **kwargs):
+        self._done = True
+        self.deferred = kwargs
+
+    async def send_modal(self, modal):
+        self._done = True
+        self.modal = modal
+
+class FakeFollowup:
+    def __init__(self):
+        self.messages = []
+        self.ephemeral = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content or kwargs.get("embed") or kwargs.get("file"))
+        self.ephemeral.append(kwargs.get("ephemeral", False))
+
+class FakeInteraction:
+    def __init__(self, user, values=None):
+        self.user = user
+        self.guild = user.guild
+        self.guild_id = user.guild.id
+        self.command = None
+        self.type = discord.InteractionType.component
+        self.data = {"values": values or []}
+        self.created_at = discord.utils.utcnow()
+        self.extras = {}
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.original_deleted = False
+
+    async def delete_original_response(self):
+        self.original_deleted = True
+
+class World:
+    """Servidor falso con un Maestro de Cocina, un Subdito de Cocina y un cliente sin oficio."""
+
+    def __init__(self):
+        self.guild = FakeGuild(GUILD_ID)
+        cocinero = FakeRole(11, "Cocinero")
+        maestro = FakeRole(12, "Cocinero Maestro")
+        self.guild.roles = [cocinero, maestro]
+        self.maestro = FakeMember(MAESTRO_ID, "Maestra", self.guild, [maestro])
+        self.subdito = FakeMember(SUBDITO_ID, "Aprendiz", self.guild, [cocinero])
+        self.cliente = FakeMember(CLIENTE_ID, "Cliente", self.guild)
+        self.guild.members = {member.id: member for member in (self.maestro, self.subdito, self.cliente)}
+
+    def interaction(self, user, values=None):
+        return FakeInteraction(user, values)
+
+# --- DATOS DE PRUEBA ---
+RECIPES = [
+    {
+        "recipe_id": f"COC_{n:02d}", "name": f"Guiso {n:02d}", "category": "Consumible", "type": "Comida",
+        "profession": "Cocina",
+        "variations": [{"level_name": "III", "quality_options": [{"quality_name": "Común"}, {"quality_name": "Rara"}]}],
+    }
+    for n in range(40) # Más de 25: la lista de ítems se pagina
+]
+
+def order_doc(code, n, estatus, asignado=None):
+    """Pedido de Cocina del cliente en el formato de Mongo; 'n' ordena las fechas de solicitud."""
+    when = discord.utils.utcnow() - timedelta(days=10, minutes=-n)
+    return datos.storage_order({
+        "item_name": f"Guiso {n % 40:02d}", "recipe_id": f"COC_{n % 40:02d}", "level": "III", "quality": "Común", "cantidad": 1,
+        "oficio_requerido": "Cocina", "solicitante_id": str(CLIENTE_ID), "guild_id": str(GUILD_ID), "estatus": estatus,
+        **({"asignado_a_id": str(asignado)} if asignado else {}),
+        "fecha_solicitud": when, "fecha_estado": when, "codigo": code,
+    })
+
+def seed(db):
+    now = discord.utils.utcnow()
+    db["Item"].insert_many([dict(recipe) for recipe in RECIPES])
+    guild_id = str(GUILD_ID)
+    orders = [
+        order_doc(f"PEDAA{datos.ORDER_CODE_ALPHABET[n]}", n, estatus, asignado)
+        for n, (estatus, asignado) in enumerate([
+            ("PENDIENTE", None), ("PENDIENTE", None), ("ASIGNADA", SUBDITO_ID), ("ASIGNADA", SUBDITO_ID),
+            ("LISTO PARA RECOGER", SUBDITO_ID), ("ENTREGADA", SUBDITO_ID),
+        ])
+    ]
+    db["Pedido"].insert_many(orders)
+    delivered = {key: value for key, value in orders[5].items() if key != "_id"}
+    db["PedidoArchivo"].insert_many([dict(delivered, codigo=f"ARC{n:03d}") for n in range(3)])
+    db["inventario"].insert_many([
+        {"guild_id": guild_id, "name": name, "quantity": quantity}
+        for name, quantity in (("Harina", 10), ("Sal", 0), ("Especias", 4))
+    ])
+    # Los mismos documentos que escribe el bot: tres entradas de 5 que dejan la Harina en 10
+    db["inventario_movimientos"].insert_many([
+        {
+            **datos.build_inventory_movement(guild_id, "Harina", 5, 10 - 5 * n, user_id=str(MAESTRO_ID), command="inventarioagregar"),
+            "timestamp": now - timedelta(hours=n),
+        }
+        for n in range(3)
+    ])
+
+# --- FIXTURES ---
+@pytest.fixture
+def mongo(monkeypatch):
+    """Sustituye las colecciones (y sus vistas de lectura) de todos los módulos por mongomock con contador."""
+    counter = MongoCounter()
+    db = mongomock.MongoClient().db
+    seed(db)
+    for module in MODULES:
+        for name, value in list(vars(module).items()):
+            if isinstance(value, pymongo.collection.Collection):
+                monkeypatch.setattr(module, name, CountingCollection(db[value.name], counter))
+    client = CountingClient(counter)
+    monkeypatch.setattr(core, "client", client)
+    monkeypatch.setattr(extensions.admin, "client", client)
+    monkeypatch.setattr(core.mongo_manager, "available", True)
+    monkeypatch.setattr(type(core.bot), "loop", property(lambda self: asyncio.get_running_loop()), raising=False)
+    monkeypatch.setattr(datos.inventory_writer, "window_seconds", 0)
+    datos.catalog_cache.invalidate()
+    counter.reset()
+    yield counter
+    datos.catalog_cache.invalidate()
+
+@pytest.fixture
+def world():
+    core.permission_resolver.invalidate_guild(GUILD_ID)
+    return World()
+
+def run_handler(handler):
+    """
+    Ejecuta un handler asíncrono con run_blocking en línea y espera también el trabajo que deja en
+    segundo plano (historial del inventario, volcados), que cuenta para su presupuesto.
+    """
+    async def main():
+        asyncio.get_running_loop().set_default_executor(InlineExecutor())
+        result = await handler()
+        while True:
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if not pending:
+                return result
+            await asyncio.gather(*pending, return_exceptions=True)
+    return asyncio.run(main())
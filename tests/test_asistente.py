@@ -0,0 +1,85 @@
+# tests/test_asistente.py - Los custom_id del asistente caben en el límite de Discord aunque la categoría sea larga,
+# y con el diario local los pedidos se registran aunque Mongo no esté disponible
+import re
+
+import discord
+import pytest
+
+import core
+import datos
+import extensions.asistente as asistente
+from conftest import run_handler
+
+# 88 caracteres: cabe en el Select de tipos, pero no en los botones de página con la categoría tal cual
+LONG_CATEGORY = "Consumibles de Temporada para los Grandes Festivales de Invierno del Gremio de Cocineros"
+
+def custom_ids(view):
+    return [item.custom_id for item in view.children]
+
+def test_long_category_uses_short_key_in_every_custom_id(mongo, world):
+    datos.items_col._collection.insert_many([
+        {"recipe_id": f"FES_{n:02d}", "name": f"Dulce {n:02d}", "category": LONG_CATEGORY, "type": f"Tipo {n:02d}", "profession": "Cocina"}
+        for n in range(30) # Más de 25 tipos: la lista de tipos se pagina
+    ])
+
+    interaction = world.interaction(world.cliente, [LONG_CATEGORY])
+    run_handler(lambda: asistente.category_select_callback(interaction, ""))
+    assert LONG_CATEGORY in interaction.response.messages[-1]
+    ids = custom_ids(interaction.response.view)
+    assert any(custom_id.startswith("pw:pg:typ:") for custom_id in ids)
+    assert all(len(custom_id) <= 100 and LONG_CATEGORY not in custom_id for custom_id in ids)
+
+    # Tras un reinicio la clave corta se resuelve de nuevo desde el catálogo
+    datos.catalog_cache._category_keys.clear()
+    page_id = next(custom_id for custom_id in ids if custom_id.startswith("pw:pg:typ:1:"))
+    match = re.fullmatch(asistente.WizardPageButton.__discord_ui_compiled_template__, page_id)
+    interaction = world.interaction(world.cliente)
+    button = run_handler(lambda: asistente.WizardPageButton.from_custom_id(interaction, None, match))
+    run_handler(lambda: button.callback(interaction))
+    assert "Página 2 de 2" in interaction.response.messages[-1]
+
+    state = custom_ids(interaction.response.view)[0].split(":", 2)[2]
+    interaction = world.interaction(world.cliente, ["Tipo 27"])
+    run_handler(lambda: asistente.type_select_callback(interaction, state))
+    assert "Paso 3" in interaction.response.messages[-1]
+
+def test_wizard_custom_id_rejects_ids_over_discord_limit():
+    with pytest.raises(ValueError):
+        asistente.wizard_custom_id("pg", "item", "0", "x" * 30, "y" * 70)
+
+def submit_order_modal(world, recipe_data):
+    interaction = world.interaction(world.cliente)
+    interaction.type = discord.InteractionType.modal_submit
+
+    async def submit():
+        modal = asistente.OrderModal(recipe_data)
+        modal.quantity._value = "2"
+        modal.auto_defer_kwargs = None # La interacción falsa no necesita vigilar el plazo
+        # Igual que discord.py: on_submit solo se ejecuta si interaction_check lo permite
+        if await modal.interaction_check(interaction):
+            await modal.on_submit(interaction)
+    run_handler(submit)
+    return interaction
+
+def test_order_modal_is_journaled_while_mongo_is_down(mongo, world, monkeypatch, tmp_path):
+    journal = datos.OrderJournal(str(tmp_path / "pedidos.db"), 0, 100, 0)
+    monkeypatch.setattr(asistente, "order_journal", journal)
+    orders_before = datos.pedidos_col._collection.count_documents({})
+    recipe_data = datos.get_final_recipe_data("COC_07|III", "Rara")
+    monkeypatch.setattr(core.mongo_manager, "available", False)
+
+    interaction = submit_order_modal(world, recipe_data)
+
+    assert interaction.response.messages[-1].startswith("✅ **¡NUEVO PEDIDO CREADO!**")
+    rows = journal._read_batch()
+    assert len(rows) == 1 and '"recipe_id": "COC_07"' in rows[0][1] and '"estatus": "PENDIENTE"' in rows[0][1]
+    assert datos.pedidos_col._collection.count_documents({}) == orders_before
+
+def test_order_modal_is_rejected_while_mongo_is_down_without_journal(mongo, world, monkeypatch):
+    monkeypatch.setattr(asistente, "order_journal", None)
+    recipe_data = datos.get_final_recipe_data("COC_07|III", "Rara")
+    monkeypatch.setattr(core.mongo_manager, "available", False)
+
+    interaction = submit_order_modal(world, recipe_data)
+
+    assert interaction.response.messages[-1].startswith("🔌 La base de datos no está disponible")
@@ -0,0 +1,32 @@
+# tests/test_core.py - Respuestas diferidas por el plazo: un mensaje efímero tras diferir en público
+# no hereda la visibilidad del mensaje "pensando"
+import core
+from conftest import run_handler
+
+def auto_deferred_reply(world, defer_kwargs, ephemeral):
+    interaction = world.interaction(world.maestro)
+    responder = core.InteractionResponder(interaction, defer_kwargs)
+    interaction.extras["responder"] = responder
+
+    async def handler():
+        await responder._auto_defer()
+        await core.respond(interaction).send_message("❌ Error", ephemeral=ephemeral)
+
+    run_handler(handler)
+    assert responder.auto_deferred
+    assert interaction.followup.messages == ["❌ Error"]
+    return interaction
+
+def test_ephemeral_reply_after_public_defer_replaces_placeholder(world):
+    interaction = auto_deferred_reply(world, {"thinking": True, "ephemeral": False}, ephemeral=True)
+    assert interaction.original_deleted
+    assert interaction.followup.ephemeral == [True]
+
+def test_public_reply_after_public_defer_keeps_placeholder(world):
+    interaction = auto_deferred_reply(world, {"thinking": True, "ephemeral": False}, ephemeral=False)
+    assert not interaction.original_deleted
+
+def test_ephemeral_reply_after_ephemeral_defer_keeps_placeholder(world):
+    interaction = auto_deferred_reply(world, {"thinking": True, "ephemeral": True}, ephemeral=True)
+    assert not interaction.original_deleted
+    assert interaction.followup.ephemeral == [True]
@@ -0,0 +1,36 @@
+# tests/test_exportar.py - Una exportación que falla a medias no deja archivos abiertos ni partes en disco
+import os
+
+import datos
+import extensions.exportar as exportar
+from conftest import run_handler
+
+def test_failed_export_closes_and_removes_open_part(mongo, world, monkeypatch):
+    writers = []
+
+    class TrackedWriter(datos.OrderExportWriter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.opened = []
+            writers.append(self)
+
+        def _open_part(self):
+            super()._open_part()
+            self.opened.append((self._path, self._raw))
+
+    def failing_batch(cursor, writer, batch_size):
+        # Escribe un pedido (queda una parte abierta) y después falla la consulta
+        writer.write(next(iter(cursor)))
+        return None
+    monkeypatch.setattr(exportar, "OrderExportWriter", TrackedWriter)
+    monkeypatch.setattr(exportar, "export_orders_batch", failing_batch)
+
+    interaction = world.interaction(world.maestro)
+    run_handler(lambda: exportar.export_orders_command.callback(interaction))
+
+    assert interaction.followup.messages[-1].startswith("❌ Error al leer los pedidos")
+    (writer,) = writers
+    assert writer.opened and writer.ready_parts == []
+    for path, raw in writer.opened:
+        assert raw.closed
+        assert not os.path.exists(path)
@@ -0,0 +1,91 @@
+# tests/test_inventario.py - Historial del inventario: ningún movimiento se pierde si Mongo falla
+# después de la escritura del inventario, y los cambios de una ventana se aplican como si llegaran uno tras otro
+import asyncio
+
+import discord
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import datos
+import extensions.inventario as inventario
+from conftest import run_handler
+
+def failing_once(monkeypatch, collection, method):
+    """Hace que collection.method falle una vez como si se cayera la conexión."""
+    original = getattr(collection, method)
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise AutoReconnect("conexión perdida")
+        return original(*args, **kwargs)
+    monkeypatch.setattr(collection, method, flaky, raising=False)
+    return calls
+
+def test_ledger_retries_movements_after_mongo_error(mongo, world, monkeypatch):
+    monkeypatch.setattr(datos.inventory_ledger, "retry_seconds", 0)
+    calls = failing_once(monkeypatch, datos.inventario_movimientos_col, "insert_many")
+    before = datos.inventario_movimientos_col._collection.count_documents({})
+
+    interaction = world.interaction(world.maestro)
+    run_handler(lambda: inventario.add_inventory_command.callback(interaction, "Harina", 3))
+    interaction = world.interaction(world.maestro)
+    run_handler(lambda: inventario.set_inventory_command.callback(interaction, "Sal", 7))
+
+    assert len(calls) == 3 # Un fallo y dos escrituras
+    assert datos.inventory_ledger.pending == 0
+    movements = list(datos.inventario_movimientos_col._collection.find({}, {"_id": 0, "name": 1, "delta": 1, "command": 1}).skip(before))
+    assert movements == [
+        {"name": "Harina", "delta": 3, "command": "inventarioagregar"},
+        {"name": "Sal", "delta": 7, "command": "setitem"},
+    ]
+
+def test_ledger_drops_batches_that_fail_permanently(mongo, world, monkeypatch):
+    original = datos.inventario_movimientos_col.insert_many
+    calls = []
+
+    def invalid_once(movements, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]})
+        return original(movements, **kwargs)
+    monkeypatch.setattr(datos.inventario_movimientos_col, "insert_many", invalid_once, raising=False)
+    monkeypatch.setattr(datos.inventory_ledger, "retry_seconds", 60) # Un reintento colgaría la prueba
+    before = datos.inventario_movimientos_col._collection.count_documents({})
+
+    interaction = world.interaction(world.maestro)
+    run_handler(lambda: inventario.add_inventory_command.callback(interaction, "Harina", 3))
+    interaction = world.interaction(world.maestro)
+    run_handler(lambda: inventario.add_inventory_command.callback(interaction, "Sal", 2))
+
+    assert len(calls) == 2
+    assert datos.inventory_ledger.pending == 0
+    assert datos.inventario_movimientos_col._collection.count_documents({}) == before + 1
+
+def test_window_applies_changes_in_arrival_order(mongo, world):
+    # Stock 3 y en la misma ventana -10 y +5: igual que uno tras otro, el retiro deja 0 y lo agregado se conserva
+    guild_id = str(world.guild.id)
+    datos.inventario_col._collection.insert_one({"guild_id": guild_id, "name": "Miel", "quantity": 3})
+
+    async def window():
+        return await asyncio.gather(
+            datos.inventory_writer.apply(guild_id, "Miel", -10, command="inventarioretirar"),
+            datos.inventory_writer.apply(guild_id, "Miel", 5, command="inventarioagregar"),
+        )
+    assert run_handler(window) == [("DELETED", 0), ("SUCCESS", 5)]
+    assert datos.inventario_col._collection.find_one({"name": "Miel"})["quantity"] == 5
+
+    movements = list(datos.inventario_movimientos_col._collection.find({"name": "Miel"}, {"_id": 0, "delta": 1, "quantity": 1}))
+    assert movements == [{"delta": -3, "quantity": 0}, {"delta": 5, "quantity": 5}]
+    assert datos.get_inventory_quantity_at(guild_id, "Miel", discord.utils.utcnow()) == 5
+
+def test_window_deletes_item_left_at_zero(mongo, world):
+    guild_id = str(world.guild.id)
+
+    async def window():
+        return await asyncio.gather(
+            datos.inventory_writer.apply(guild_id, "Harina", 4, command="inventarioagregar"),
+            datos.inventory_writer.apply(guild_id, "Harina", -20, command="inventarioretirar"),
+        )
+    assert run_handler(window) == [("SUCCESS", 14), ("DELETED", 0)]
+    assert datos.inventario_col._collection.find_one({"name": "Harina"}) is None
@@ -0,0 +1,48 @@
+# tests/test_pedidos.py - Transiciones de estado con Mongo caído: quedan pendientes en el diario local y se
+# resuelven con su actualización condicional al volver la base de datos
+import core
+import datos
+import extensions.pedidos as pedidos
+from conftest import CLIENTE_ID, run_handler
+
+def test_transitions_are_journaled_and_resolved_when_mongo_returns(mongo, world, monkeypatch, tmp_path):
+    journal = datos.OrderJournal(str(tmp_path / "pedidos.db"), 0, 100, 0)
+    monkeypatch.setattr(pedidos, "order_journal", journal)
+    monkeypatch.setattr(core.bot, "get_user", lambda user_id: world.guild.get_member(user_id))
+    monkeypatch.setattr(core.mongo_manager, "available", False)
+
+    # /completar y después dos /recoger: el primero depende del anterior, el segundo ya no encuentra el pedido listo
+    interaction = world.interaction(world.maestro)
+    run_handler(lambda: pedidos.complete_order_command.callback(interaction, "PEDAAC"))
+    replies = [interaction.response.messages[-1]]
+    for _ in range(2):
+        interaction = world.interaction(world.cliente)
+        run_handler(lambda: pedidos.pickup_order_command.callback(interaction, "PEDAAC"))
+        replies.append(interaction.response.messages[-1])
+    assert all(reply.startswith("⏳ La base de datos no está disponible") for reply in replies)
+    delivered = {**datos.parse_order_ref("PEDAAC"), "estatus": datos.status_match("ENTREGADA")}
+    assert datos.pedidos_col._collection.count_documents(delivered) == 0
+
+    monkeypatch.setattr(core.mongo_manager, "available", True)
+    assert run_handler(journal._flush_transitions) is False
+
+    assert journal._read_transitions() == []
+    assert datos.pedidos_col._collection.count_documents(delivered) == 1
+    (completed,) = world.maestro.sent
+    assert completed.startswith("✅ Se aplicó tu /completar pendiente") and "PEDAAC" in completed
+    ready, picked_up, rejected = world.guild.get_member(CLIENTE_ID).sent
+    assert ready.startswith("🎉 ¡Tu pedido está listo para recoger!")
+    assert picked_up.startswith("🎉 Se aplicó tu /recoger pendiente")
+    assert rejected.startswith("❌ Tu /recoger del pedido #PEDAAC no se aplicó")
+
+def test_replayed_transition_is_recognised_as_applied(mongo, world):
+    intent = {
+        "id": "intencion-1", "guild_id": str(world.guild.id), "order": datos.parse_order_ref("PEDAAA"),
+        "filter": {**datos.parse_order_ref("PEDAAA"), "estatus": datos.status_match("PENDIENTE")},
+        "update": datos.order_state_update("ASIGNADA", {"asignado_a_id": str(world.subdito.id)}),
+    }
+    record, replayed = datos.apply_order_transition(intent)
+    assert record is not None and not replayed
+    # Aplicada pero sin borrar del diario (caída del proceso): repetirla no la da por rechazada
+    record, replayed = datos.apply_order_transition(intent)
+    assert record is not None and replayed
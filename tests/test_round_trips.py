@@ -0,0 +1,266 @@
+# tests/test_round_trips.py - Presupuesto de idas a Mongo y documentos devueltos por cada handler.
+# Si un cambio hace que un comando, paso del asistente o autocompletado consulte más de lo declarado
+# (una consulta por elemento, un find sin límite...), la prueba falla con el detalle de las operaciones.
+import pytest
+
+import datos
+import extensions.admin as admin
+import extensions.asistente as asistente
+import extensions.exportar as exportar
+import extensions.inventario as inventario
+import extensions.pedidos as pedidos
+from conftest import order_doc, run_handler
+
+# handler -> (máximo de idas a Mongo, máximo de documentos devueltos)
+BUDGETS = {
+    # pedidos
+    "artisan_autocomplete": (0, 0),
+    "assignable_order_autocomplete": (1, 4),
+    "completable_order_autocomplete[maestro]": (1, 4),
+    "completable_order_autocomplete[subdito]": (1, 2),
+    "pickup_order_autocomplete": (1, 1),
+    "verpedidos[maestro]": (1, 5),
+    "verpedidos[subdito]": (1, 3),
+    "mispedidos": (1, 6),
+    "mispedidos[historial]": (3, 9),
+    "asignar": (1, 1),
+    "completar": (1, 1),
+    "recoger": (1, 1),
+    "asignarvarios": (1, 26),
+    "completarvarios": (1, 26),
+    "BulkOrderSelect[asignar]": (3, 32),
+    "BulkOrderSelect[completar]": (3, 34),
+    "BulkOrderPageButton": (1, 9),
+    "BulkOrderSelect[carrera]": (4, 4),
+    # inventario
+    "inventory_all_autocomplete": (1, 3),
+    "inventory_item_autocomplete": (1, 25),
+    "inventory_stock_autocomplete": (1, 2),
+    "inventarioagregar": (2, 1),
+    "inventarioretirar": (2, 1),
+    "verinventario": (1, 2),
+    "setitem": (2, 1),
+    "inventariohistorial": (1, 5),
+    # asistente /crearpedido (caché del catálogo vacía: el peor caso)
+    "crearpedido": (1, 1),
+    "crearpedido[caché]": (0, 0),
+    "category_select_callback": (1, 1),
+    "type_select_callback": (1, 40),
+    "item_name_select_callback": (1, 1),
+    "level_select_callback": (1, 1),
+    "final_quality_select_callback": (1, 1),
+    "WizardPageButton": (1, 40),
+    "WizardLetterSelect": (1, 40),
+    "CatalogFilterModal": (1, 40),
+    "OrderModal": (1, 0),
+    # exportar y admin
+    "exportarpedidos": (2, 9),
+    "ping": (1, 0),
+}
+
+def check_budget(mongo, name, handler):
+    """Ejecuta el handler desde cero en el contador y compara con su presupuesto."""
+    mongo.reset()
+    result = run_handler(handler)
+    max_round_trips, max_documents = BUDGETS[name]
+    detail = f"{name}: {mongo.round_trips} idas, {mongo.documents} documentos -> {mongo.operations}"
+    assert mongo.round_trips <= max_round_trips, detail
+    assert mongo.documents <= max_documents, detail
+    return result
+
+@pytest.fixture(autouse=True)
+def without_journal(monkeypatch):
+    # OrderModal inserta directamente en Mongo: el diario local haría la escritura en segundo plano
+    monkeypatch.setattr(asistente, "order_journal", None)
+
+def covers(*names):
+    """Marca los presupuestos que ejercita una prueba."""
+    def decorator(test):
+        test.budgets = names
+        return test
+    return decorator
+
+def test_every_budget_is_exercised():
+    exercised = {
+        name for test in globals().values() if callable(test) and getattr(test, "budgets", None)
+        for name in test.budgets
+    }
+    assert exercised == set(BUDGETS)
+
+# --- PEDIDOS ---
+@covers(
+    "artisan_autocomplete", "assignable_order_autocomplete", "completable_order_autocomplete[maestro]",
+    "completable_order_autocomplete[subdito]", "pickup_order_autocomplete",
+)
+def test_order_autocompletes(mongo, world):
+    choices = check_budget(mongo, "artisan_autocomplete", lambda: pedidos.artisan_autocomplete(world.interaction(world.maestro), ""))
+    assert {choice.value for choice in choices} == {str(world.maestro.id), str(world.subdito.id)}
+
+    choices = check_budget(mongo, "assignable_order_autocomplete", lambda: pedidos.assignable_order_autocomplete(world.interaction(world.maestro), "PEDAA"))
+    assert [choice.value for choice in choices] == ["PEDAAA", "PEDAAB", "PEDAAC", "PEDAAD"]
+
+    choices = check_budget(mongo, "completable_order_autocomplete[maestro]", lambda: pedidos.completable_order_autocomplete(world.interaction(world.maestro), ""))
+    assert len(choices) == 4
+    choices = check_budget(mongo, "completable_order_autocomplete[subdito]", lambda: pedidos.completable_order_autocomplete(world.interaction(world.subdito), ""))
+    assert [choice.value for choice in choices] == ["PEDAAC", "PEDAAD"]
+
+    choices = check_budget(mongo, "pickup_order_autocomplete", lambda: pedidos.pickup_order_autocomplete(world.interaction(world.cliente), ""))
+    assert [choice.value for choice in choices] == ["PEDAAE"]
+
+@covers("verpedidos[maestro]", "verpedidos[subdito]", "mispedidos", "mispedidos[historial]")
+def test_order_listings(mongo, world):
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "verpedidos[maestro]", lambda: pedidos.view_orders_command.callback(interaction))
+    assert interaction.response.messages or interaction.followup.messages
+
+    interaction = world.interaction(world.subdito)
+    check_budget(mongo, "verpedidos[subdito]", lambda: pedidos.view_orders_command.callback(interaction))
+    assert interaction.response.messages or interaction.followup.messages
+
+    interaction = world.interaction(world.cliente)
+    check_budget(mongo, "mispedidos", lambda: pedidos.my_orders_command.callback(interaction))
+    interaction = world.interaction(world.cliente)
+    check_budget(mongo, "mispedidos[historial]", lambda: pedidos.my_orders_command.callback(interaction, historial=True))
+
+@covers("asignar", "completar", "recoger")
+def test_order_transitions(mongo, world):
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "asignar", lambda: pedidos.assign_order_command.callback(interaction, "PEDAAA", str(world.subdito.id)))
+    assert datos.pedidos_col.find_one({"codigo": "PEDAAA"})["asignado_a_id"] in (world.subdito.id, str(world.subdito.id))
+
+    interaction = world.interaction(world.subdito)
+    check_budget(mongo, "completar", lambda: pedidos.complete_order_command.callback(interaction, "PEDAAC"))
+    assert datos.status_name(datos.pedidos_col.find_one({"codigo": "PEDAAC"})["estatus"]) == "LISTO PARA RECOGER"
+
+    interaction = world.interaction(world.cliente)
+    check_budget(mongo, "recoger", lambda: pedidos.pickup_order_command.callback(interaction, "PEDAAE"))
+    assert datos.status_name(datos.pedidos_col.find_one({"codigo": "PEDAAE"})["estatus"]) == "ENTREGADA"
+
+@covers("asignarvarios", "BulkOrderSelect[asignar]", "BulkOrderPageButton", "completarvarios", "BulkOrderSelect[completar]")
+def test_bulk_order_operations(mongo, world, monkeypatch):
+    # 30 pedidos más: la lista ocupa dos páginas y un lote de 25 cuesta lo mismo que uno de 1
+    datos.pedidos_col.insert_many([order_doc(f"LOTE{datos.ORDER_CODE_ALPHABET[n]}{datos.ORDER_CODE_ALPHABET[n + 1]}", 10 + n, "PENDIENTE") for n in range(30)])
+    monkeypatch.setattr(pedidos.bot, "get_user", world.guild.get_member)
+    subdito_id = str(world.subdito.id)
+
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "asignarvarios", lambda: pedidos.bulk_assign_command.callback(interaction, subdito_id))
+    select = interaction.response.view.children[0].item
+    values = [option.value for option in select.options]
+    assert len(values) == 25
+
+    interaction = world.interaction(world.maestro, values)
+    check_budget(mongo, "BulkOrderSelect[asignar]", lambda: pedidos.BulkOrderSelect("asg", 0, subdito_id).callback(interaction))
+    assert datos.pedidos_col.count_documents({"estatus": "A", "asignado_a_id": world.subdito.id}) == 27
+    assert interaction.followup.messages[0].startswith("✅ **25** pedido(s) **ASIGNADOS**")
+    assert len(world.subdito.sent) == 1 # Un único DM con todo el lote
+
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "BulkOrderPageButton", lambda: pedidos.BulkOrderPageButton("cmp", 1).callback(interaction))
+    assert len(interaction.response.view.children[0].item.options) == 9
+
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "completarvarios", lambda: pedidos.bulk_complete_command.callback(interaction))
+    values = [option.value for option in interaction.response.view.children[0].item.options]
+    interaction = world.interaction(world.maestro, values)
+    check_budget(mongo, "BulkOrderSelect[completar]", lambda: pedidos.BulkOrderSelect("cmp", 0).callback(interaction))
+    assert datos.pedidos_col.count_documents({"estatus": "L"}) == 26
+    assert len(world.cliente.sent) == 1
+
+    # Un Subdito no puede operar en lote
+    interaction = world.interaction(world.subdito, values)
+    run_handler(lambda: pedidos.BulkOrderSelect("cmp", 0).callback(interaction))
+    assert interaction.response.messages[0].startswith("🔒")
+
+@covers("BulkOrderSelect[carrera]")
+def test_bulk_order_race(mongo, world, monkeypatch):
+    # Otro Maestro asigna PEDAAA entre la lectura y el bulk_write: ese pedido se salta con una lectura más
+    bulk_write = datos.pedidos_col.bulk_write
+
+    def concurrent_bulk_write(operations, **kwargs):
+        datos.pedidos_col._collection.update_one({"codigo": "PEDAAA"}, {"$set": {"estatus": "A", "asignado_a_id": world.maestro.id}})
+        return bulk_write(operations, **kwargs)
+    monkeypatch.setattr(datos.pedidos_col, "bulk_write", concurrent_bulk_write, raising=False)
+
+    ids = [str(doc["_id"]) for doc in datos.pedidos_col._collection.find({"codigo": {"$in": ["PEDAAA", "PEDAAB"]}})]
+    interaction = world.interaction(world.maestro, ids)
+    check_budget(mongo, "BulkOrderSelect[carrera]", lambda: pedidos.BulkOrderSelect("asg", 0, str(world.subdito.id)).callback(interaction))
+    assert datos.pedidos_col._collection.find_one({"codigo": "PEDAAA"})["asignado_a_id"] == world.maestro.id
+    assert "**PEDAAB**" in interaction.followup.messages[0] and "1 pedido(s) se saltaron" in interaction.followup.messages[0]
+
+# --- INVENTARIO ---
+@covers("inventory_all_autocomplete", "inventory_item_autocomplete", "inventory_stock_autocomplete")
+def test_inventory_autocompletes(mongo, world):
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "inventory_all_autocomplete", lambda: inventario.inventory_all_autocomplete(interaction, ""))
+    check_budget(mongo, "inventory_item_autocomplete", lambda: inventario.inventory_item_autocomplete(interaction, "Gui"))
+    choices = check_budget(mongo, "inventory_stock_autocomplete", lambda: inventario.inventory_stock_autocomplete(interaction, ""))
+    assert "Sal" not in {choice.value for choice in choices}
+
+@covers("inventarioagregar", "inventarioretirar", "verinventario", "setitem", "inventariohistorial")
+def test_inventory_commands(mongo, world):
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "inventarioagregar", lambda: inventario.add_inventory_command.callback(interaction, "Harina", 3))
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "inventarioretirar", lambda: inventario.remove_inventory_command.callback(interaction, "Harina", 2))
+    assert datos.inventario_col.find_one({"name": "Harina"})["quantity"] == 11
+
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "verinventario", lambda: inventario.view_inventory_command.callback(interaction))
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "setitem", lambda: inventario.set_inventory_command.callback(interaction, "Sal", 7))
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "inventariohistorial", lambda: inventario.inventory_history_command.callback(interaction, "Harina"))
+
+# --- ASISTENTE /crearpedido ---
+@covers(
+    "crearpedido", "crearpedido[caché]", "category_select_callback", "type_select_callback", "item_name_select_callback",
+    "level_select_callback", "final_quality_select_callback", "OrderModal",
+)
+def test_order_wizard(mongo, world):
+    user = world.cliente
+    interaction = world.interaction(user)
+    check_budget(mongo, "crearpedido", lambda: asistente.create_order_command.callback(interaction))
+    assert interaction.response.messages
+    check_budget(mongo, "crearpedido[caché]", lambda: asistente.create_order_command.callback(world.interaction(user)))
+
+    check_budget(mongo, "category_select_callback", lambda: asistente.category_select_callback(world.interaction(user, ["Consumible"]), ""))
+    check_budget(mongo, "type_select_callback", lambda: asistente.type_select_callback(world.interaction(user, ["Comida"]), "Consumible"))
+    check_budget(mongo, "item_name_select_callback", lambda: asistente.item_name_select_callback(world.interaction(user, ["COC_07"]), ""))
+    check_budget(mongo, "level_select_callback", lambda: asistente.level_select_callback(world.interaction(user, ["COC_07|III"]), ""))
+
+    interaction = world.interaction(user, ["Rara"])
+    check_budget(mongo, "final_quality_select_callback", lambda: asistente.final_quality_select_callback(interaction, "COC_07|III"))
+    modal = interaction.response.modal
+    assert isinstance(modal, asistente.OrderModal)
+
+    modal.quantity._value = "2"
+    check_budget(mongo, "OrderModal", lambda: modal.on_submit(world.interaction(user)))
+    assert datos.pedidos_col.count_documents({"recipe_id": "COC_07", "quality": "Rara"}) == 1
+
+@covers("WizardPageButton", "WizardLetterSelect", "CatalogFilterModal")
+def test_wizard_list_controls(mongo, world):
+    key = datos.catalog_cache.item_key("Consumible", "Comida")
+    interaction = world.interaction(world.cliente)
+    check_budget(mongo, "WizardPageButton", lambda: asistente.WizardPageButton("item", key, "", 1).callback(interaction))
+    assert "Página 2" in interaction.response.messages[0]
+
+    datos.catalog_cache.invalidate()
+    check_budget(mongo, "WizardLetterSelect", lambda: asistente.WizardLetterSelect("item", key).callback(world.interaction(world.cliente, ["G"])))
+
+    datos.catalog_cache.invalidate()
+
+    async def submit_filter():
+        modal = asistente.CatalogFilterModal("item", key)
+        modal.text._value = "Guiso 1"
+        await modal.on_submit(world.interaction(world.cliente))
+    check_budget(mongo, "CatalogFilterModal", submit_filter)
+
+# --- EXPORTAR Y ADMIN ---
+@covers("exportarpedidos", "ping")
+def test_export_and_ping(mongo, world):
+    interaction = world.interaction(world.maestro)
+    check_budget(mongo, "exportarpedidos", lambda: exportar.export_orders_command.callback(interaction))
+    assert interaction.followup.messages[-1].startswith("✅ Exportados **9**")
+
+    check_budget(mongo, "ping", lambda: admin.ping_command.callback(world.interaction(world.cliente)))